@@ -1,82 +1,161 @@
-from services.data_manager import load_payload, save_data
 import streamlit as st 
 import json
-from services.llm_services import process_email, process_global_query, generate_draft, categorize_email, extract_action_items, generate_auto_reply
-from services.utils import convert_to_relative_format, validate_email
+from services.llm_services import stream_email, stream_global_query, stream_draft, stream_auto_reply
+from services.jobs import enqueue_processing_job, enqueue_reply_job, get_job, retry_job, get_latest_job, cancel_job, start_worker, reply_is_current, ACTIVE_STATUSES, SPECULATIVE_REPLIES_ENABLED
+from services.utils import convert_to_relative_format, validate_email, format_email
+from services.inbox_store import get_inbox_store, ConflictError
+from services.prompt_registry import get_prompt_registry
+from services.telemetry import get_telemetry
+from services.rate_limiter import get_rate_limiter
+from services.classifier import get_classifier_service
+from services.memory import ConversationMemory, load_memory, save_memory, GLOBAL_CONVERSATION
 import time
+import os
 
 # --- Helper Functions ---
 
-def format_email(email: dict) -> str:
+def show_conversation(memory: ConversationMemory) -> None:
+    """Renders a chat: the summary of folded-away messages, then the recent ones."""
+    if memory.summary:
+        st.caption(f"Earlier in this conversation ({memory.folded} messages): {memory.summary}")
+    for msg in memory.messages:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["message"])
+
+def select_email(email: dict) -> None:
+    """Remembers the selected email by id; its current version is always read from the shared store."""
+    st.session_state["selected_email_id"] = email["id"]
+
+def shown_version(email_id) -> int:
+    """The version of an email this session displayed on its previous run, i.e. what the user's edits are based on."""
+    shown = st.session_state.get("shown_version")
+    if shown and shown["id"] == email_id:
+        return shown["version"]
+    return get_inbox_store().version(email_id)
+
+# Number of emails rendered per inbox page. Rerun cost depends on this, not on inbox size.
+INBOX_PAGE_SIZE = int(os.getenv("INBOX_PAGE_SIZE", "25"))
+
+# Seconds between progress checks while a background processing job is running
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+REPLY_FIELDS = ("reply", "reply_prompt", "reply_source")
+
+def save_reply(email: dict, reply: str, source: str, expected_version: int) -> bool:
     """
-    Formats email details into a readable string for the LLM.
-    Includes metadata like sender, timestamp, and the full body.
+    Stores a reply on the email, writing only the reply fields.
+
+    Returns:
+        bool: False (with a warning shown) if another session changed the email since expected_version.
     """
-    return f"Sender's_name : {email['name']}\nSender's email : {email['sender']}\nRecieved at : {email['timestamp']}\nSubject : {email['subject']}\nBody : {email['body']}"
+    store = get_inbox_store()
+    fields = {"reply": reply, "reply_prompt": get_prompt_registry().result_version("reply"), "reply_source": source}
+    try:
+        store.update(email["id"], fields, expected_version=expected_version)
+    except ConflictError:
+        st.warning("This email was changed in another session meanwhile. Check the current draft and save again to overwrite it.")
+        return False
+    return True
 
-def select_email(email: dict) -> None:
-    """Updates the session state with the currently selected email."""
-    st.session_state['selected_email'] = email
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def processing_job_status() -> None:
+    """Shows the progress of this inbox's processing job, re-rendering on its own while it runs."""
+    job_id = st.session_state.get("processing_job_id")
+    job = get_job(job_id) if job_id else None
+    if job is None:
+        return
+
+    if job["status"] in ACTIVE_STATUSES:
+        done = job["completed"] + job["failed"]
+        label = "Queued..." if job["status"] == "queued" else f"Processing emails... {done}/{job['total']}"
+        st.progress(done / job["total"] if job["total"] else 0.0, text=label)
+        if st.button("Cancel processing"):
+            cancel_job(job["id"])
+        return
+
+    # Finished: load the results once, then refresh the whole page to show them
+    if st.session_state.get("applied_job_id") != job["id"]:
+        st.session_state["applied_job_id"] = job["id"]
+        get_inbox_store().apply_job_results(job["id"])
+        st.rerun()
+    if job["status"] == "done":
+        st.success(f"Processed {job['completed']} emails.")
+        return
+    if job["status"] == "failed":
+        st.error(f"Processing stopped after {job['completed']} emails: {job['error']}")
+    else:
+        st.info(f"Processing cancelled after {job['completed']} emails.")
+    if job["completed"] + job["failed"] < job["total"] and st.button("Retry remaining emails"):
+        retried = retry_job(job["id"])
+        st.session_state["processing_job_id"] = retried["id"] if retried else None
+        st.rerun()
 
 # --- Page Config ---
 st.set_page_config(layout="wide", page_title="Email Assistant")
 
 # --- Session State Initialization ---
-# Initialize session state variables if they don't exist.
-# This ensures data persists across Streamlit reruns.
-
-if "emails" not in st.session_state:
-    st.session_state["emails"] = load_payload("mock_inbox.json")
+# The inbox, prompts and drafts are loaded once per server process and shared by all
+# sessions (services/inbox_store.py). The session only keeps its own view state.
+store = get_inbox_store()
+# Emails imported while the app runs are appended to the shared inbox
+store.load_new()
 
-if "prompts" not in st.session_state:
-    st.session_state["prompts"] = load_payload("prompts.json")
-
-if "selected_email" not in st.session_state:
-    st.session_state["selected_email"] = None
-
-if "email_chats" not in st.session_state:
-    st.session_state["email_chats"] = {}
+if "selected_email_id" not in st.session_state:
+    st.session_state["selected_email_id"] = None
 
+# Email chats are stored per email (see services/memory.py) and loaded when opened.
+# The Global Agent conversation lives in the session, bounded the same way.
 if "global_chat" not in st.session_state:
-    st.session_state["global_chat"] = []
+    st.session_state["global_chat"] = ConversationMemory(GLOBAL_CONVERSATION)
 
 if "compose_mode" not in st.session_state:
     st.session_state["compose_mode"] = False
 
-if "drafts" not in st.session_state:
-    st.session_state["drafts"] = load_payload("new_compose.json")
+if "inbox_page" not in st.session_state:
+    st.session_state["inbox_page"] = 0
+
+# Pick up a job that is still running after a page reload, or one started by another session
+if "processing_job_id" not in st.session_state:
+    start_worker()
+    latest_job = get_latest_job()
+    st.session_state["processing_job_id"] = latest_job["id"] if latest_job and latest_job["status"] in ACTIVE_STATUSES else None
 
 # --- Sidebar Navigation ---
 with st.sidebar:
     st.title("📧 Email Assistant")
-    nav_selection = st.radio("**Navigation**", ["Inbox", "Global Agent", "Composed Mails", "Prompt Configuration"])
+    nav_selection = st.radio("**Navigation**", ["Inbox", "Global Agent", "Composed Mails", "Prompt Configuration", "Performance"])
     
     st.divider()
     
     # "Process Emails" button logic (only visible in Inbox view)
     if nav_selection == "Inbox":
+        processing_mode = st.selectbox(
+            "Processing mode",
+            ["Single call per email", "Packed (several emails per call)", "Separate calls"],
+            help="Single-call and packed modes send fewer, larger requests to the LLM.",
+        )
+        reprocess_all = st.checkbox("Reprocess all emails",
+                                    help="By default only new emails and emails processed with older instructions are sent.")
         if st.button("Process Emails", type="primary"):
-            with st.status("Processing Emails...", expanded=True) as status:
-                st.write("Categorizing and extracting actions...")
-                progress_bar = st.progress(0)
-                
-                # Iterate through emails and apply LLM services
-                for ind, email in enumerate(st.session_state["emails"]):
-                    # Use robust functions for categorization and action extraction
-                    tags = categorize_email(format_email(email), st.session_state["prompts"]["categorization"])
-                    action_items = extract_action_items(format_email(email), st.session_state['prompts']['action_extraction'])
-                    
-                    # Update session state with results
-                    st.session_state['emails'][ind]['tags'] = tags
-                    st.session_state['emails'][ind]['action_item'] = action_items
-                    progress_bar.progress((ind + 1) / len(st.session_state["emails"]))
-                
-                status.update(label="Processing Completed!", state="complete", expanded=False)
-            
-            # Persist changes to disk
-            save_data("mock_inbox.json", st.session_state["emails"])
-            time.sleep(1)
-            st.rerun()
+            email_ids = [email["id"] for email in store.emails] if reprocess_all else get_prompt_registry().stale_ids(store.emails)
+            if not email_ids:
+                st.info("All emails are up to date with the current instructions.")
+            else:
+                # The work runs on a background worker; this run only queues it.
+                # If another session already started processing, the emails are added to that job.
+                job = enqueue_processing_job(
+                    email_ids,
+                    store.prompts["categorization"],
+                    store.prompts["action_extraction"],
+                    fused=processing_mode != "Separate calls",
+                    packed=processing_mode.startswith("Packed"),
+                    auto_reply=store.prompts["auto_reply"],
+                )
+                st.session_state["processing_job_id"] = job["id"]
+                if job["merged"]:
+                    st.info("Emails were already being processed; yours were added to that run with the current settings.")
+
+        processing_job_status()
 
 # --- Main Content Area ---
 
@@ -84,11 +163,13 @@ with st.sidebar:
 if nav_selection == "Prompt Configuration":
     st.header("⚙️ Prompt Configuration")
     st.markdown("Customize the instructions for the AI agent below.")
+    # The prompts the user is editing are the ones shown on the previous run
+    prompts_base_version = st.session_state.get("prompts_version", store.prompts_version)
    
     with st.form(key="prompt_form"):
-        category = st.text_area(label="**Categorization Instructions**", value=st.session_state["prompts"]["categorization"], height=200, placeholder="Enter Categorization Prompt eg: Categorize the email into one of the following categories: Meeting, Task, Information, Other.")
-        action = st.text_area(label="**Action Extraction Instructions**", value=st.session_state["prompts"]["action_extraction"], height=200, placeholder="Enter Action Prompt eg: Extract action items from the email with task and deadline.")
-        reply = st.text_area(label="**Auto-reply Instructions**", value=st.session_state["prompts"]["auto_reply"], height=200, placeholder="Enter Auto-reply Prompt eg: Generate an auto-reply for the email with a professional tone.")
+        category = st.text_area(label="**Categorization Instructions**", value=store.prompts["categorization"], height=200, placeholder="Enter Categorization Prompt eg: Categorize the email into one of the following categories: Meeting, Task, Information, Other.")
+        action = st.text_area(label="**Action Extraction Instructions**", value=store.prompts["action_extraction"], height=200, placeholder="Enter Action Prompt eg: Extract action items from the email with task and deadline.")
+        reply = st.text_area(label="**Auto-reply Instructions**", value=store.prompts["auto_reply"], height=200, placeholder="Enter Auto-reply Prompt eg: Generate an auto-reply for the email with a professional tone.")
         
         button_container = st.container()
         with button_container:
@@ -97,11 +178,21 @@ if nav_selection == "Prompt Configuration":
                 submit = st.form_submit_button("Save Prompts", use_container_width=True)
     
     if submit:
-        st.session_state["prompts"]["auto_reply"] = reply
-        st.session_state["prompts"]["categorization"] = category
-        st.session_state['prompts']["action_extraction"] = action
-        save_data("prompts.json", st.session_state["prompts"])
-        st.success("Prompts saved successfully!")
+        reply_changed = reply != store.prompts["auto_reply"]
+        try:
+            store.save_prompts({**store.prompts, "categorization": category, "action_extraction": action, "auto_reply": reply},
+                               expected_version=prompts_base_version)
+        except ConflictError:
+            st.warning("The prompts were changed in another session meanwhile. Review the current ones and save again.")
+        else:
+            # Pre-generated replies written with the old instructions are now stale; redraft them
+            if reply_changed and SPECULATIVE_REPLIES_ENABLED:
+                enqueue_reply_job([email["id"] for email in store.emails], reply)
+            st.success("Prompts saved successfully!")
+            stale = len(get_prompt_registry().stale_ids(store.emails))
+            if stale:
+                st.info(f"{stale} emails are not up to date with these instructions; \"Process Emails\" will update just those.")
+    st.session_state["prompts_version"] = store.prompts_version
 
 # 2. Inbox View
 if nav_selection == "Inbox":
@@ -133,9 +224,9 @@ if nav_selection == "Inbox":
             if generate_submitted:
                 if recipient_email and new_subject and new_prompt:
                     if validate_email(recipient_email):
-                        with st.spinner("Drafting..."):
-                            draft_body = generate_draft(new_prompt, recipient_name, recipient_email, new_subject)
-                            st.session_state["new_draft_body"] = draft_body
+                        # Show the draft as it is generated, then keep the full text for the editor
+                        draft_body = st.write_stream(stream_draft(new_prompt, recipient_name, recipient_email, new_subject))
+                        st.session_state["new_draft_body"] = draft_body
                     else:
                         st.warning("Please provide a valid email address!")
                 else:
@@ -154,8 +245,7 @@ if nav_selection == "Inbox":
                         "body": final_body,
                         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
                     }
-                    st.session_state["drafts"].append(new_draft)
-                    save_data("new_compose.json", st.session_state["drafts"])
+                    store.add_draft(new_draft)
                     st.success("Draft saved.")
                     time.sleep(2)
                     st.session_state["compose_mode"] = False
@@ -174,22 +264,40 @@ if nav_selection == "Inbox":
     # --- Email List Column ---
     with left_col:
         # Filter controls
-        show_unread = st.checkbox("Show Unread Only")
+        filter_col, size_col = st.columns([0.6, 0.4])
+        with filter_col:
+            show_unread = st.checkbox("Show Unread Only", on_change=lambda: st.session_state.update(inbox_page=0))
+        with size_col:
+            page_size_options = sorted({10, 25, 50, 100, INBOX_PAGE_SIZE})
+            page_size = st.selectbox("Per page", page_size_options, index=page_size_options.index(INBOX_PAGE_SIZE),
+                                     label_visibility="collapsed", on_change=lambda: st.session_state.update(inbox_page=0))
+        inbox_index = store.index
+        tag_filter = st.multiselect("Tags", inbox_index.tags(), placeholder="Filter by tag",
+                                    label_visibility="collapsed", on_change=lambda: st.session_state.update(inbox_page=0))
+        
+        # Filters are index lookups; only the current page of row view models is rendered
+        rows = store.rows
+        if show_unread or tag_filter:
+            matching_ids = inbox_index.query(unread=True if show_unread else None, tags=tag_filter or None)
+            filtered_rows = [rows[position] for position in inbox_index.positions(matching_ids)]
+        else:
+            filtered_rows = rows
+        page_count = max(1, -(-len(filtered_rows) // page_size))
+        page = min(st.session_state["inbox_page"], page_count - 1)
+        page_rows = filtered_rows[page * page_size:(page + 1) * page_size]
         
         with st.container(height=600):
-            # Apply filters
-            filtered_emails = [e for e in st.session_state["emails"] if not e.get("is_read")] if show_unread else st.session_state["emails"]
-            
-            if not filtered_emails:
+            if not filtered_rows:
                 st.info("No unread emails found." if show_unread else "No emails found.")
                 
-            for email in filtered_emails:
-                is_selected = (st.session_state["selected_email"] and st.session_state["selected_email"]['id'] == email['id'])
+            for row in page_rows:
+                email = store.emails[row["index"]]
+                is_selected = st.session_state["selected_email_id"] == row['id']
                 
                 # Auto-mark as read if selected
-                if is_selected and not email.get('is_read'):
-                    email['is_read'] = True
-                    save_data("mock_inbox.json", st.session_state["emails"])
+                if is_selected and not row["is_read"]:
+                    email = store.update(email["id"], {"is_read": True})
+                    row = store.rows[row["index"]]
 
                 # Visual styling for selected/unread emails
                 card_border = True
@@ -198,21 +306,35 @@ if nav_selection == "Inbox":
                     c1, c2 = st.columns([0.8, 0.2])
                     with c1:
                         # Bold sender name if unread
-                        sender_style = "**" if not email.get('is_read') else ""
-                        st.markdown(f"{sender_style}{email['name']}{sender_style}")
-                        st.caption(email['subject'])
-                        if email.get("tags"):
-                            st.caption(f"🏷️ {', '.join(email['tags'])}")
+                        sender_style = "**" if not row["is_read"] else ""
+                        st.markdown(f"{sender_style}{row['name']}{sender_style}")
+                        st.caption(row['subject'])
+                        if row["tags"]:
+                            st.caption(f"🏷️ {row['tags']}")
                     with c2:
-                        if st.button("Open", key=f"open_{email['id']}", type="primary" if is_selected else "secondary"):
+                        if st.button("Open", key=f"open_{row['id']}", type="primary" if is_selected else "secondary"):
                             select_email(email)
                             st.rerun()
+        
+        # Pagination controls
+        prev_col, page_col, next_col = st.columns([0.25, 0.5, 0.25])
+        with prev_col:
+            if st.button("◀ Prev", disabled=page == 0, use_container_width=True):
+                st.session_state["inbox_page"] = page - 1
+                st.rerun()
+        with page_col:
+            st.caption(f"Page {page + 1} of {page_count} · {len(filtered_rows)} emails")
+        with next_col:
+            if st.button("Next ▶", disabled=page >= page_count - 1, use_container_width=True):
+                st.session_state["inbox_page"] = page + 1
+                st.rerun()
 
     # --- Details / Chat Column ---
     with right_col:
         st.space(33) # Spacer to align with list
-        if st.session_state["selected_email"]:
-            email = st.session_state["selected_email"]
+        email = store.get(st.session_state["selected_email_id"]) if st.session_state["selected_email_id"] is not None else None
+        if email:
+            email = store.ensure_bodies([email])[0]
             
             # Initialize chat view state
             if "chat_view_active" not in st.session_state:
@@ -244,27 +366,21 @@ if nav_selection == "Inbox":
 
                 # --- Chat View ---
                 if st.session_state["chat_view_active"]:
-                    chat_key = email["id"]
-                    if chat_key not in st.session_state["email_chats"]:
-                        st.session_state["email_chats"][chat_key] = []
+                    memory = load_memory(email["id"])
                     
                     chat_container = st.container()
                     with chat_container:
-                        for msg in st.session_state["email_chats"][chat_key]:
-                            with st.chat_message(msg["role"]):
-                                st.markdown(msg["message"])
+                        show_conversation(memory)
                     
                     if prompt := st.chat_input("Ask about this email..."):
-                        st.session_state["email_chats"][chat_key].append({"role": "user", "message": prompt})
                         with chat_container:
                             with st.chat_message("user"):
                                 st.markdown(prompt)
                             
                             with st.chat_message("assistant"):
-                                with st.spinner("Thinking..."):
-                                    response = process_email(format_email(email), prompt)
-                                    st.markdown(response)
-                        st.session_state["email_chats"][chat_key].append({"role": "assistant", "message": response})
+                                # The stream adds the exchange to the memory once the answer is complete
+                                st.write_stream(stream_email(format_email(email), prompt, memory=memory))
+                        save_memory(memory)
                         st.rerun()
 
                 # --- Details View ---
@@ -281,37 +397,62 @@ if nav_selection == "Inbox":
                         deadline = action_items.get("deadline", "No Deadline")
                         st.info(f"**Task:** {task}\n\n**Due:** {deadline}")
 
+                    # Results copied from another email of the same thread / near-duplicate group
+                    if email.get("cluster_of") and not email.get("cluster_exempt"):
+                        st.caption("Tags were taken from a similar email in the same conversation.")
+                        if st.button("Process this email on its own"):
+                            store.update(email["id"], {"cluster_exempt": True})
+                            job = enqueue_processing_job(
+                                [email["id"]],
+                                store.prompts["categorization"],
+                                store.prompts["action_extraction"],
+                                auto_reply=store.prompts["auto_reply"],
+                            )
+                            st.session_state["processing_job_id"] = job["id"]
+                            st.rerun()
+
                     # Reply Generation Section
+                    # Pick up a reply drafted in the background since the email was loaded
+                    if not email.get("reply"):
+                        store.reload([email["id"]], REPLY_FIELDS)
+                        email = store.get(email["id"])
+                    has_reply = reply_is_current(email, store.prompts["auto_reply"])
+                    pregenerated = has_reply and email.get("reply_source") == "speculative"
+                    opened = st.session_state.setdefault("opened_replies", set())
                     col1, col2, col3 = st.columns([1, 2, 1])
                     with col2:
-                        if st.button("Generate Reply", use_container_width=True):
-                            with st.spinner("Generating..."):
-                                reply_draft = generate_auto_reply(format_email(email), st.session_state["prompts"]["auto_reply"])
-                                email['reply'] = reply_draft
-                                save_data("mock_inbox.json", st.session_state["emails"])
+                        generate_reply = st.button("Generate Reply", use_container_width=True)
+                    if generate_reply and pregenerated and email["id"] not in opened:
+                        # Drafted in the background already: just show it
+                        opened.add(email["id"])
+                    elif generate_reply:
+                        # Stream the reply into the details view; persist it once complete
+                        base_version = store.version(email["id"])
+                        reply_draft = st.write_stream(stream_auto_reply(format_email(email), store.prompts["auto_reply"], email.get("tags")))
+                        if save_reply(email, reply_draft, "generated", base_version):
+                            opened.add(email["id"])
                             st.rerun()
                     
-                    # Draft Editor
-                    if email.get("reply"):
-                        with st.expander(label="Draft Reply", expanded=False):
+                    # Draft Editor (a background draft made with older instructions is not shown)
+                    if has_reply:
+                        with st.expander(label="Draft Reply", expanded=email["id"] in opened):
                             with st.form(key=f"edit_reply_form_{email['id']}"):
                                 edited_reply = st.text_area(label="", value=email["reply"], height=150)
                                 save_draft_btn = st.form_submit_button("Save Draft")
                                 
-                            if save_draft_btn:
-                                email["reply"] = edited_reply
-                                save_data("mock_inbox.json", st.session_state["emails"])
+                            if save_draft_btn and save_reply(email, edited_reply, "edited", shown_version(email["id"])):
                                 st.success("Draft saved.")
+            st.session_state["shown_version"] = {"id": email["id"], "version": store.version(email["id"])}
         else:
             st.info("Select an email to view details.")
 
 # 3. Composed Mails View
 elif nav_selection == "Composed Mails":
     st.header("📂 Composed Mails")
-    if not st.session_state["drafts"]:
+    if not store.drafts:
         st.info("No drafts found.")
     else:
-        for i, draft in enumerate(st.session_state["drafts"]):
+        for i, draft in enumerate(store.drafts):
             with st.container(border=True):
                 st.subheader(f"To: {draft.get('recipient', 'Unknown')}")
                 st.caption(f"Subject: {draft.get('subject', 'No Subject')} | {draft.get('timestamp', '')}")
@@ -324,21 +465,49 @@ elif nav_selection == "Global Agent":
     
     global_chat_container = st.container()
     with global_chat_container:
-        for msg in st.session_state["global_chat"]:
-            with st.chat_message(msg["role"]):
-                st.markdown(msg["message"])
+        show_conversation(st.session_state["global_chat"])
             
     if prompt := st.chat_input("Ask Global Agent..."):
-        st.session_state["global_chat"].append({"role": "user", "message": prompt})
         with global_chat_container:
             with st.chat_message("user"):
                 st.markdown(prompt)
             
             with st.chat_message("assistant"):
-                with st.spinner("Analyzing Inbox..."):
-                    # Pass the last 3 messages as context to the LLM
-                    chat_history = st.session_state["global_chat"][-3:] if len(st.session_state["global_chat"]) > 0 else []
-                    response = process_global_query(st.session_state["emails"], prompt, chat_history)
-                    st.markdown(response)
-        st.session_state["global_chat"].append({"role": "assistant", "message": response})
+                # Recent messages and a summary of older ones are sent as context; only the
+                # emails picked for the answer have their bodies loaded. Whole-inbox questions
+                # work from per-email digests: missing ones are generated for the emails the
+                # question is narrowed to, and persisted so later questions (from any session) reuse them.
+                st.write_stream(stream_global_query(store.emails, prompt, memory=st.session_state["global_chat"],
+                                                    index=store.index, load_records=store.fetch,
+                                                    save_digests=store.update_many))
         st.rerun()
+
+# 5. Performance View
+elif nav_selection == "Performance":
+    st.header("📈 Performance")
+    st.markdown("LLM calls made by this server process: latency, time to first token, tokens and parse failures.")
+
+    summary = get_telemetry().summary()
+    if not summary:
+        st.info("No LLM calls recorded yet.")
+    else:
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Calls", sum(row["calls"] for row in summary))
+        col2.metric("Cache hits", sum(row["cached"] for row in summary))
+        col3.metric("Errors", sum(row["errors"] for row in summary))
+        col4.metric("Tokens", sum(row["prompt_tokens"] + row["completion_tokens"] for row in summary))
+        st.subheader("By operation")
+        st.dataframe(summary, use_container_width=True)
+        st.subheader("Recent calls")
+        st.dataframe(get_telemetry().recent(50), use_container_width=True)
+
+    st.subheader("Routing and repairs")
+    st.caption("Which model writing requests went to, how often a small-model answer was escalated, "
+               "and how often an invalid structured answer was repaired instead of reprocessed.")
+    st.dataframe(get_telemetry().events(), use_container_width=True)
+
+    st.subheader("Rate limits")
+    st.json(get_rate_limiter().status())
+
+    st.subheader("Local classifier")
+    st.json(get_classifier_service().stats())
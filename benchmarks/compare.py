@@ -0,0 +1,51 @@
+import argparse
+import json
+import sys
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {(result["suite"], result["case"], result["size"]): result for result in data["results"]}
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> list:
+    """
+    Lists the cases whose throughput dropped or p99 latency grew by more than `threshold`
+    (a fraction, e.g. 0.1 for 10%), as (key, metric, before, after) tuples.
+    """
+    regressions = []
+    for key in sorted(baseline.keys() & candidate.keys(), key=str):
+        before, after = baseline[key], candidate[key]
+        if before.get("throughput") and after.get("throughput") is not None:
+            if after["throughput"] < before["throughput"] * (1 - threshold):
+                regressions.append((key, "throughput", before["throughput"], after["throughput"]))
+        if before.get("p99_ms") and after.get("p99_ms") is not None:
+            if after["p99_ms"] > before["p99_ms"] * (1 + threshold):
+                regressions.append((key, "p99_ms", before["p99_ms"], after["p99_ms"]))
+    return regressions
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown (default 0.1)")
+    args = parser.parse_args(argv)
+
+    baseline, candidate = _load(args.baseline), _load(args.candidate)
+    for key in sorted(baseline.keys() & candidate.keys(), key=str):
+        before, after = baseline[key], candidate[key]
+        ratio = (after["throughput"] or 0) / before["throughput"] if before.get("throughput") else float("nan")
+        print(f"{key[0]:<8} {key[1]:<34} n={key[2]:<7} throughput x{ratio:6.2f}  "
+              f"p99 {before['p99_ms']:>9.3f} -> {after['p99_ms']:>9.3f}ms  "
+              f"peak {before['peak_mb']:>8.2f} -> {after['peak_mb']:>8.2f}MB")
+
+    regressions = compare(baseline, candidate, args.threshold)
+    for (suite, case, size), metric, before, after in regressions:
+        print(f"REGRESSION {suite}/{case} n={size}: {metric} {before} -> {after}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import json
+import random
+import re
+import threading
+import time
+import zlib
+
+from services.utils import estimate_tokens
+
+
+TAGS = ["Important", "Newsletter", "Spam", "To-Do"]
+
+_PACKED_ID = re.compile(r"=== EMAIL ID: (\S+) ===")
+
+
+class FakeLLMError(RuntimeError):
+    """Raised by FakeChatModel for injected failures, with an HTTP-like status code."""
+
+    def __init__(self, message: str, status_code: int = 503):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FakeMessage:
+    """The parts of a LangChain message the services read."""
+
+    def __init__(self, content: str, response_metadata: dict = None):
+        self.content = content
+        self.response_metadata = response_metadata or {}
+
+
+def _pick_tags(text: str) -> list:
+    """Chooses one or two tags deterministically from the text."""
+    digest = zlib.crc32(text.encode("utf-8"))
+    tags = [TAGS[digest % len(TAGS)]]
+    if digest % 5 == 0:
+        tags.append("To-Do" if tags[0] != "To-Do" else "Important")
+    return tags
+
+
+def _action_item(text: str) -> dict:
+    if zlib.crc32(text.encode("utf-8")) % 3:
+        return {"task": "None", "deadline": "None"}
+    return {"task": "Reply to the sender about the request", "deadline": "Friday"}
+
+
+def fake_completion(prompt: str) -> str:
+    """
+    Produces a plausible, deterministic answer for any of our prompt templates.
+
+    The prompt type is recognized from its fixed section headers, and the answer
+    depends only on the prompt text, so repeated runs give identical output.
+    """
+    if "=== EMAIL ID:" in prompt:
+        # Packed request: answer every email by id
+        answers = {}
+        for email_id in _PACKED_ID.findall(prompt):
+            answers[email_id] = {"tags": _pick_tags(email_id), "action_item": _action_item(email_id)}
+        return json.dumps(answers)
+    if "### JSON OUTPUT:" in prompt and '"tags"' in prompt:
+        return json.dumps({"tags": _pick_tags(prompt), "action_item": _action_item(prompt)})
+    if "### JSON OUTPUT:" in prompt:
+        return json.dumps(_action_item(prompt))
+    if "comma-separated list of tags" in prompt:
+        return ", ".join(_pick_tags(prompt))
+    if "### SUMMARY:" in prompt:
+        return "A colleague writes about a pending request and asks for a reply by Friday."
+    if "### NOTES:" in prompt:
+        return "\n".join(f"- note {ind}: sender asks for an update" for ind in range(8))
+    # Free-form answers (chat, replies, drafts, global questions)
+    return " ".join(["This is a synthetic answer used for offline benchmarking."] * 6)
+
+
+class FakeChatModel:
+    """
+    Offline stand-in for ChatGroq with configurable speed and reliability.
+
+    Each call waits `latency` seconds (time to first token) plus one second per
+    `token_rate` completion tokens, fails with probability `failure_rate` (raising
+    FakeLLMError with `failure_status`, so 429/5xx exercise the retry path) and
+    returns unparseable text with probability `malformed_rate`. Randomness comes
+    from a seeded generator, so runs are reproducible.
+
+    Every call's timing is appended to `calls` as (seconds, ttft_seconds, ok).
+    """
+
+    def __init__(self, model: str, temperature: float, latency: float = 0.05, token_rate: float = 800.0,
+                 failure_rate: float = 0.0, failure_status: int = 503, malformed_rate: float = 0.0, seed: int = 0):
+        self.model_name = model
+        self.temperature = temperature
+        self.latency = latency
+        self.token_rate = token_rate
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.malformed_rate = malformed_rate
+        self.calls = []
+        self._rng = random.Random(f"{seed}:{model}:{temperature}")
+        self._lock = threading.Lock()
+
+    def _draw(self) -> tuple:
+        with self._lock:
+            return self._rng.random() < self.failure_rate, self._rng.random() < self.malformed_rate
+
+    def _answer(self, prompt) -> tuple:
+        prompt = str(prompt)
+        fail, malformed = self._draw()
+        content = "Sorry, I can't help with that." if malformed else fake_completion(prompt)
+        metadata = {
+            "model_name": self.model_name,
+            "token_usage": {
+                "prompt_tokens": estimate_tokens(prompt),
+                "completion_tokens": estimate_tokens(content),
+                "total_tokens": estimate_tokens(prompt) + estimate_tokens(content),
+            },
+        }
+        return fail, content, metadata
+
+    def _record(self, started: float, ttft: float, ok: bool) -> None:
+        with self._lock:
+            self.calls.append((time.perf_counter() - started, ttft, ok))
+
+    def invoke(self, prompt) -> FakeMessage:
+        started = time.perf_counter()
+        fail, content, metadata = self._answer(prompt)
+        time.sleep(self.latency)
+        if fail:
+            self._record(started, self.latency, False)
+            raise FakeLLMError("injected failure", self.failure_status)
+        time.sleep(metadata["token_usage"]["completion_tokens"] / self.token_rate)
+        self._record(started, self.latency, True)
+        return FakeMessage(content, metadata)
+
+    def stream(self, prompt):
+        started = time.perf_counter()
+        fail, content, metadata = self._answer(prompt)
+        time.sleep(self.latency)
+        if fail:
+            self._record(started, self.latency, False)
+            raise FakeLLMError("injected failure", self.failure_status)
+        ttft = time.perf_counter() - started
+        words = content.split(" ")
+        for ind in range(0, len(words), 8):
+            piece = " ".join(words[ind:ind + 8]) + (" " if ind + 8 < len(words) else "")
+            time.sleep(estimate_tokens(piece) / self.token_rate)
+            yield FakeMessage(piece)
+        # Like Groq, usage arrives on the final chunk
+        yield FakeMessage("", metadata)
+        self._record(started, ttft, True)
+
+
+class FakeLLMFactory:
+    """
+    Builds FakeChatModels for services.llm_client.set_llm_factory and keeps
+    track of them, so a benchmark can collect every call's timings afterwards.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.models = []
+
+    def __call__(self, model: str, temperature: float) -> FakeChatModel:
+        llm = FakeChatModel(model, temperature, **self.options)
+        self.models.append(llm)
+        return llm
+
+    def calls(self) -> list:
+        return [call for llm in self.models for call in llm.calls]
+
+    def reset_calls(self) -> None:
+        for llm in self.models:
+            with llm._lock:
+                llm.calls.clear()
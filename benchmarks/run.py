@@ -0,0 +1,272 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Benchmarks never touch the real data directory, the LLM cache or the classifier;
+# this has to happen before the services modules read their configuration.
+os.environ.setdefault("EMAIL_ASSISTANT_DATA_DIR", tempfile.mkdtemp(prefix="email-assistant-bench-"))
+os.environ["LLM_CACHE_ENABLED"] = "0"
+os.environ["LOCAL_CLASSIFIER_ENABLED"] = "0"
+# Retries of injected failures shouldn't dominate the timings
+os.environ.setdefault("LLM_BACKOFF_BASE_SECONDS", "0.05")
+
+from benchmarks.fake_llm import FakeLLMFactory
+from benchmarks.synthetic import make_inbox, make_llm_outputs
+from services import data_manager
+from services.llm_client import set_llm_factory
+from services.rate_limiter import get_rate_limiter
+from services.llm_services import process_emails_batch, process_global_query, DEFAULT_MAX_CONCURRENCY
+from services.utils import parse_json_output, parse_list_output
+from services.schemas import validate_action_output
+
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+SUITES = ("parsers", "storage", "bulk", "global")
+
+GLOBAL_QUERIES = [
+    "Do I have any meetings this week?",
+    "What did HDFC Bank send me?",
+    "Which emails ask me to review a report?",
+    "Is there anything from HR about leave?",
+    "Any pull requests assigned to me?",
+]
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile (q in 0-100); 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def measure(fn):
+    """
+    Runs fn once and returns (its result, wall seconds, peak traced Python memory in MB).
+
+    tracemalloc adds overhead to allocation-heavy code, but it does so equally on
+    every commit, so numbers stay comparable between runs of this harness.
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        value = fn()
+    finally:
+        seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return value, seconds, peak / 2 ** 20
+
+
+def _result(suite: str, case: str, size: int, seconds: float, items: int, latencies: list, peak_mb: float, **extra) -> dict:
+    return {
+        "suite": suite,
+        "case": case,
+        "size": size,
+        "seconds": round(seconds, 4),
+        "throughput": round(items / seconds, 2) if seconds else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "peak_mb": round(peak_mb, 2),
+        **extra,
+    }
+
+
+def bench_parsers(size: int, args) -> list:
+    outputs = make_llm_outputs(size, args.seed)
+    results = []
+    for name, kind, parser in (("parse_json_output", "json", parse_json_output), ("parse_list_output", "list", parse_list_output),
+                               ("validate_action_output", "json", validate_action_output)):
+        texts = [text for text_kind, text in outputs if text_kind == kind]
+
+        def run():
+            latencies = []
+            for text in texts:
+                started = time.perf_counter()
+                parser(text)
+                latencies.append(time.perf_counter() - started)
+            return latencies
+
+        latencies, seconds, peak = measure(run)
+        results.append(_result("parsers", name, size, seconds, len(texts), latencies, peak))
+    return results
+
+
+def bench_storage(size: int, args) -> list:
+    inbox = make_inbox(size, args.seed)
+    results = []
+
+    _, seconds, peak = measure(lambda: data_manager.save_data("mock_inbox.json", inbox))
+    results.append(_result("storage", "save_data", size, seconds, size, [seconds], peak))
+
+    for name, loader in (("load_payload", data_manager.load_payload), ("load_metadata", data_manager.load_metadata)):
+        _, seconds, peak = measure(lambda: loader("mock_inbox.json"))
+        results.append(_result("storage", name, size, seconds, size, [seconds], peak))
+
+    # Single-record writes, as done when an email is marked read
+    samples = inbox[:: max(1, size // 200)][:200]
+
+    def upserts():
+        latencies = []
+        for email in samples:
+            email = dict(email, is_read=True)
+            started = time.perf_counter()
+            data_manager.upsert_record("mock_inbox.json", email)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    latencies, seconds, peak = measure(upserts)
+    results.append(_result("storage", "upsert_record", size, seconds, len(samples), latencies, peak))
+    return results
+
+
+def _llm_extra(factory: FakeLLMFactory) -> dict:
+    calls = factory.calls()
+    return {
+        "llm_calls": len(calls),
+        "llm_failures": sum(1 for _, _, ok in calls if not ok),
+        "llm_p50_ms": round(percentile([seconds for seconds, _, _ in calls], 50) * 1000, 3),
+        "llm_p99_ms": round(percentile([seconds for seconds, _, _ in calls], 99) * 1000, 3),
+    }
+
+
+def bench_bulk(size: int, args, factory: FakeLLMFactory) -> list:
+    inbox = make_inbox(size, args.seed, args.duplicate_rate)
+    results = []
+    for mode in args.modes:
+        factory.reset_calls()
+        error = None
+
+        def run():
+            return process_emails_batch(
+                inbox, "Categorize into Important, Newsletter, Spam, To-Do.", "Extract tasks and deadlines.",
+                max_concurrency=args.concurrency, fused=mode != "separate", packed=mode == "packed",
+                local_classifier=False, cluster=mode == "clustered",
+            )
+
+        try:
+            _, seconds, peak = measure(run)
+        except Exception as e:
+            # Failures that survive the retries abort the batch
+            error, seconds, peak = str(e), 0.0, 0.0
+        latencies = [seconds for seconds, _, _ in factory.calls()]
+        results.append(_result("bulk", f"process_emails_batch[{mode}]", size, seconds, size if error is None else 0,
+                               latencies, peak, error=error, **_llm_extra(factory)))
+    return results
+
+
+def bench_global(size: int, args, factory: FakeLLMFactory) -> list:
+    inbox = make_inbox(size, args.seed)
+    factory.reset_calls()
+
+    def run():
+        latencies, errors = [], 0
+        for query in GLOBAL_QUERIES:
+            started = time.perf_counter()
+            try:
+                process_global_query(inbox, query, mode="retrieval")
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+        return latencies, errors
+
+    (latencies, errors), seconds, peak = measure(run)
+    # The first question also builds the retrieval and filter indexes for this inbox
+    return [_result("global", "process_global_query", size, seconds, len(GLOBAL_QUERIES), latencies, peak,
+                    first_query_ms=round(latencies[0] * 1000, 3), errors=errors, **_llm_extra(factory))]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks with a fake LLM backend.")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="synthetic inbox sizes")
+    parser.add_argument("--llm-max-size", type=int, default=10000,
+                        help="largest inbox used for the suites that call the (fake) LLM")
+    parser.add_argument("--modes", default="fused,packed,separate,clustered",
+                        help="bulk processing modes (clustered = fused, once per thread/near-duplicate group)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0,
+                        help="share of synthetic emails that are thread replies or near-duplicates (bulk suite)")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake LLM time to first token, seconds")
+    parser.add_argument("--token-rate", type=float, default=800.0, help="fake LLM output tokens per second")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of fake LLM calls that raise")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of fake LLM answers that don't parse")
+    parser.add_argument("--failure-status", type=int, default=503,
+                        help="HTTP status of injected failures (429 and 5xx are retried, others abort)")
+    parser.add_argument("--rate-limits", help='per-model quotas as JSON, e.g. {"llama-3.1-8b-instant": {"rpm": 600, "tpm": 200000}}')
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<time>_<commit>.json)")
+    args = parser.parse_args(argv)
+    args.modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+
+    suites = [suite.strip() for suite in args.suites.split(",") if suite.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    # The fake backend has no quota; the scheduler only runs when --rate-limits is given
+    limiter = get_rate_limiter()
+    limiter.enabled = bool(args.rate_limits)
+    if args.rate_limits:
+        limiter.limits = {**limiter.limits, **json.loads(args.rate_limits)}
+
+    factory = FakeLLMFactory(latency=args.latency, token_rate=args.token_rate, failure_rate=args.failure_rate,
+                             failure_status=args.failure_status, malformed_rate=args.malformed_rate, seed=args.seed)
+    set_llm_factory(factory)
+
+    results = []
+    for size in sizes:
+        for suite in suites:
+            if suite in ("bulk", "global") and size > args.llm_max_size:
+                continue
+            if suite == "parsers":
+                batch = bench_parsers(size, args)
+            elif suite == "storage":
+                batch = bench_storage(size, args)
+            elif suite == "bulk":
+                batch = bench_bulk(size, args, factory)
+            else:
+                batch = bench_global(size, args, factory)
+            for result in batch:
+                print(f"{result['suite']:<8} {result['case']:<34} n={result['size']:<7} "
+                      f"{result['seconds']:>9.3f}s  {result['throughput'] or 0:>12.1f}/s  "
+                      f"p50 {result['p50_ms']:>9.3f}ms  p99 {result['p99_ms']:>9.3f}ms  peak {result['peak_mb']:>8.2f}MB",
+                      flush=True)
+            results.extend(batch)
+
+    commit = _git_commit()
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}_{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    meta = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {key: value for key, value in vars(args).items() if key != "output"},
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import random
+from datetime import datetime, timedelta
+
+from services.inbox_index import TIMESTAMP_FORMAT
+
+
+_SENDERS = [
+    ("HDFC Bank", "alerts@hdfcbank.net"),
+    ("Medium Daily Digest", "noreply@medium.com"),
+    ("HR Team", "hr@techsolutions.in"),
+    ("Project Manager", "project.manager@techsolutions.in"),
+    ("Zomato", "zomato@food.com"),
+    ("Dr. Mbogo", "dr.mbogo@trustfund.ng"),
+    ("Priya Sharma", "priya.sharma@gmail.com"),
+    ("GitHub", "notifications@github.com"),
+]
+
+_SUBJECTS = [
+    "Your account was debited", "Top stories for you this week", "Updated leave policy",
+    "Please review the Q3 report", "Your order is on its way", "Urgent inheritance claim",
+    "Dinner this weekend?", "New pull request assigned to you", "Meeting request: sprint planning",
+]
+
+_WORDS = (
+    "please review the attached report and share your feedback before the deadline "
+    "we are pleased to inform you about the latest update to your account the meeting "
+    "has been moved to thursday kindly confirm your availability this offer expires soon "
+    "click the link to claim your reward the quarterly numbers look strong thanks regards"
+).split()
+
+
+def make_email(ind: int, rng: random.Random, now: datetime) -> dict:
+    name, sender = rng.choice(_SENDERS)
+    # Bodies of roughly 40-400 words, like typical mail
+    body = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(40, 400)))
+    return {
+        "id": f"bench_{ind}",
+        "sender": sender,
+        "name": name,
+        "subject": f"{rng.choice(_SUBJECTS)} #{ind}",
+        "body": body,
+        "timestamp": (now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))).strftime(TIMESTAMP_FORMAT),
+        "is_read": rng.random() < 0.6,
+    }
+
+
+def make_duplicate(ind: int, original: dict, rng: random.Random, now: datetime) -> dict:
+    """A reply in the original's thread, or a re-send of it with a few numbers changed."""
+    email = dict(original, id=f"bench_{ind}", is_read=rng.random() < 0.6,
+                 timestamp=(now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))).strftime(TIMESTAMP_FORMAT))
+    if rng.random() < 0.5:
+        email["subject"] = "Re: " + original["subject"]
+        email["body"] = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(20, 120)))
+    else:
+        email["body"] = f"{original['body']} ref {rng.randint(1000, 9999)}"
+    return email
+
+
+def make_inbox(size: int, seed: int = 0, duplicate_rate: float = 0.0) -> list:
+    """
+    Generates a reproducible inbox of `size` emails in the mock_inbox.json schema.
+
+    With duplicate_rate > 0, that share of the emails are thread replies or
+    near-identical re-sends of earlier ones (see services/clustering.py).
+    """
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1, 12, 0, 0)
+    emails = []
+    for ind in range(size):
+        if duplicate_rate and emails and rng.random() < duplicate_rate:
+            emails.append(make_duplicate(ind, rng.choice(emails), rng, now))
+        else:
+            emails.append(make_email(ind, rng, now))
+    return emails
+
+
+def make_llm_outputs(count: int, seed: int = 0) -> list:
+    """
+    Generates LLM-style answers for the parser benchmarks: clean JSON, JSON in
+    code fences or surrounded by chatter, broken JSON, and tag lists.
+    """
+    rng = random.Random(seed)
+    outputs = []
+    for ind in range(count):
+        kind = ind % 5
+        payload = '{"task": "Submit the report #%d", "deadline": "Friday"}' % ind
+        if kind == 0:
+            outputs.append(("json", payload))
+        elif kind == 1:
+            outputs.append(("json", f"```json\n{payload}\n```"))
+        elif kind == 2:
+            outputs.append(("json", f"Sure! Here is the result:\n{payload}\nLet me know if you need more."))
+        elif kind == 3:
+            outputs.append(("json", payload[:rng.randint(5, len(payload) - 5)]))
+        else:
+            outputs.append(("list", ", ".join(rng.sample(["Important", "Newsletter", "Spam", "To-Do"], rng.randint(1, 3)))))
+    return outputs
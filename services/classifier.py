@@ -0,0 +1,377 @@
+import argparse
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from services.data_manager import BASE_DIR, iter_payload, load_payload, save_data
+from services.inbox_index import sender_domain
+from services.prompt_registry import get_prompt_registry
+from services.retrieval import tokenize
+
+
+MODEL_PATH = BASE_DIR / "classifier.npz"
+STATS_FILE = "classifier_stats.json"
+
+# Set to 0 to send every email to the LLM for categorization
+CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "1") == "1"
+
+# An email is tagged locally only if every tag decision is at least this certain
+CONFIDENCE_THRESHOLD = float(os.getenv("CLASSIFIER_CONFIDENCE_THRESHOLD", "0.95"))
+
+# Retrain once this many new LLM-tagged emails have come in since the last training
+RETRAIN_EVERY = int(os.getenv("CLASSIFIER_RETRAIN_EVERY", "200"))
+
+# No model is trained (and everything goes to the LLM) until there are this many LLM-tagged emails
+MIN_TRAINING_EMAILS = int(os.getenv("CLASSIFIER_MIN_TRAINING_EMAILS", "50"))
+
+# Share of confident emails still sent to the LLM, to measure agreement with it
+AUDIT_RATE = float(os.getenv("CLASSIFIER_AUDIT_RATE", "0.05"))
+
+# Size of the hashed feature space; collisions are rare enough at 2**18 for an inbox vocabulary
+N_FEATURES = 1 << int(os.getenv("CLASSIFIER_FEATURE_BITS", "18"))
+
+# Tags seen on fewer emails than this are left to the LLM
+MIN_TAG_EXAMPLES = 5
+
+# Only the start of long bodies is featurized; the category is almost always clear by then
+_BODY_CHARS = 2000
+
+
+def email_features(email: dict) -> np.ndarray:
+    """
+    Hashes an email into the indices of its active features.
+
+    Features are body/subject words and word bigrams plus the sender address,
+    sender domain and display name, each in its own namespace. crc32 is used
+    rather than hash() so indices are stable across processes.
+    """
+    subject = str(email.get("subject", ""))
+    words = tokenize(subject + " " + str(email.get("body", ""))[:_BODY_CHARS])
+    sender = str(email.get("sender", "")).lower()
+    features = [f"w:{word}" for word in words]
+    features += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+    features += [f"s:{word}" for word in tokenize(subject)]
+    features += [f"a:{sender}", f"d:{sender_domain(sender)}", f"n:{str(email.get('name', '')).lower()}"]
+    # Presence rather than counts: keeps long emails from dominating and probabilities saner
+    return np.unique(np.fromiter((zlib.crc32(feature.encode("utf-8")) for feature in features), dtype=np.int64) % N_FEATURES)
+
+
+def _featurize(emails: list):
+    """Featurizes emails into flat (document index, feature index) arrays."""
+    rows = [email_features(email) for email in emails]
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    doc_idx = np.repeat(np.arange(len(rows)), [len(row) for row in rows])
+    return doc_idx, np.concatenate(rows)
+
+
+def _llm_tags(email: dict) -> list:
+    """
+    Returns the email's tags if the LLM produced them for this email, else None
+    (tags from this classifier, or copied from a cluster representative).
+    """
+    tags = email.get("tags")
+    if not tags or email.get("tag_source") in ("local", "cluster"):
+        return None
+    return [str(tag).strip() for tag in tags if str(tag).strip()]
+
+
+class TagClassifier:
+    """
+    One-vs-rest Bernoulli-style naive Bayes over hashed email features.
+
+    Each tag gets a weight per feature (the log-ratio of the feature's smoothed
+    frequency in emails with and without the tag) plus a prior. Scoring a batch is
+    a gather and a bincount per tag, so it takes microseconds per email.
+    """
+
+    def __init__(self, tags: list, weights: np.ndarray, bias: np.ndarray, trained_on: int, tags_version: str = None):
+        self.tags = list(tags)
+        self.weights = weights        # (n_tags, N_FEATURES) float32
+        self.bias = bias              # (n_tags,) float64
+        self.trained_on = trained_on
+        # Categorization prompt version the training tags were produced with (None: any)
+        self.tags_version = tags_version
+
+    @classmethod
+    def train(cls, emails: list, alpha: float = 1.0, tags_version: str = None):
+        """
+        Fits a model on emails carrying LLM-written tags.
+
+        Args:
+            tags_version: If given, only emails tagged with this categorization prompt
+                version (their 'prompt_versions', see services/prompt_registry.py) are
+                learned from, so the model answers with the current categories.
+
+        Returns:
+            TagClassifier or None: None if there are too few examples to learn from.
+        """
+        examples = [(email, tags) for email in emails if (tags := _llm_tags(email))
+                    and (tags_version is None or (email.get("prompt_versions") or {}).get("tags") == tags_version)]
+        if len(examples) < MIN_TRAINING_EMAILS:
+            return None
+
+        counts = {}
+        for _, tags in examples:
+            for tag in set(tags):
+                counts[tag] = counts.get(tag, 0) + 1
+        tag_names = sorted(tag for tag, count in counts.items() if count >= MIN_TAG_EXAMPLES)
+        if not tag_names:
+            return None
+
+        labels = np.array([[tag in tags for tag in tag_names] for _, tags in examples], dtype=bool)
+        doc_idx, feat_idx = _featurize([email for email, _ in examples])
+        n_docs = len(examples)
+
+        weights = np.empty((len(tag_names), N_FEATURES), dtype=np.float32)
+        bias = np.empty(len(tag_names))
+        for t in range(len(tag_names)):
+            positive = labels[:, t]
+            n_pos = int(positive.sum())
+            n_neg = n_docs - n_pos
+            pos_counts = np.bincount(feat_idx[positive[doc_idx]], minlength=N_FEATURES)
+            neg_counts = np.bincount(feat_idx[~positive[doc_idx]], minlength=N_FEATURES)
+            # P(feature present | class), Laplace-smoothed
+            p_pos = (pos_counts + alpha) / (n_pos + 2 * alpha)
+            p_neg = (neg_counts + alpha) / (n_neg + 2 * alpha)
+            weights[t] = np.log(p_pos) - np.log(p_neg)
+            bias[t] = np.log((n_pos + alpha) / (n_neg + alpha))
+        return cls(tag_names, weights, bias, n_docs, tags_version)
+
+    def predict_proba(self, emails: list) -> np.ndarray:
+        """Returns P(tag | email) for every email and tag, shape (len(emails), len(tags))."""
+        doc_idx, feat_idx = _featurize(emails)
+        logits = np.empty((len(emails), len(self.tags)))
+        for t in range(len(self.tags)):
+            logits[:, t] = self.bias[t] + np.bincount(doc_idx, weights=self.weights[t, feat_idx], minlength=len(emails))
+        return 1.0 / (1.0 + np.exp(-np.clip(logits, -50, 50)))
+
+    def predict_confident(self, emails: list, threshold: float = CONFIDENCE_THRESHOLD) -> dict:
+        """
+        Tags the emails the model is sure about.
+
+        Returns:
+            dict: Maps input position -> list of tags, only for emails where every tag
+            probability is >= threshold or <= 1 - threshold and at least one tag applies.
+        """
+        if not emails:
+            return {}
+        proba = self.predict_proba(emails)
+        decided = (proba >= threshold) | (proba <= 1 - threshold)
+        positive = proba >= 0.5
+        confident = decided.all(axis=1) & positive.any(axis=1)
+        return {
+            int(ind): [tag for tag, on in zip(self.tags, positive[ind]) if on]
+            for ind in np.flatnonzero(confident)
+        }
+
+    def save(self, path=MODEL_PATH) -> None:
+        """Writes the model atomically, so a crash never leaves a half-written file."""
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, tags=np.array(self.tags), weights=self.weights, bias=self.bias,
+                            trained_on=np.array(self.trained_on), tags_version=np.array(self.tags_version or ""))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(buffer.getvalue())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        """Loads a saved model, returning None if there isn't a usable one."""
+        try:
+            with np.load(path) as data:
+                if data["weights"].shape[1] != N_FEATURES:
+                    # Saved with a different CLASSIFIER_FEATURE_BITS
+                    return None
+                # Models saved before prompt versioning have no tags_version
+                tags_version = str(data["tags_version"]) if "tags_version" in data.files else ""
+                return cls([str(tag) for tag in data["tags"]], data["weights"], data["bias"], int(data["trained_on"]),
+                           tags_version or None)
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def _tag_set(tags) -> frozenset:
+    return frozenset(str(tag).strip().lower() for tag in tags or () if str(tag).strip())
+
+
+class ClassifierService:
+    """
+    Owns the current model for the process: loading, retraining and agreement stats.
+
+    Retraining happens on the next get_model() call once RETRAIN_EVERY new LLM-tagged
+    emails have been reported through record_batch(), or when the categorization
+    instructions changed since the model was trained.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model = TagClassifier.load()
+        self._loaded = False
+        self._tried_version = None
+        self._new_labels = 0
+        self._stats = load_payload(STATS_FILE) or {}
+
+    def get_model(self, collection: str = "mock_inbox.json", tags_version: str = None):
+        """
+        Returns the current model, (re)training it first if it is missing or due.
+
+        Args:
+            tags_version: The current categorization prompt version. A model trained on
+                tags from other instructions would answer with the old categories, so it
+                is retrained on emails tagged with this version, and None is returned
+                (everything goes to the LLM) until there are enough of them.
+        """
+        with self._lock:
+            due = self._new_labels >= RETRAIN_EVERY
+            outdated = tags_version is not None and (self._model is None or self._model.tags_version != tags_version)
+            # A process without a saved model tries one training pass on startup, and
+            # one per new categorization version; after that, only when due
+            if due or (self._model is None and not self._loaded) or (outdated and self._tried_version != tags_version):
+                self._loaded = True
+                self._tried_version = tags_version
+                self._new_labels = 0
+                self._retrain(collection, tags_version)
+            if tags_version is not None and (self._model is None or self._model.tags_version != tags_version):
+                return None
+            return self._model
+
+    def _retrain(self, collection: str, tags_version: str = None) -> None:
+        started = time.perf_counter()
+        model = TagClassifier.train(list(iter_payload(collection)), tags_version=tags_version)
+        if model is None:
+            return
+        model.save()
+        self._model = model
+        self._stats["trained_on"] = model.trained_on
+        self._stats["tags"] = model.tags
+        self._stats["tags_version"] = model.tags_version
+        self._stats["train_seconds"] = round(time.perf_counter() - started, 3)
+        self._stats["trained_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        save_data(STATS_FILE, self._stats)
+
+    def should_audit(self) -> bool:
+        """Decides whether a confident email is still sent to the LLM for comparison."""
+        return random.random() < AUDIT_RATE
+
+    def record_batch(self, local: int, llm: int, audits: list) -> None:
+        """
+        Records one processing batch.
+
+        Args:
+            local: Emails tagged by the classifier alone.
+            llm: Emails tagged by the LLM (this includes audited emails).
+            audits: (classifier tags, LLM tags) pairs for audited emails.
+        """
+        with self._lock:
+            self._new_labels += llm
+            stats = self._stats
+            stats["local_answers"] = stats.get("local_answers", 0) + local
+            stats["llm_answers"] = stats.get("llm_answers", 0) + llm
+            stats["audited"] = stats.get("audited", 0) + len(audits)
+            stats["audit_agreed"] = stats.get("audit_agreed", 0) + sum(_tag_set(a) == _tag_set(b) for a, b in audits)
+            save_data(STATS_FILE, stats)
+
+    def stats(self) -> dict:
+        """
+        Returns usage and accuracy-vs-LLM figures: how many emails were tagged locally,
+        and how often audited local answers matched the LLM exactly.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats.get("local_answers", 0) + stats.get("llm_answers", 0)
+        stats["local_share"] = round(stats.get("local_answers", 0) / total, 4) if total else 0.0
+        stats["audit_accuracy"] = round(stats["audit_agreed"] / stats["audited"], 4) if stats.get("audited") else None
+        return stats
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_classifier_service() -> ClassifierService:
+    """Returns the process-wide classifier service, creating it on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ClassifierService()
+        return _service
+
+
+def evaluate(emails: list, threshold: float = CONFIDENCE_THRESHOLD, holdout: float = 0.2, seed: int = 0) -> dict:
+    """
+    Measures the classifier against LLM tags on a held-out split of LLM-tagged emails.
+
+    Returns:
+        dict: 'coverage' (share answered locally at this threshold), 'accuracy'
+        (exact tag-set match with the LLM on those), 'overall_accuracy' (match
+        on every held-out email, forcing a local answer) and per-tag precision/recall.
+    """
+    examples = [email for email in emails if _llm_tags(email)]
+    random.Random(seed).shuffle(examples)
+    split = int(len(examples) * (1 - holdout))
+    model = TagClassifier.train(examples[:split])
+    test = examples[split:]
+    if model is None or not test:
+        return {"error": f"need at least {MIN_TRAINING_EMAILS} LLM-tagged emails", "examples": len(examples)}
+
+    proba = model.predict_proba(test)
+    confident = model.predict_confident(test, threshold)
+    truth = [_tag_set(email["tags"]) for email in test]
+    predicted = [_tag_set(tag for tag, p in zip(model.tags, row) if p >= 0.5) for row in proba]
+
+    per_tag = {}
+    for tag in model.tags:
+        key = tag.lower()
+        tp = sum(key in p and key in t for p, t in zip(predicted, truth))
+        fp = sum(key in p and key not in t for p, t in zip(predicted, truth))
+        fn = sum(key not in p and key in t for p, t in zip(predicted, truth))
+        per_tag[tag] = {
+            "precision": round(tp / (tp + fp), 4) if tp + fp else None,
+            "recall": round(tp / (tp + fn), 4) if tp + fn else None,
+        }
+    return {
+        "train_examples": split,
+        "test_examples": len(test),
+        "threshold": threshold,
+        "coverage": round(len(confident) / len(test), 4),
+        "accuracy": round(sum(_tag_set(tags) == truth[ind] for ind, tags in confident.items()) / len(confident), 4) if confident else None,
+        "overall_accuracy": round(sum(p == t for p, t in zip(predicted, truth)) / len(test), 4),
+        "per_tag": per_tag,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Train or evaluate the local email tag classifier.")
+    parser.add_argument("command", choices=["train", "evaluate", "stats"])
+    parser.add_argument("--collection", default="mock_inbox.json")
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        model = TagClassifier.train(list(iter_payload(args.collection)),
+                                    tags_version=get_prompt_registry().result_version("tags"))
+        if model is None:
+            print(f"Not enough emails tagged by the LLM with the current instructions to train (need {MIN_TRAINING_EMAILS}).")
+            return
+        model.save()
+        print(f"Trained on {model.trained_on} emails; tags: {', '.join(model.tags)}")
+    elif args.command == "evaluate":
+        print(evaluate(list(iter_payload(args.collection)), args.threshold))
+    else:
+        print(get_classifier_service().stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+
+# Categorize each thread / group of near-identical emails with one LLM call
+# (the other emails still get their own action extraction)
+CLUSTERING_ENABLED = os.getenv("CLUSTERING_ENABLED", "0") == "1"
+
+# Two bodies are near-duplicates if their 64-bit SimHashes differ in at most this many bits
+CLUSTER_MAX_DISTANCE = int(os.getenv("CLUSTER_MAX_DISTANCE", "3"))
+
+# Bodies with fewer words than this are too short for a reliable fingerprint
+CLUSTER_MIN_WORDS = int(os.getenv("CLUSTER_MIN_WORDS", "20"))
+
+# LSH: the fingerprint is split into this many bands; emails sharing any band are compared.
+# With 4 bands of 16 bits, every pair within 3 differing bits shares at least one band.
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+
+_REPLY_PREFIX = re.compile(r"^\s*((re|fwd?|aw|wg|sv)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+_DIGITS = re.compile(r"\d+")
+_WORD = re.compile(r"\w+")
+
+
+def normalize_subject(subject: str) -> str:
+    """Strips reply/forward prefixes, case and extra whitespace: 'RE: Fwd: Q3  Plan' -> 'q3 plan'."""
+    return " ".join(_REPLY_PREFIX.sub("", subject or "").lower().split())
+
+
+def _sender_domain(email: dict) -> str:
+    return str(email.get("sender", "")).rsplit("@", 1)[-1].lower()
+
+
+# Odd 64-bit constants for combining word hashes into shingle hashes
+_MIX = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F), np.uint64(0x165667B19E3779F9))
+
+def _words(body: str) -> list:
+    """Body words with quoted lines dropped and numbers masked (dates, amounts, ids)."""
+    lines = [line for line in (body or "").splitlines() if not line.lstrip().startswith(">")]
+    return _WORD.findall(_DIGITS.sub("0", " ".join(lines).lower()))
+
+
+@lru_cache(maxsize=200000)
+def _word_hash(word: str) -> int:
+    """64-bit hash of a word. Cached (thread-safely) since the vocabulary is small compared to text."""
+    return int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _hash_words(words: list) -> np.ndarray:
+    """64-bit hashes of the words, computed once per distinct word."""
+    hashes = {word: _word_hash(word) for word in set(words)}
+    return np.fromiter(map(hashes.__getitem__, words), dtype=np.uint64, count=len(words))
+
+
+def simhash(body: str):
+    """
+    64-bit SimHash of an email body over word 3-grams, or None if the body is too short.
+
+    Each 3-gram votes +1/-1 on every bit of its own hash; the fingerprint keeps the
+    majority. Similar bodies share most 3-grams, so their fingerprints differ in few bits.
+    """
+    words = _words(body)
+    if len(words) < CLUSTER_MIN_WORDS:
+        return None
+    hashes = _hash_words(words)
+    with np.errstate(over="ignore"):
+        shingles = hashes[:-2] * _MIX[0] ^ hashes[1:-1] * _MIX[1] ^ hashes[2:] * _MIX[2]
+        # splitmix64 finalizer, so every output bit depends on all three words
+        shingles ^= shingles >> np.uint64(31)
+        shingles *= np.uint64(0xBF58476D1CE4E5B9)
+        shingles ^= shingles >> np.uint64(29)
+    bits = np.unpackbits(shingles.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    return int.from_bytes(np.packbits(votes > 0, bitorder="little").tobytes(), "little")
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, ind: int) -> int:
+        while self.parent[ind] != ind:
+            self.parent[ind] = self.parent[self.parent[ind]]
+            ind = self.parent[ind]
+        return ind
+
+    def union(self, a: int, b: int) -> None:
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def cluster_key(email: dict) -> dict:
+    """
+    What clustering needs to know about an email, without its body.
+
+    Large sets can be clustered by computing these a batch of records at a time
+    (see cluster_keys) instead of holding every body in memory.
+    """
+    exempt = bool(email.get("cluster_exempt"))
+    return {
+        "subject": normalize_subject(email.get("subject", "")),
+        "sender": str(email.get("sender", "")).lower(),
+        "domain": _sender_domain(email),
+        "fingerprint": None if exempt else simhash(email.get("body", "")),
+        "timestamp": str(email.get("timestamp", "")),
+        "exempt": exempt,
+    }
+
+
+def cluster_emails(emails: list) -> dict:
+    """
+    Groups emails that can share one LLM result (see cluster_keys).
+
+    Returns:
+        dict: Maps the position of each clustered email to the position of its
+        cluster's representative (the newest email in it). Representatives and
+        unclustered emails are not included.
+    """
+    return cluster_keys([cluster_key(email) for email in emails])
+
+
+def cluster_keys(keys: list) -> dict:
+    """
+    Groups emails, given as cluster_key() dicts, that can share one LLM result.
+
+    Two emails end up in the same cluster if they belong to the same thread (same
+    normalized subject and sender) or have near-identical bodies (SimHash within
+    CLUSTER_MAX_DISTANCE bits) and come from the same sender domain; the domain check
+    keeps a phishing copy of a bank notice out of the bank's cluster. Emails with
+    'cluster_exempt' set are always processed on their own.
+
+    Returns:
+        dict: Maps the position of each clustered email to the position of its
+        cluster's representative (the newest email in it).
+    """
+    union = _UnionFind(len(keys))
+    threads = {}
+    bands = {}
+    fingerprints = {}
+    exact = {}
+    for ind, key in enumerate(keys):
+        if key["exempt"]:
+            continue
+        if key["subject"]:
+            thread = (key["subject"], key["sender"])
+            if thread in threads:
+                union.union(threads[thread], ind)
+            else:
+                threads[thread] = ind
+
+        fingerprint = key["fingerprint"]
+        if fingerprint is None:
+            continue
+        domain = key["domain"]
+        # Identical fingerprints (recurring alerts) join directly and stay out of the
+        # buckets, so a thousand copies of one notice don't make a bucket quadratic
+        if (domain, fingerprint) in exact:
+            union.union(exact[(domain, fingerprint)], ind)
+            continue
+        exact[(domain, fingerprint)] = ind
+        fingerprints[ind] = fingerprint
+        for band in range(_BANDS):
+            bucket = bands.setdefault((domain, band, (fingerprint >> (band * _BAND_BITS)) & 0xFFFF), [])
+            for other in bucket:
+                if union.find(other) != union.find(ind) and bin(fingerprint ^ fingerprints[other]).count("1") <= CLUSTER_MAX_DISTANCE:
+                    union.union(other, ind)
+            bucket.append(ind)
+
+    clusters = {}
+    for ind in range(len(keys)):
+        clusters.setdefault(union.find(ind), []).append(ind)
+
+    members = {}
+    for indices in clusters.values():
+        if len(indices) < 2:
+            continue
+        # The newest message carries the current state of a thread
+        representative = max(indices, key=lambda ind: (keys[ind]["timestamp"], ind))
+        for ind in indices:
+            if ind != representative:
+                members[ind] = representative
+    return members
@@ -1,52 +1,549 @@
 import json
 import os
+import sqlite3
+import tempfile
+import threading
+import uuid
 from pathlib import Path
 
 
-# Define the base directory for data storage relative to this file
-BASE_DIR = Path(__file__).resolve().parents[1] / "data"
+# Define the base directory for data storage relative to this file.
+# EMAIL_ASSISTANT_DATA_DIR points it elsewhere (e.g. a scratch directory for benchmarks).
+BASE_DIR = Path(os.getenv("EMAIL_ASSISTANT_DATA_DIR") or Path(__file__).resolve().parents[1] / "data")
 
+# Collections of records (lists of dicts) live in SQLite so that a single record can be
+# updated without rewriting the whole file. The JSON file of the same name is only used
+# to seed the collection on first use and as an export format.
+DB_PATH = BASE_DIR / "inbox.db"
+RECORD_COLLECTIONS = {"mock_inbox.json", "new_compose.json"}
 
-def load_payload(relfile: str) -> dict:
-    """
-    Reads a JSON file from the 'data' directory and returns it as a Python object.
-    
-    Args:
-        relfile: The filename relative to the 'data' directory (e.g., 'mock_inbox.json').
-        
-    Returns:
-        dict or list: The parsed JSON content. Returns empty structure if file is missing or invalid.
-    """
-    pathfile = BASE_DIR / relfile
+# Large per-record fields that load_metadata leaves out; hydrate_records fetches them on demand
+HEAVY_FIELDS = ("body", "reply", "digest")
+
+# Records are written to SQLite in batches of this size while importing
+IMPORT_BATCH_SIZE = 1000
+
+_local = threading.local()
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Returns this thread's connection to the record store, creating the schema on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS records (
+                collection TEXT NOT NULL,
+                rid TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (collection, rid)
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_records_position ON records(collection, position)")
+        conn.execute("CREATE TABLE IF NOT EXISTS collections (name TEXT PRIMARY KEY)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def _record_id(record: dict) -> str:
+    """Returns the record's id, assigning a new one if it has none (e.g. composed drafts)."""
+    if not record.get("id"):
+        record["id"] = f"rec_{uuid.uuid4().hex[:12]}"
+    return str(record["id"])
+
+
+def _read_json_file(pathfile: Path, default):
+    """Reads a JSON file, returning default if it is missing, empty or invalid."""
     try:
         with open(pathfile, 'r', encoding="utf-8") as f:
             content = f.read().strip()
             if not content:
-                # Return list for compose/drafts, dict for others (defaulting logic)
-                return [] if "compose" in relfile else {}
-            data = json.loads(content)
+                return default
+            return json.loads(content)
     except (FileNotFoundError, json.JSONDecodeError):
         # Fail gracefully by returning empty structures
-        return [] if "compose" in relfile else {}
-    return data
+        return default
+
+
+def _write_json_file(pathfile: Path, data) -> None:
+    """
+    Writes JSON atomically: the data goes to a temporary file in the same
+    directory which then replaces the target, so a crash never leaves a
+    half-written file behind.
+    """
+    pathfile.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=pathfile.parent, prefix=f".{pathfile.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding="utf-8") as f:
+            # Use indent=2 for human-readable JSON files
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, pathfile)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _iter_json_array(f, chunk_size: int = 1 << 16):
+    """
+    Incrementally parses a JSON array from a text file, yielding one element at a time.
+
+    Only the current element (plus one read chunk) is held in memory, so arbitrarily
+    large arrays can be consumed. An empty file yields nothing.
+
+    Raises:
+        ValueError: If the file isn't a JSON array, or is truncated or invalid. Elements
+            before the error have already been yielded, so callers that must not keep
+            a partial import should write inside a transaction.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        # Read at least as much as is buffered, so huge elements don't cause quadratic re-parsing
+        chunk = f.read(max(chunk_size, len(buf) - pos))
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    # What comes next: the opening bracket, an element (or the closing bracket), or a separator
+    expect = "start"
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                if expect == "start":
+                    return
+                raise ValueError("Truncated JSON array: missing closing bracket")
+            fill()
+            continue
+        char = buf[pos]
+        if expect == "start":
+            if char != "[":
+                raise ValueError("Expected a JSON array")
+            expect = "first"
+            pos += 1
+            continue
+        if expect == "separator" or (expect == "first" and char == "]"):
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"Invalid JSON array: expected ',' or ']' at {char!r}")
+            expect = "element"
+            pos += 1
+            continue
+        try:
+            element, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError("Truncated or invalid JSON array element") from None
+            fill()
+            continue
+        # A value cut off by the chunk boundary can still decode (e.g. '45' of '456', or '1' of '1.5'),
+        # so it is only accepted once the separator after it has been read
+        after = end
+        while after < len(buf) and buf[after].isspace():
+            after += 1
+        if not eof and (after == len(buf) or buf[after] not in ",]"):
+            fill()
+            continue
+        yield element
+        pos = end
+        expect = "separator"
+
+
+def iter_records(path):
+    """
+    Lazily yields records from a JSON array file or a JSON Lines (.jsonl) file.
+
+    Malformed JSON Lines entries are skipped, and a missing file yields nothing,
+    mirroring load_payload's fail-gracefully behaviour. A JSON file that isn't a
+    complete array raises ValueError (see _iter_json_array).
+
+    Args:
+        path: Path to the file, or a filename relative to the 'data' directory.
+    """
+    pathfile = Path(path)
+    if not pathfile.is_absolute() and not pathfile.exists():
+        pathfile = BASE_DIR / pathfile
+    try:
+        with open(pathfile, 'r', encoding="utf-8") as f:
+            if pathfile.suffix == ".jsonl":
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+            else:
+                yield from _iter_json_array(f)
+    except FileNotFoundError:
+        return
+
+
+def _seed_path(relfile: str) -> Path:
+    """Finds the file a collection is seeded from: the JSON file, or a .jsonl sibling."""
+    pathfile = BASE_DIR / relfile
+    jsonl_file = pathfile.with_suffix(".jsonl")
+    if not pathfile.exists() and jsonl_file.exists():
+        return jsonl_file
+    return pathfile
+
+
+def _ensure_imported(relfile: str) -> None:
+    """Seeds a record collection from its JSON / JSON Lines file the first time it is used."""
+    conn = _get_connection()
+    if conn.execute("SELECT 1 FROM collections WHERE name = ?", (relfile,)).fetchone():
+        return
+    import_json(relfile)
+
+
+def load_payload(relfile: str) -> dict:
+    """
+    Reads a data file from the 'data' directory and returns it as a Python object.
+
+    Record collections (see RECORD_COLLECTIONS) are read from the SQLite store in
+    their saved order; everything else is read from the JSON file directly.
+
+    Args:
+        relfile: The filename relative to the 'data' directory (e.g., 'mock_inbox.json').
+
+    Returns:
+        dict or list: The parsed content. Returns empty structure if file is missing or invalid.
+    """
+    if relfile in RECORD_COLLECTIONS:
+        _ensure_imported(relfile)
+        rows = _get_connection().execute(
+            "SELECT data FROM records WHERE collection = ? ORDER BY position", (relfile,)
+        ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    # Return list for compose/drafts, dict for others (defaulting logic)
+    return _read_json_file(BASE_DIR / relfile, [] if "compose" in relfile else {})
+
 
 def save_data(relfile: str, data) -> None:
     """
-    Writes data to a JSON file in the 'data' directory.
-    
+    Saves a whole data file.
+
+    For record collections this replaces the collection in one SQLite transaction
+    (records not in data are deleted). Other files are written as JSON atomically.
+    Prefer upsert_record / upsert_records when only a few records changed.
+
     Args:
         relfile: The target filename.
         data: The Python object (dict/list) to serialize.
     """
-    pathfile = BASE_DIR / relfile 
-    
-    # Ensure the directory exists
-    pathfile.parent.mkdir(parents=True, exist_ok=True)
-    
-    with open(pathfile, 'w', encoding="utf-8") as f:
-        # Use indent=2 for human-readable JSON files
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
+    if relfile in RECORD_COLLECTIONS:
+        conn = _get_connection()
+        rows = [(relfile, _record_id(record), position, json.dumps(record, ensure_ascii=False))
+                for position, record in enumerate(data)]
+        with conn:
+            conn.execute("DELETE FROM records WHERE collection = ?", (relfile,))
+            conn.executemany("INSERT OR REPLACE INTO records (collection, rid, position, data) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("INSERT OR IGNORE INTO collections (name) VALUES (?)", (relfile,))
+        return
+
+    _write_json_file(BASE_DIR / relfile, data)
+
+
+def _with_stored_heavy_fields(conn: sqlite3.Connection, relfile: str, rid: str, record: dict) -> dict:
+    """Returns a copy of record with any heavy fields it lacks taken from the stored version."""
+    row = conn.execute("SELECT data FROM records WHERE collection = ? AND rid = ?", (relfile, rid)).fetchone()
+    if row is None:
+        return record
+    stored = json.loads(row[0])
+    merged = dict(record)
+    for field in HEAVY_FIELDS:
+        if field not in merged and field in stored:
+            merged[field] = stored[field]
+    return merged
+
+
+def upsert_records(relfile: str, records: list) -> None:
+    """
+    Inserts or updates individual records of a collection in one transaction.
+
+    Existing records keep their position; new ones are appended at the end.
+    Only the given rows are written, so marking one email as read touches one row.
+    """
+    if relfile not in RECORD_COLLECTIONS:
+        raise ValueError(f"{relfile} is not a record collection")
+    if not records:
+        return
+
+    _ensure_imported(relfile)
+    conn = _get_connection()
+    with conn:
+        next_position = conn.execute(
+            "SELECT COALESCE(MAX(position), -1) + 1 FROM records WHERE collection = ?", (relfile,)
+        ).fetchone()[0]
+        for record in records:
+            rid = _record_id(record)
+            if "body" not in record:
+                # Metadata-only record (see load_metadata): keep the stored heavy fields
+                record = _with_stored_heavy_fields(conn, relfile, rid, record)
+            data = json.dumps(record, ensure_ascii=False)
+            updated = conn.execute(
+                "UPDATE records SET data = ? WHERE collection = ? AND rid = ?", (data, relfile, rid)
+            ).rowcount
+            if not updated:
+                conn.execute(
+                    "INSERT INTO records (collection, rid, position, data) VALUES (?, ?, ?, ?)",
+                    (relfile, rid, next_position, data),
+                )
+                next_position += 1
+
+
+def merge_records(relfile: str, records: list, keep_existing: tuple = ()) -> None:
+    """
+    Inserts new records and merges the fields of the given ones into records that already exist.
+
+    Unlike upsert_records, fields a stored record has but the given one lacks (tags,
+    action items, replies, digests...) are kept. Fields listed in keep_existing are
+    only set on new records, so e.g. a re-import doesn't reset the local read state.
+    Values must not be None (json_patch treats null as "delete this field").
+    """
+    if relfile not in RECORD_COLLECTIONS:
+        raise ValueError(f"{relfile} is not a record collection")
+    if not records:
+        return
+
+    _ensure_imported(relfile)
+    conn = _get_connection()
+    with conn:
+        next_position = conn.execute(
+            "SELECT COALESCE(MAX(position), -1) + 1 FROM records WHERE collection = ?", (relfile,)
+        ).fetchone()[0]
+        for record in records:
+            rid = _record_id(record)
+            patch = {field: value for field, value in record.items() if field not in keep_existing}
+            updated = conn.execute(
+                "UPDATE records SET data = json_patch(data, ?) WHERE collection = ? AND rid = ?",
+                (json.dumps(patch, ensure_ascii=False), relfile, rid),
+            ).rowcount
+            if not updated:
+                conn.execute(
+                    "INSERT INTO records (collection, rid, position, data) VALUES (?, ?, ?, ?)",
+                    (relfile, rid, next_position, json.dumps(record, ensure_ascii=False)),
+                )
+                next_position += 1
+
+
+def upsert_record(relfile: str, record: dict) -> None:
+    """Inserts or updates a single record (see upsert_records)."""
+    upsert_records(relfile, [record])
+
+
+def update_fields(relfile: str, updates: dict) -> None:
+    """
+    Sets individual fields on stored records without rewriting the rest of them.
+
+    Args:
+        updates: Maps record id -> {field: new value}. Ids that aren't stored are ignored.
+
+    The fields are patched inside SQLite (json_set), so a concurrent change to other
+    fields of the same record (e.g. marking it read) is not overwritten.
+    """
+    if relfile not in RECORD_COLLECTIONS:
+        raise ValueError(f"{relfile} is not a record collection")
+    if not updates:
+        return
+
+    _ensure_imported(relfile)
+    conn = _get_connection()
+    with conn:
+        for rid, fields in updates.items():
+            if not fields:
+                continue
+            paths = ", ".join(f"'$.{field}', json(?)" for field in fields)
+            values = [json.dumps(value, ensure_ascii=False) for value in fields.values()]
+            conn.execute(
+                f"UPDATE records SET data = json_set(data, {paths}) WHERE collection = ? AND rid = ?",
+                (*values, relfile, str(rid)),
+            )
+
+
+def iter_payload(relfile: str, batch_size: int = IMPORT_BATCH_SIZE):
+    """Lazily yields the records of a collection in order, without loading them all at once."""
+    _ensure_imported(relfile)
+    cursor = _get_connection().execute(
+        "SELECT data FROM records WHERE collection = ? ORDER BY position", (relfile,)
+    )
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for (data,) in rows:
+            yield json.loads(data)
+
+
+def _metadata_column() -> str:
+    """The SQL expression for a record's data without its heavy fields."""
+    paths = ", ".join(f"'$.{field}'" for field in HEAVY_FIELDS)
+    return f"json_remove(data, {paths})"
+
+
+def load_metadata(relfile: str) -> list:
+    """
+    Loads a collection without its heavy fields (see HEAVY_FIELDS).
+
+    The fields are stripped inside SQLite, so bodies never reach Python memory.
+    Use hydrate_records to fetch them for the records that need them.
+    """
+    _ensure_imported(relfile)
+    rows = _get_connection().execute(
+        f"SELECT {_metadata_column()} FROM records WHERE collection = ? ORDER BY position", (relfile,)
+    ).fetchall()
+    return [json.loads(data) for (data,) in rows]
+
+
+def count_records(relfile: str) -> int:
+    """Returns how many records a collection holds (a cheap check for records added by another process)."""
+    _ensure_imported(relfile)
+    return _get_connection().execute("SELECT COUNT(*) FROM records WHERE collection = ?", (relfile,)).fetchone()[0]
+
 
+def load_ids(relfile: str) -> list:
+    """Returns the ids of a collection's records, in order, without reading the records."""
+    _ensure_imported(relfile)
+    rows = _get_connection().execute(
+        "SELECT rid FROM records WHERE collection = ? ORDER BY position", (relfile,)
+    ).fetchall()
+    return [rid for (rid,) in rows]
 
 
+def fetch_records(relfile: str, ids: list, metadata_only: bool = False) -> dict:
+    """
+    Loads specific records of a collection by id.
+
+    Args:
+        metadata_only: Leave out the heavy fields, as load_metadata does.
+
+    Returns:
+        dict: Maps each found id to its record.
+    """
+    _ensure_imported(relfile)
+    conn = _get_connection()
+    ids = [str(record_id) for record_id in ids]
+    column = _metadata_column() if metadata_only else "data"
+    found = {}
+    # Stay well below SQLite's bound-parameter limit
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ", ".join("?" for _ in chunk)
+        rows = conn.execute(
+            f"SELECT rid, {column} FROM records WHERE collection = ? AND rid IN ({placeholders})", (relfile, *chunk)
+        ).fetchall()
+        for rid, data in rows:
+            found[rid] = json.loads(data)
+    return found
+
+
+def hydrate_records(relfile: str, records: list) -> list:
+    """
+    Fills in the heavy fields of metadata-only records, in place.
+
+    Records that already have a 'body' are left untouched. Returns the records.
+    """
+    missing = {str(record["id"]): record for record in records if "body" not in record and record.get("id")}
+    if not missing:
+        return records
+
+    for rid, stored in fetch_records(relfile, list(missing)).items():
+        for field in HEAVY_FIELDS:
+            if field in stored:
+                missing[rid][field] = stored[field]
+    return records
+
+
+def import_json(relfile: str, path=None) -> int:
+    """
+    Replaces a record collection with the contents of a JSON or JSON Lines file.
+
+    The file is parsed incrementally and written in batches inside one transaction,
+    so memory use stays bounded no matter how large the export is. If the file turns
+    out to be invalid, the transaction is rolled back and the collection is unchanged.
+
+    Args:
+        relfile: The collection name (e.g., 'mock_inbox.json').
+        path: The file to import. Defaults to the file of the same name in 'data'
+            (or its .jsonl sibling); a missing default file imports an empty collection.
+
+    Returns:
+        int: Number of records imported.
+
+    Raises:
+        FileNotFoundError: If an explicit path doesn't exist.
+        ValueError: If a JSON file isn't a complete JSON array.
+    """
+    if path and not Path(path).exists() and not (BASE_DIR / path).exists():
+        raise FileNotFoundError(path)
+    conn = _get_connection()
+    count = 0
+    with conn:
+        conn.execute("DELETE FROM records WHERE collection = ?", (relfile,))
+        batch = []
+        for record in iter_records(path if path else _seed_path(relfile)):
+            if not isinstance(record, dict):
+                continue
+            batch.append((relfile, _record_id(record), count, json.dumps(record, ensure_ascii=False)))
+            count += 1
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                conn.executemany("INSERT OR REPLACE INTO records (collection, rid, position, data) VALUES (?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT OR REPLACE INTO records (collection, rid, position, data) VALUES (?, ?, ?, ?)", batch)
+        conn.execute("INSERT OR IGNORE INTO collections (name) VALUES (?)", (relfile,))
+    return count
+
+
+def export_json(relfile: str, path=None) -> Path:
+    """
+    Writes a record collection out as a JSON array, or JSON Lines if path ends in .jsonl.
+
+    Records are streamed from the store to a temporary file that then replaces the
+    target, so exports are atomic and don't need the whole collection in memory.
+
+    Args:
+        relfile: The collection name (e.g., 'mock_inbox.json').
+        path: Destination file. Defaults to the file of the same name in 'data'.
+
+    Returns:
+        Path: The file that was written.
+    """
+    target = Path(path) if path else BASE_DIR / relfile
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding="utf-8") as f:
+            if target.suffix == ".jsonl":
+                for record in iter_payload(relfile):
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            else:
+                # Same layout as json.dump(..., indent=2), one record at a time
+                f.write("[")
+                for ind, record in enumerate(iter_payload(relfile)):
+                    f.write(",\n  " if ind else "\n  ")
+                    f.write(json.dumps(record, indent=2, ensure_ascii=False).replace("\n", "\n  "))
+                f.write("\n]" if f.tell() > 1 else "]")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return target
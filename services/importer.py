@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import html
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from email import message_from_bytes
+from email.header import decode_header, make_header
+from email.utils import parseaddr, parsedate_to_datetime
+from multiprocessing import Pool
+from pathlib import Path
+
+from services.data_manager import merge_records, IMPORT_BATCH_SIZE
+from services.inbox_index import TIMESTAMP_FORMAT
+
+
+# "From " lines inside mbox bodies are escaped as ">From " (mboxrd); undo one level
+_MBOX_FROM_ESCAPE = re.compile(rb"^>(>*From )")
+_HTML_TAG = re.compile(r"<[^>]+>")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+# Fields taken from the export only for new messages; for known ones the local value wins
+IMPORT_KEEP_FIELDS = ("is_read",)
+
+# Timestamp of messages with no usable date; fixed, so re-imports don't move them
+UNKNOWN_TIMESTAMP = datetime(1970, 1, 1).strftime(TIMESTAMP_FORMAT)
+
+
+def iter_mbox_messages(path):
+    """
+    Streams raw messages out of an mbox file, one at a time.
+
+    Messages are split on lines starting with "From " and never fully loaded
+    together, so arbitrarily large mailboxes can be read in bounded memory.
+    """
+    with open(path, "rb") as f:
+        lines = []
+        for line in f:
+            if line.startswith(b"From "):
+                if lines:
+                    yield b"".join(lines)
+                lines = []
+                continue
+            lines.append(_MBOX_FROM_ESCAPE.sub(rb"\1", line))
+        if lines:
+            yield b"".join(lines)
+
+
+def iter_eml_messages(directory):
+    """Streams raw messages from every .eml file under a directory (recursively)."""
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(".eml"):
+                with open(os.path.join(root, name), "rb") as f:
+                    yield f.read()
+
+
+def iter_raw_messages(paths: list):
+    """Streams raw messages from a mix of mbox files, .eml files and .eml directories."""
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            yield from iter_eml_messages(path)
+        elif path.suffix.lower() == ".eml":
+            yield path.read_bytes()
+        else:
+            yield from iter_mbox_messages(path)
+
+
+def _decode_header(value) -> str:
+    """Decodes RFC 2047 encoded-words (e.g. '=?utf-8?q?J=C3=B6rg?=') into plain text."""
+    if value is None:
+        return ""
+    try:
+        return str(make_header(decode_header(str(value))))
+    except (LookupError, UnicodeDecodeError, ValueError):
+        return str(value)
+
+
+def _decode_part(part) -> str:
+    """Decodes a single MIME part's payload using its declared charset."""
+    payload = part.get_payload(decode=True) or b""
+    charset = part.get_content_charset() or "utf-8"
+    try:
+        return payload.decode(charset, errors="replace")
+    except LookupError:
+        # Unknown charset name
+        return payload.decode("utf-8", errors="replace")
+
+
+def _extract_body(message) -> str:
+    """Returns the first plain-text part of the message, falling back to tag-stripped HTML."""
+    plain = html_text = None
+    for part in message.walk():
+        if part.is_multipart() or part.get("Content-Disposition", "").lower().startswith("attachment"):
+            continue
+        content_type = part.get_content_type()
+        if content_type == "text/plain" and plain is None:
+            plain = _decode_part(part)
+            break
+        if content_type == "text/html" and html_text is None:
+            html_text = _decode_part(part)
+
+    if plain is not None:
+        content = plain
+    elif html_text is not None:
+        content = html.unescape(_HTML_TAG.sub(" ", html_text))
+    else:
+        return ""
+    return _BLANK_LINES.sub("\n\n", content.replace("\r\n", "\n")).strip()
+
+
+def _normalize_timestamp(value):
+    """
+    Converts a date header value into the "%Y-%m-%d %H:%M:%S" local-time format
+    that convert_to_relative_format expects. Returns None if it can't be parsed.
+    """
+    try:
+        dt = parsedate_to_datetime(str(value)) if value else None
+    except (TypeError, ValueError, IndexError):
+        dt = None
+    if dt is None:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt.strftime(TIMESTAMP_FORMAT)
+
+
+def _message_timestamp(message) -> str:
+    """
+    The message's Date header, else the delivery date the receiving server stamped
+    on it (the topmost Received header, after the ';'), else UNKNOWN_TIMESTAMP.
+    Always the same for the same message, so a re-import never changes a stored timestamp.
+    """
+    timestamp = _normalize_timestamp(message.get("Date"))
+    if timestamp is None:
+        received = message.get_all("Received") or []
+        if received and ";" in str(received[0]):
+            timestamp = _normalize_timestamp(str(received[0]).rsplit(";", 1)[1].strip())
+    return timestamp or UNKNOWN_TIMESTAMP
+
+
+def parse_message(raw: bytes):
+    """
+    Converts one raw RFC 822 message into the inbox schema
+    (id, sender, name, subject, body, timestamp, is_read).
+
+    The id is derived from the Message-ID (or the raw bytes), so re-importing
+    the same export updates records instead of duplicating them (see import_messages).
+    Returns None for messages that can't be parsed at all.
+    """
+    try:
+        # The legacy (compat32) parser is several times faster than policy.default,
+        # which builds rich header objects we don't need; headers are decoded by hand.
+        message = message_from_bytes(raw)
+        message_id = str(message.get("Message-ID", "")).strip()
+        display_name, address = parseaddr(str(message.get("From", "")))
+        return {
+            "id": "msg_" + hashlib.sha1((message_id or raw.decode("latin-1")).encode("utf-8", "replace")).hexdigest()[:16],
+            "sender": address,
+            "name": _decode_header(display_name) or address,
+            "subject": _decode_header(message.get("Subject")).strip() or "(no subject)",
+            "body": _extract_body(message),
+            "timestamp": _message_timestamp(message),
+            # mbox "Status: RO" marks messages already read in the source client
+            "is_read": "R" in str(message.get("Status", "")),
+        }
+    except Exception:
+        # One malformed message shouldn't stop a large import
+        return None
+
+
+def import_messages(paths: list, relfile: str = "mock_inbox.json", workers: int = None, progress_every: int = 5000) -> dict:
+    """
+    Imports mbox files and .eml files/directories into the inbox store.
+
+    Raw messages are streamed from disk, parsed in parallel across CPU cores and
+    written in batches, so the UI isn't involved and memory stays bounded.
+
+    Messages that are already stored are merged, not replaced: their tags, action
+    items, replies, digests and read state survive a re-import.
+
+    Returns:
+        dict: 'imported', 'failed', 'seconds' and 'messages_per_second'.
+    """
+    started = time.perf_counter()
+    imported = failed = 0
+    batch = []
+    with Pool(processes=workers or os.cpu_count()) as pool:
+        for record in pool.imap(parse_message, iter_raw_messages(paths), chunksize=64):
+            if record is None:
+                failed += 1
+                continue
+            batch.append(record)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                merge_records(relfile, batch, keep_existing=IMPORT_KEEP_FIELDS)
+                imported += len(batch)
+                batch = []
+                if progress_every and imported % progress_every < IMPORT_BATCH_SIZE:
+                    elapsed = time.perf_counter() - started
+                    print(f"... {imported} messages ({imported / elapsed:.0f} msg/s)", file=sys.stderr)
+        if batch:
+            merge_records(relfile, batch, keep_existing=IMPORT_KEEP_FIELDS)
+            imported += len(batch)
+
+    seconds = time.perf_counter() - started
+    return {
+        "imported": imported,
+        "failed": failed,
+        "seconds": round(seconds, 3),
+        "messages_per_second": round(imported / seconds, 1) if seconds else 0.0,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Import mbox files and .eml messages into the Email Assistant inbox.")
+    parser.add_argument("paths", nargs="+", help="mbox files, .eml files or directories containing .eml files")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: number of CPU cores)")
+    parser.add_argument("--collection", default="mock_inbox.json", help="record collection to import into")
+    args = parser.parse_args(argv)
+
+    stats = import_messages(args.paths, args.collection, args.workers)
+    print(f"Imported {stats['imported']} messages ({stats['failed']} failed) in {stats['seconds']}s "
+          f"- {stats['messages_per_second']} msg/s")
+
+
+if __name__ == "__main__":
+    main()
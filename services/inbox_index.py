@@ -0,0 +1,248 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def sender_domain(sender: str) -> str:
+    """Returns the lowercased domain part of an email address ('' if there is none)."""
+    return sender.rsplit("@", 1)[-1].lower() if sender and "@" in sender else ""
+
+
+def _parse_timestamp(value):
+    """Parses the inbox timestamp format, returning None for missing/invalid values."""
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+class InboxIndex:
+    """
+    Secondary indexes over an inbox: read state, tags, sender domain and time.
+
+    Each email id is mapped into a set per indexed value (plus a sorted timeline),
+    so filters like "unread", "tagged To-Do", "from hdfcbank.net" or "last 7 days"
+    are set lookups instead of scans. The index is updated one email at a time via
+    upsert(), or brought in line with a list of emails via sync(), which only
+    touches emails whose indexed fields changed. sync() skips email dicts it has
+    already indexed at the same position, so emails must be changed by swapping
+    in a new dict (as InboxStore does), not modified in place.
+    """
+
+    def __init__(self, emails=None):
+        self._lock = threading.RLock()
+        self._position = {}                 # id -> position in the inbox list
+        self._source = {}                   # id -> the email dict last indexed
+        self._entries = {}                  # id -> (is_read, tags, domain, timestamp)
+        self._unread = set()
+        self._by_tag = defaultdict(set)     # lowercased tag -> ids
+        self._tag_names = {}                # lowercased tag -> display name
+        self._by_domain = defaultdict(set)
+        self._timeline = []                 # sorted (timestamp, id) pairs
+        if emails:
+            self.sync(emails)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _entry(email: dict) -> tuple:
+        return (
+            bool(email.get("is_read")),
+            tuple(email.get("tags") or ()),
+            sender_domain(email.get("sender", "")),
+            _parse_timestamp(email.get("timestamp")),
+        )
+
+    def upsert(self, email: dict, position: int = None) -> None:
+        """Indexes one email, replacing whatever was indexed for its id before."""
+        email_id = email["id"]
+        entry = self._entry(email)
+        with self._lock:
+            self._source[email_id] = email
+            if position is not None:
+                self._position[email_id] = position
+            elif email_id not in self._position:
+                self._position[email_id] = len(self._position)
+            if self._entries.get(email_id) == entry:
+                return
+            self._unindex(email_id)
+
+            is_read, tags, domain, timestamp = entry
+            self._entries[email_id] = entry
+            if not is_read:
+                self._unread.add(email_id)
+            for tag in tags:
+                self._by_tag[tag.lower()].add(email_id)
+                self._tag_names.setdefault(tag.lower(), tag)
+            if domain:
+                self._by_domain[domain].add(email_id)
+            if timestamp is not None:
+                bisect.insort(self._timeline, (timestamp, email_id))
+
+    def remove(self, email_id) -> None:
+        """Drops an email from every index."""
+        with self._lock:
+            self._unindex(email_id)
+            self._position.pop(email_id, None)
+            self._source.pop(email_id, None)
+
+    def _unindex(self, email_id) -> None:
+        entry = self._entries.pop(email_id, None)
+        if entry is None:
+            return
+        _, tags, domain, timestamp = entry
+        self._unread.discard(email_id)
+        for tag in tags:
+            ids = self._by_tag.get(tag.lower())
+            if ids is not None:
+                ids.discard(email_id)
+                if not ids:
+                    del self._by_tag[tag.lower()]
+                    self._tag_names.pop(tag.lower(), None)
+        if domain:
+            ids = self._by_domain.get(domain)
+            if ids is not None:
+                ids.discard(email_id)
+                if not ids:
+                    del self._by_domain[domain]
+        if timestamp is not None:
+            ind = bisect.bisect_left(self._timeline, (timestamp, email_id))
+            if ind < len(self._timeline) and self._timeline[ind] == (timestamp, email_id):
+                del self._timeline[ind]
+
+    def sync(self, emails: list) -> None:
+        """Brings the index in line with a full inbox list, re-indexing only what changed."""
+        with self._lock:
+            seen = set()
+            for position, email in enumerate(emails):
+                email_id = email.get("id")
+                if email_id is None:
+                    continue
+                seen.add(email_id)
+                if self._source.get(email_id) is email and self._position.get(email_id) == position:
+                    continue
+                self.upsert(email, position)
+            for email_id in set(self._position) - seen:
+                self.remove(email_id)
+
+    def positions(self, ids: list) -> list:
+        """Maps email ids to their positions in the inbox list last passed to sync()."""
+        with self._lock:
+            return [self._position[email_id] for email_id in ids]
+
+    def tags(self) -> list:
+        """Returns every tag currently in use, sorted by name."""
+        with self._lock:
+            return sorted(self._tag_names.values(), key=str.lower)
+
+    def domains(self) -> list:
+        """Returns every sender domain currently in use, sorted."""
+        with self._lock:
+            return sorted(self._by_domain)
+
+    def query(self, unread: bool = None, tags=None, domain: str = None, since: datetime = None, until: datetime = None) -> list:
+        """
+        Returns the ids matching every given filter, in inbox order.
+
+        Args:
+            unread: True for unread emails only, False for read emails only.
+            tags: Emails carrying any of these tags (case-insensitive).
+            domain: Sender domain, e.g. 'hdfcbank.net'.
+            since / until: Inclusive bounds on the email timestamp.
+        """
+        with self._lock:
+            candidates = []
+            if unread is True:
+                candidates.append(self._unread)
+            elif unread is False:
+                candidates.append(set(self._entries) - self._unread)
+            if tags:
+                tagged = set()
+                for tag in tags:
+                    tagged |= self._by_tag.get(tag.lower(), set())
+                candidates.append(tagged)
+            if domain:
+                candidates.append(self._by_domain.get(domain.lower(), set()))
+            if since is not None or until is not None:
+                lo = 0 if since is None else bisect.bisect_left(self._timeline, (since,))
+                hi = len(self._timeline) if until is None else bisect.bisect_right(self._timeline, (until, chr(0x10FFFF)))
+                candidates.append({email_id for _, email_id in self._timeline[lo:hi]})
+
+            if not candidates:
+                ids = set(self._entries)
+            else:
+                # Intersect starting from the smallest set to keep the work proportional to the result
+                candidates.sort(key=len)
+                ids = set(candidates[0])
+                for other in candidates[1:]:
+                    ids &= other
+            return sorted(ids, key=self._position.__getitem__)
+
+    def last_days(self, days: int, reference_date: datetime = None) -> list:
+        """Returns the ids of emails received in the last `days` days."""
+        reference_date = reference_date or datetime.now()
+        return self.query(since=reference_date - timedelta(days=days))
+
+
+_shared_index = None
+_shared_index_lock = threading.Lock()
+
+
+def get_inbox_index() -> InboxIndex:
+    """Returns the process-wide index used by the services layer, creating it on first use."""
+    global _shared_index
+    with _shared_index_lock:
+        if _shared_index is None:
+            _shared_index = InboxIndex()
+        return _shared_index
+
+
+_DAYS_PATTERN = re.compile(r"\b(?:last|past)\s+(\d+)\s+days?\b", re.IGNORECASE)
+
+
+def infer_query_filters(query: str, index: InboxIndex, reference_date: datetime = None) -> dict:
+    """
+    Extracts obvious filters from a natural-language question, for pre-filtering.
+
+    Recognizes "unread", "today", "yesterday", "this week", "last N days",
+    tag names that exist in the inbox and known sender domains, written out in
+    full ("hdfcbank.net", "@hdfcbank.net") or as "from <first label>" ("from
+    hdfcbank"); a bare label is too likely to be an ordinary word. Returns keyword
+    arguments for InboxIndex.query; an empty dict means no filter was recognized.
+    """
+    reference_date = reference_date or datetime.now()
+    lowered = query.lower()
+    filters = {}
+
+    if re.search(r"\bunread\b", lowered):
+        filters["unread"] = True
+
+    start_of_today = reference_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    match = _DAYS_PATTERN.search(lowered)
+    if match:
+        filters["since"] = reference_date - timedelta(days=int(match.group(1)))
+    elif re.search(r"\btoday\b", lowered):
+        filters["since"] = start_of_today
+    elif re.search(r"\byesterday\b", lowered):
+        filters["since"] = start_of_today - timedelta(days=1)
+        filters["until"] = start_of_today
+    elif re.search(r"\b(this|last|past)\s+week\b", lowered):
+        filters["since"] = reference_date - timedelta(days=7)
+
+    tags = [tag for tag in index.tags() if re.search(rf"\b{re.escape(tag.lower())}\b", lowered)]
+    if tags:
+        filters["tags"] = tags
+
+    for domain in index.domains():
+        if (re.search(rf"(?<![\w.-]){re.escape(domain)}(?![\w-])", lowered)
+                or re.search(rf"\bfrom\s+@?{re.escape(domain.split('.')[0])}\b", lowered)):
+            filters["domain"] = domain
+            break
+
+    return filters
@@ -0,0 +1,256 @@
+import os
+import threading
+import time
+
+from services.data_manager import (
+    HEAVY_FIELDS, load_payload, load_metadata, load_ids, count_records, fetch_records, update_fields, upsert_record,
+)
+from services.inbox_index import InboxIndex
+from services.prompt_registry import get_prompt_registry
+
+
+# For very large mailboxes: load only list metadata up front and fetch bodies on demand
+INBOX_LAZY_BODIES = os.getenv("INBOX_LAZY_BODIES", "0") == "1"
+
+# How often (at most) the store checks the database for emails added by others, e.g. the importer
+INBOX_REFRESH_SECONDS = float(os.getenv("INBOX_REFRESH_SECONDS", "5"))
+
+INBOX_FILE = "mock_inbox.json"
+
+# Fields written by a processing job (see services/jobs.py)
+JOB_RESULT_FIELDS = ("tags", "action_item", "tag_source", "cluster_of", "prompt_versions")
+
+
+class ConflictError(Exception):
+    """Raised when a write is based on a version that another session has since replaced."""
+
+
+def build_inbox_row(index: int, email: dict) -> dict:
+    """Precomputes everything an inbox list row needs to render."""
+    return {
+        "index": index,
+        "id": email["id"],
+        "name": email["name"],
+        "subject": email["subject"],
+        "tags": ", ".join(email["tags"]) if email.get("tags") else "",
+        "is_read": bool(email.get("is_read")),
+    }
+
+
+class InboxStore:
+    """
+    The one in-memory copy of the inbox, prompts and drafts, shared by every session.
+
+    Sessions only keep their own view state (selection, page, filters, chats) and
+    read emails from here, so memory grows with the inbox, not with sessions x inbox.
+
+    Email dicts handed out are never modified in place by writes: update() swaps in a
+    new dict, so a session rendering an email sees a consistent snapshot. Every email
+    and the prompts carry a version number; writes can pass the version they were
+    based on and get a ConflictError instead of silently overwriting another
+    session's change. Writes only touch the changed fields on disk (update_fields).
+    """
+
+    def __init__(self, collection: str = INBOX_FILE, lazy_bodies: bool = INBOX_LAZY_BODIES):
+        self.collection = collection
+        self.lazy_bodies = lazy_bodies
+        self._lock = threading.RLock()
+        self._record_count = count_records(collection)
+        self._checked_at = time.monotonic()
+        self.emails = load_metadata(collection) if lazy_bodies else load_payload(collection)
+        self._position = {email["id"]: position for position, email in enumerate(self.emails)}
+        # The database keys records by str(id); emails may use int ids
+        self._ids = {str(email_id): email_id for email_id in self._position}
+        self._versions = dict.fromkeys(self._position, 0)
+        self.rows = [build_inbox_row(position, email) for position, email in enumerate(self.emails)]
+        self.index = InboxIndex(self.emails)
+        self.drafts = load_payload("new_compose.json")
+        self._applied_jobs = set()
+
+    @property
+    def prompts(self) -> dict:
+        """The current prompts (kept by the prompt registry, which picks up edits to prompts.json)."""
+        return get_prompt_registry().prompts()
+
+    @property
+    def prompts_version(self) -> int:
+        return get_prompt_registry().current_version()
+
+    def get(self, email_id) -> dict:
+        """Returns the current version of an email (None if unknown)."""
+        position = self._position.get(email_id)
+        return None if position is None else self.emails[position]
+
+    def version(self, email_id) -> int:
+        return self._versions.get(email_id, 0)
+
+    def _replace(self, email_id, fields: dict, new_version: bool = True) -> dict:
+        """
+        Swaps in a copy of the email with `fields` applied (lock must be held).
+
+        Args:
+            new_version: False for fields that were only loaded, not changed (e.g. bodies).
+        """
+        position = self._position[email_id]
+        email = {**self.emails[position], **fields}
+        self.emails[position] = email
+        if new_version:
+            self._versions[email_id] += 1
+        self.rows[position] = build_inbox_row(position, email)
+        self.index.upsert(email, position)
+        return email
+
+    def update(self, email_id, fields: dict, expected_version: int = None) -> dict:
+        """
+        Changes fields of one email, in memory and on disk.
+
+        Args:
+            expected_version: The version the change was based on (see version()). If the
+                email has changed since, nothing is written and ConflictError is raised.
+
+        Returns:
+            dict: The updated email.
+        """
+        with self._lock:
+            if email_id not in self._position:
+                raise KeyError(email_id)
+            if expected_version is not None and self._versions[email_id] != expected_version:
+                raise ConflictError(f"Email {email_id} was changed by another session")
+            update_fields(self.collection, {email_id: fields})
+            return self._replace(email_id, fields)
+
+    def update_many(self, updates: dict) -> None:
+        """Changes fields of several emails at once, without version checks (e.g. derived digests)."""
+        with self._lock:
+            updates = {email_id: fields for email_id, fields in updates.items() if email_id in self._position and fields}
+            update_fields(self.collection, updates)
+            for email_id, fields in updates.items():
+                self._replace(email_id, fields)
+
+    def _merge(self, stored: dict, fields: tuple) -> None:
+        """Applies the given fields of stored records (keyed by str id) that differ from memory."""
+        with self._lock:
+            for key, record in stored.items():
+                email_id = self._ids.get(key)
+                if email_id is None:
+                    continue
+                position = self._position[email_id]
+                changed = {field: record.get(field) for field in fields if record.get(field) != self.emails[position].get(field)}
+                if changed:
+                    self._replace(email_id, changed)
+
+    def load_new(self, force: bool = False) -> int:
+        """
+        Appends emails stored since the inbox was loaded (e.g. by the importer or another
+        server process), so they show up without a restart.
+
+        Checks at most every INBOX_REFRESH_SECONDS unless `force` is set, and only reads
+        records when the collection's record count changed.
+
+        Returns:
+            int: The number of emails added.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < INBOX_REFRESH_SECONDS:
+            return 0
+        with self._lock:
+            self._checked_at = now
+            count = count_records(self.collection)
+            if count == self._record_count:
+                return 0
+            self._record_count = count
+            new_ids = [rid for rid in load_ids(self.collection) if rid not in self._ids]
+            stored = fetch_records(self.collection, new_ids, metadata_only=self.lazy_bodies)
+            added = [stored[rid] for rid in new_ids if rid in stored]
+            # New lists are swapped in, so sessions iterating the old ones aren't disturbed
+            emails, rows = self.emails + added, list(self.rows)
+            for position, email in enumerate(added, start=len(self.emails)):
+                self._position[email["id"]] = position
+                self._ids[str(email["id"])] = email["id"]
+                self._versions[email["id"]] = 0
+                rows.append(build_inbox_row(position, email))
+                self.index.upsert(email, position)
+            self.emails, self.rows = emails, rows
+            return len(added)
+
+    def reload(self, email_ids: list, fields: tuple) -> None:
+        """Pulls fields written to disk by someone else (e.g. the background worker) into memory."""
+        self._merge(fetch_records(self.collection, email_ids), fields)
+
+    def apply_job_results(self, job_id: str) -> None:
+        """Loads a finished processing job's results, once per job however many sessions ask."""
+        with self._lock:
+            if job_id in self._applied_jobs:
+                return
+            self._applied_jobs.add(job_id)
+        self.load_new(force=True)
+        # Job results are list metadata, so the bodies don't need to be read
+        self._merge({str(record["id"]): record for record in load_metadata(self.collection)}, JOB_RESULT_FIELDS)
+
+    def fetch(self, email_ids: list) -> dict:
+        """Reads full stored records (bodies included) without keeping them in the store. Maps str(id) -> record."""
+        return fetch_records(self.collection, email_ids)
+
+    def iter_full(self, batch_size: int = 500):
+        """
+        Yields the emails in batches as full records, so a pass over every body never
+        holds more than one batch of bodies. The dicts are copies: write changes back
+        with update_many().
+        """
+        emails = list(self.emails)
+        for start in range(0, len(emails), batch_size):
+            batch = emails[start:start + batch_size]
+            missing = [email["id"] for email in batch if "body" not in email]
+            stored = self.fetch(missing) if missing else {}
+            yield [{**stored.get(str(email["id"]), {}), **email} for email in batch]
+
+    def ensure_bodies(self, emails: list) -> list:
+        """
+        Fetches bodies (and other heavy fields) for emails that were loaded as metadata only.
+
+        The fields are swapped in like any other change (see update()), without a new
+        version, so the given dicts are left as they are.
+
+        Returns:
+            list: The emails with their bodies, in the same order.
+        """
+        missing = [email["id"] for email in emails if "body" not in email]
+        if not missing:
+            return emails
+        stored = self.fetch(missing)
+        with self._lock:
+            for email_id in missing:
+                record = stored.get(str(email_id))
+                if record is not None and email_id in self._position and "body" not in self.emails[self._position[email_id]]:
+                    self._replace(email_id, {field: record[field] for field in HEAVY_FIELDS if field in record}, new_version=False)
+            return [self.get(email["id"]) or email for email in emails]
+
+    def save_prompts(self, prompts: dict, expected_version: int = None) -> int:
+        """
+        Replaces the prompts for everyone.
+
+        Returns:
+            int: The new prompts version.
+        """
+        with self._lock:
+            if expected_version is not None and expected_version != self.prompts_version:
+                raise ConflictError("The prompts were changed by another session")
+            return get_prompt_registry().save(prompts)
+
+    def add_draft(self, draft: dict) -> None:
+        with self._lock:
+            upsert_record("new_compose.json", draft)
+            self.drafts = self.drafts + [draft]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_inbox_store() -> InboxStore:
+    """Returns the process-wide store shared by all Streamlit sessions, loading it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = InboxStore()
+        return _store
@@ -0,0 +1,600 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from services.data_manager import DB_PATH, fetch_records, update_fields
+from services.llm_services import process_emails_batch, generate_auto_reply, DEFAULT_MAX_CONCURRENCY
+from services.clustering import cluster_key, cluster_keys, CLUSTERING_ENABLED
+from services.prompt_registry import result_version, result_versions
+from services.utils import format_email
+
+
+# Emails handled per step; results are persisted (and progress advanced) after each step
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "16"))
+
+# A running job whose worker hasn't reported for this long is assumed dead and picked up again
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "300"))
+
+# How often an idle worker checks the table for jobs enqueued by other processes
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+
+# Emails read at a time while a job is clustered
+CLUSTER_LOAD_BATCH_SIZE = 500
+
+# After processing, draft replies in the background for emails carrying any of these tags,
+# so "Generate Reply" can show them instantly. Off by default: it spends quota on replies
+# that may never be opened.
+SPECULATIVE_REPLIES_ENABLED = os.getenv("SPECULATIVE_REPLIES_ENABLED", "0") == "1"
+SPECULATIVE_REPLY_TAGS = {tag.strip().lower() for tag in os.getenv("SPECULATIVE_REPLY_TAGS", "To-Do,Important").split(",") if tag.strip()}
+
+ACTIVE_STATUSES = ("queued", "running")
+PROCESS_EMAILS = "process_emails"
+PREGENERATE_REPLIES = "pregenerate_replies"
+
+_JOB_COLUMNS = "id, kind, collection, status, params, total, completed, failed, error, created_at, updated_at"
+
+_local = threading.local()
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Returns this thread's connection to the job tables (stored alongside the inbox)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                collection TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                completed INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        # At most one queued/running job per kind and collection, enforced by SQLite
+        # itself so concurrent sessions (or processes) can't both start one
+        conn.execute(
+            """CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active ON jobs(kind, collection)
+               WHERE status IN ('queued', 'running')"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                rid TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                PRIMARY KEY (job_id, rid)
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_job_items_pending ON job_items(job_id, status, position)")
+        # Representative of the item's thread / near-duplicate cluster (see _cluster_job_items)
+        if "cluster_of" not in {column for _, column, *_ in conn.execute("PRAGMA table_info(job_items)")}:
+            conn.execute("ALTER TABLE job_items ADD COLUMN cluster_of TEXT")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def _row_to_job(row) -> dict:
+    if row is None:
+        return None
+    job = dict(zip(_JOB_COLUMNS.split(", "), row))
+    job["params"] = json.loads(job["params"])
+    return job
+
+
+def get_job(job_id: str) -> dict:
+    """Returns a job's current state (status, total, completed, failed, error), or None."""
+    row = _get_connection().execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row)
+
+
+def get_latest_job(kind: str = PROCESS_EMAILS, collection: str = "mock_inbox.json") -> dict:
+    """Returns the most recently created job of a kind for a collection, or None."""
+    row = _get_connection().execute(
+        f"SELECT {_JOB_COLUMNS} FROM jobs WHERE kind = ? AND collection = ? ORDER BY created_at DESC LIMIT 1",
+        (kind, collection),
+    ).fetchone()
+    return _row_to_job(row)
+
+
+def _active_job(kind: str, collection: str) -> dict:
+    row = _get_connection().execute(
+        f"SELECT {_JOB_COLUMNS} FROM jobs WHERE kind = ? AND collection = ? AND status IN ('queued', 'running')",
+        (kind, collection),
+    ).fetchone()
+    return _row_to_job(row)
+
+
+def _insert_job(kind: str, collection: str, params: dict, item_ids: list) -> str:
+    """Creates a queued job with its items; raises sqlite3.IntegrityError if one of this kind is already active."""
+    conn = _get_connection()
+    now = time.time()
+    job_id = f"job_{uuid.uuid4().hex[:12]}"
+    with conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, collection, status, params, total, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, kind, collection, json.dumps(params), len(item_ids), now, now),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO job_items (job_id, rid, position) VALUES (?, ?, ?)",
+            [(job_id, str(item_id), position) for position, item_id in enumerate(item_ids)],
+        )
+    start_worker()
+    _wakeup.set()
+    return job_id
+
+
+def _add_job_items(conn: sqlite3.Connection, job: dict, item_ids: list, params: dict, requeue_finished: bool = False) -> int:
+    """
+    Adds items to an active job behind the ones it already has and switches it to params
+    (inside the caller's transaction).
+
+    Args:
+        requeue_finished: Also put items the job already finished back in the queue
+            (e.g. because they were processed with other instructions).
+
+    Returns:
+        int: The number of items added or re-queued.
+    """
+    start = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM job_items WHERE job_id = ?", (job["id"],)).fetchone()[0]
+    if requeue_finished:
+        conflict = "ON CONFLICT (job_id, rid) DO UPDATE SET status = 'pending', position = excluded.position, cluster_of = NULL WHERE job_items.status != 'pending'"
+    else:
+        conflict = "ON CONFLICT (job_id, rid) DO NOTHING"
+    added = 0
+    for offset, item_id in enumerate(item_ids):
+        added += conn.execute(
+            f"INSERT INTO job_items (job_id, rid, position) VALUES (?, ?, ?) {conflict}",
+            (job["id"], str(item_id), start + offset),
+        ).rowcount
+    conn.execute(
+        "UPDATE jobs SET params = ?, total = total + ?, updated_at = ? WHERE id = ?",
+        (json.dumps(params), added, time.time(), job["id"]),
+    )
+    return added
+
+
+def enqueue_processing_job(email_ids: list, categorization: str, action_extraction: str,
+                           collection: str = "mock_inbox.json", fused: bool = True, packed: bool = False,
+                           auto_reply: str = None, cluster: bool = CLUSTERING_ENABLED) -> dict:
+    """
+    Queues categorization and action extraction for the given emails.
+
+    Only one processing job can be active per collection: if one is already queued
+    or running (started by any session), the emails are added to that job, which
+    switches to these settings. Emails it already processed with other instructions
+    are queued again.
+
+    Args:
+        auto_reply: The auto-reply instructions. When given and SPECULATIVE_REPLIES_ENABLED
+            is set, replies are pre-generated once processing finishes (see enqueue_reply_job).
+        cluster: Send only one email per thread / near-duplicate group to the LLM; the
+            whole job is clustered before its first step (see _cluster_job_items).
+
+    Returns:
+        dict: The job (see get_job). 'merged' is True if the emails were added to a job
+        that was already active.
+    """
+    params = {"categorization": categorization, "action_extraction": action_extraction, "fused": fused, "packed": packed,
+              "auto_reply": auto_reply, "cluster": cluster, "clustered": False}
+    try:
+        job_id = _insert_job(PROCESS_EMAILS, collection, params, email_ids)
+    except sqlite3.IntegrityError:
+        conn = _get_connection()
+        with conn:
+            job = _active_job(PROCESS_EMAILS, collection)
+            if job is None:
+                # The active job finished in between; try again
+                return enqueue_processing_job(email_ids, categorization, action_extraction, collection, fused, packed,
+                                              auto_reply, cluster)
+            # Items added later aren't part of the job's clusters; they are processed on their own
+            merged = dict(params, clustered=job["params"].get("clustered", False))
+            changed = result_versions(merged) != result_versions(job["params"])
+            _add_job_items(conn, job, email_ids, merged, requeue_finished=changed)
+        _wakeup.set()
+        return dict(get_job(job["id"]), merged=True)
+    return dict(get_job(job_id), merged=False)
+
+
+def retry_job(job_id: str) -> dict:
+    """
+    Queues the items a failed or cancelled job didn't get to, as a new job with the
+    same settings (or added to the active job of its kind, if there is one).
+
+    Returns:
+        dict: The job now handling the items (see get_job), or None if nothing was left.
+    """
+    job = get_job(job_id)
+    if job is None or job["status"] in ACTIVE_STATUSES:
+        return job
+    item_ids = [rid for (rid,) in _get_connection().execute(
+        "SELECT rid FROM job_items WHERE job_id = ? AND status = 'pending' ORDER BY position", (job_id,)
+    )]
+    if not item_ids:
+        return None
+    params = dict(job["params"], clustered=False) if "clustered" in job["params"] else job["params"]
+    try:
+        return get_job(_insert_job(job["kind"], job["collection"], params, item_ids))
+    except sqlite3.IntegrityError:
+        conn = _get_connection()
+        with conn:
+            active = _active_job(job["kind"], job["collection"])
+            if active is None:
+                return retry_job(job_id)
+            _add_job_items(conn, active, item_ids, active["params"])
+        _wakeup.set()
+        return get_job(active["id"])
+
+
+def reply_is_current(email: dict, auto_reply: str) -> bool:
+    """
+    True if the email's stored reply should be kept: it was written or edited by the
+    user, or it was generated with the current auto-reply instructions.
+    """
+    if not email.get("reply"):
+        return False
+    if email.get("reply_source") != "speculative":
+        return True
+    return email.get("reply_prompt") == result_version("reply", {"auto_reply": auto_reply})
+
+
+def wants_speculative_reply(email: dict, auto_reply: str) -> bool:
+    """True if the email matches SPECULATIVE_REPLY_TAGS and has no usable reply yet."""
+    tags = {str(tag).strip().lower() for tag in email.get("tags") or ()}
+    return bool(tags & SPECULATIVE_REPLY_TAGS) and not reply_is_current(email, auto_reply)
+
+
+def enqueue_reply_job(email_ids: list, auto_reply: str, collection: str = "mock_inbox.json") -> dict:
+    """
+    Queues background reply drafts for the given emails.
+
+    The worker only drafts replies for emails that match SPECULATIVE_REPLY_TAGS and
+    don't already have a current reply, so it is safe to pass more ids than needed.
+    If a reply job is already active for the collection, the emails are added to it
+    and it switches to the new instructions.
+
+    Returns:
+        dict: The job (see get_job).
+    """
+    params = {"auto_reply": auto_reply}
+    try:
+        job_id = _insert_job(PREGENERATE_REPLIES, collection, params, email_ids)
+    except sqlite3.IntegrityError:
+        conn = _get_connection()
+        with conn:
+            job = _active_job(PREGENERATE_REPLIES, collection)
+            if job is None:
+                return enqueue_reply_job(email_ids, auto_reply, collection)
+            _add_job_items(conn, job, email_ids, params)
+        _wakeup.set()
+        job_id = job["id"]
+    return get_job(job_id)
+
+
+def cancel_job(job_id: str) -> None:
+    """Stops a queued or running job after its current step. Results saved so far are kept."""
+    conn = _get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+            (time.time(), job_id),
+        )
+
+
+def _claim_next_job() -> dict:
+    """Atomically marks the oldest runnable job as running and returns it (None if there is none)."""
+    conn = _get_connection()
+    now = time.time()
+    # BEGIN IMMEDIATE takes the write lock up front, so two workers can't claim the same job
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            f"""SELECT {_JOB_COLUMNS} FROM jobs
+                WHERE status = 'queued' OR (status = 'running' AND updated_at < ?)
+                ORDER BY created_at LIMIT 1""",
+            (now - JOB_STALE_SECONDS,),
+        ).fetchone()
+        if row is not None:
+            conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (now, row[0]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return _row_to_job(row)
+
+
+def _pending_items(job_id: str, limit: int) -> list:
+    rows = _get_connection().execute(
+        "SELECT rid FROM job_items WHERE job_id = ? AND status = 'pending' ORDER BY position LIMIT ?",
+        (job_id, limit),
+    ).fetchall()
+    return [rid for (rid,) in rows]
+
+
+def _cluster_job_items(job: dict) -> None:
+    """
+    Groups all of a job's pending emails into threads / near-duplicate clusters, once,
+    before any of them is sent (see services/clustering.py).
+
+    Bodies are read a chunk at a time and only their fingerprints are kept. Members
+    remember their representative and are moved behind all representatives, so the
+    representatives' results exist by the time the members come up.
+    """
+    conn = _get_connection()
+    ids = [rid for (rid,) in conn.execute(
+        "SELECT rid FROM job_items WHERE job_id = ? AND status = 'pending' ORDER BY position", (job["id"],)
+    )]
+    found, keys = [], []
+    for start in range(0, len(ids), CLUSTER_LOAD_BATCH_SIZE):
+        records = fetch_records(job["collection"], ids[start:start + CLUSTER_LOAD_BATCH_SIZE])
+        for rid in ids[start:start + CLUSTER_LOAD_BATCH_SIZE]:
+            if rid in records:
+                found.append(rid)
+                keys.append(cluster_key(records[rid]))
+    member_of = {found[ind]: found[rep] for ind, rep in cluster_keys(keys).items()}
+    order = [rid for rid in ids if rid not in member_of] + [rid for rid in ids if rid in member_of]
+    params = dict(job["params"], clustered=True)
+    with conn:
+        conn.executemany(
+            "UPDATE job_items SET position = ?, cluster_of = ? WHERE job_id = ? AND rid = ?",
+            [(position, member_of.get(rid), job["id"], rid) for position, rid in enumerate(order)],
+        )
+        conn.execute("UPDATE jobs SET params = ? WHERE id = ?", (json.dumps(params), job["id"]))
+    job["params"] = params
+
+
+def _cluster_members(job_id: str, ids: list) -> dict:
+    """Maps the given items that belong to a cluster to their representative's id."""
+    placeholders = ", ".join("?" for _ in ids)
+    rows = _get_connection().execute(
+        f"SELECT rid, cluster_of FROM job_items WHERE job_id = ? AND rid IN ({placeholders}) AND cluster_of IS NOT NULL",
+        (job_id, *ids),
+    ).fetchall()
+    return dict(rows)
+
+
+def _finish_items(job_id: str, done: list, skipped: list) -> bool:
+    """
+    Marks a step's items as finished and advances the job's progress.
+
+    Returns:
+        bool: False if the job was cancelled in the meantime.
+    """
+    conn = _get_connection()
+    with conn:
+        conn.executemany("UPDATE job_items SET status = 'done' WHERE job_id = ? AND rid = ?", [(job_id, rid) for rid in done])
+        conn.executemany("UPDATE job_items SET status = 'skipped' WHERE job_id = ? AND rid = ?", [(job_id, rid) for rid in skipped])
+        updated = conn.execute(
+            "UPDATE jobs SET completed = completed + ?, failed = failed + ?, updated_at = ? WHERE id = ? AND status = 'running'",
+            (len(done), len(skipped), time.time(), job_id),
+        ).rowcount
+    return bool(updated)
+
+
+def _complete_job(job_id: str) -> bool:
+    """
+    Marks a running job done, unless items were added to it since the last step.
+
+    Returns:
+        bool: False if there is more work (or the job was cancelled in the meantime).
+    """
+    conn = _get_connection()
+    with conn:
+        updated = conn.execute(
+            """UPDATE jobs SET status = 'done', error = NULL, updated_at = ?
+               WHERE id = ? AND status = 'running'
+               AND NOT EXISTS (SELECT 1 FROM job_items WHERE job_id = ? AND status = 'pending')""",
+            (time.time(), job_id, job_id),
+        ).rowcount
+    return bool(updated)
+
+
+def _set_status(job_id: str, status: str, error: str = None) -> None:
+    conn = _get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+            (status, error, time.time(), job_id),
+        )
+
+
+def _stamp(result: dict, versions: dict) -> dict:
+    """
+    The prompt versions to record for a result; failed parts aren't stamped, so they count as stale.
+    Tags from the local classifier get the version its training tags were made with.
+    """
+    failed = {"tags"} if not result.get("tags") else set()
+    if not result.get("action_item") or "error" in result["action_item"]:
+        failed.add("action_item")
+    stamp = {name: version for name, version in versions.items() if name not in failed}
+    if result.get("tag_source") == "local" and result.get("tags_version") != stamp.get("tags"):
+        stamp.pop("tags", None)
+    return stamp
+
+
+def _representative_tags(collection: str, member_of: dict, tags_version: str) -> dict:
+    """
+    The tags cluster members take from their representative's stored result, as
+    (tags, representative id). Members whose representative has no current tags
+    (deleted, or its step failed) are left out, so they get processed on their own.
+    """
+    stored = fetch_records(collection, sorted(set(member_of.values()), key=str))
+    known = {}
+    for rid, rep in member_of.items():
+        representative = stored.get(str(rep))
+        if (representative and representative.get("tags")
+                and (representative.get("prompt_versions") or {}).get("tags") == tags_version):
+            known[rid] = (representative["tags"], representative["id"])
+    return known
+
+
+def _run_processing_job(job: dict) -> None:
+    """Processes a job's pending emails step by step, saving each step's results as it completes."""
+    if job["params"].get("cluster") and not job["params"].get("clustered"):
+        _cluster_job_items(job)
+    collection = job["collection"]
+    while True:
+        # Re-read the settings every step: enqueue_processing_job may have changed them
+        params = job["params"] = get_job(job["id"])["params"]
+        ids = _pending_items(job["id"], JOB_CHUNK_SIZE)
+        if not ids:
+            if _complete_job(job["id"]) and SPECULATIVE_REPLIES_ENABLED and params.get("auto_reply"):
+                _enqueue_job_replies(job)
+            return
+
+        # Emails deleted since the job was queued are skipped
+        records = fetch_records(collection, ids)
+        skipped = [rid for rid in ids if rid not in records]
+        # Cluster members sit behind all representatives (see _cluster_job_items)
+        member_of = _cluster_members(job["id"], ids) if params.get("clustered") else {}
+        versions = result_versions(params)
+        _process_step(collection, params, versions, [records[rid] for rid in ids if rid in records and rid not in member_of])
+        # Members take their representative's tags and only get action extraction
+        members = [rid for rid in member_of if rid in records]
+        known = _representative_tags(collection, {rid: member_of[rid] for rid in members}, versions["tags"])
+        _process_step(collection, params, versions, [records[rid] for rid in members],
+                      cluster_tags={position: known[rid] for position, rid in enumerate(members) if rid in known})
+        if not _finish_items(job["id"], [rid for rid in ids if rid in records], skipped):
+            return
+
+
+def _process_step(collection: str, params: dict, versions: dict, emails: list, cluster_tags: dict = None) -> None:
+    """Sends one step's emails to the LLM and saves the results (see process_emails_batch for cluster_tags)."""
+    if not emails:
+        return
+    results = process_emails_batch(
+        emails,
+        params["categorization"],
+        params["action_extraction"],
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        fused=params.get("fused", True),
+        packed=params.get("packed", False),
+        # Jobs clustered up front only get representatives (and orphaned members) here
+        cluster=params.get("cluster", CLUSTERING_ENABLED) and not params.get("clustered"),
+        cluster_tags=cluster_tags,
+    )
+    _save_results(collection, versions, {email["id"]: result for email, result in zip(emails, results)})
+
+
+def _save_results(collection: str, versions: dict, results: dict) -> None:
+    """
+    Writes processing results, keyed by email id. Only the result fields are written, so edits
+    made meanwhile (e.g. read state) survive. Each result is stamped with the prompt versions
+    that produced it (see services/prompt_registry.py).
+    """
+    update_fields(collection, {
+        email_id: {"tags": result["tags"], "action_item": result["action_item"], "tag_source": result["tag_source"],
+                   "cluster_of": result.get("cluster_of"), "prompt_versions": _stamp(result, versions)}
+        for email_id, result in results.items()
+    })
+
+
+def _enqueue_job_replies(job: dict) -> None:
+    """Queues reply drafts for the emails of a finished processing job that were tagged for one."""
+    conn = _get_connection()
+    ids = [rid for (rid,) in conn.execute(
+        "SELECT rid FROM job_items WHERE job_id = ? AND status = 'done' ORDER BY position", (job["id"],)
+    )]
+    auto_reply = job["params"]["auto_reply"]
+    records = fetch_records(job["collection"], ids)
+    wanted = [rid for rid in ids if rid in records and wants_speculative_reply(records[rid], auto_reply)]
+    if wanted:
+        enqueue_reply_job(wanted, auto_reply, job["collection"])
+
+
+def _draft_reply(email: dict, auto_reply: str):
+    """Drafts one speculative reply; returns None on failure, as a missing draft is only a cache miss."""
+    try:
+        return generate_auto_reply(format_email(email), auto_reply, email.get("tags"), speculative=True)
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def _run_reply_job(job: dict) -> None:
+    """Drafts replies for a job's pending emails, a step at a time, without touching user-made replies."""
+    collection = job["collection"]
+    with ThreadPoolExecutor(max_workers=DEFAULT_MAX_CONCURRENCY) as executor:
+        while True:
+            ids = _pending_items(job["id"], JOB_CHUNK_SIZE)
+            if not ids:
+                if _complete_job(job["id"]):
+                    return
+                if get_job(job["id"])["status"] != "running":
+                    return
+                continue
+
+            # Re-read the instructions every step: enqueue_reply_job may have changed them
+            auto_reply = get_job(job["id"])["params"]["auto_reply"]
+            records = fetch_records(collection, ids)
+            emails = [records[rid] for rid in ids if rid in records and wants_speculative_reply(records[rid], auto_reply)]
+            replies = list(executor.map(lambda email: _draft_reply(email, auto_reply), emails))
+
+            # The user may have generated or edited a reply while we were drafting; theirs wins
+            latest = fetch_records(collection, [email["id"] for email in emails])
+            prompt_version = result_version("reply", {"auto_reply": auto_reply})
+            update_fields(collection, {
+                email["id"]: {"reply": reply, "reply_prompt": prompt_version, "reply_source": "speculative"}
+                for email, reply in zip(emails, replies)
+                if reply and email["id"] in latest and latest[email["id"]].get("reply") == email.get("reply")
+            })
+            failed = [email["id"] for email, reply in zip(emails, replies) if not reply]
+            done = [rid for rid in ids if rid in records and rid not in failed]
+            skipped = [rid for rid in ids if rid not in records] + failed
+            if not _finish_items(job["id"], done, skipped):
+                return
+
+
+def _run_worker() -> None:
+    """Worker loop: runs queued jobs one at a time, forever."""
+    while True:
+        try:
+            job = _claim_next_job()
+        except sqlite3.OperationalError:
+            # Database busy; try again on the next tick
+            job = None
+        if job is None:
+            _wakeup.wait(JOB_POLL_SECONDS)
+            _wakeup.clear()
+            continue
+        try:
+            if job["kind"] == PROCESS_EMAILS:
+                _run_processing_job(job)
+            elif job["kind"] == PREGENERATE_REPLIES:
+                _run_reply_job(job)
+            else:
+                _set_status(job["id"], "failed", f"Unknown job kind: {job['kind']}")
+        except Exception as e:
+            traceback.print_exc()
+            _set_status(job["id"], "failed", str(e))
+
+
+def start_worker() -> None:
+    """
+    Starts this process's background worker thread (no-op if it is already running).
+
+    The worker lives outside the Streamlit script run, so jobs keep going when a
+    page is reloaded or closed. Jobs left running by a dead process are resumed
+    from their first unfinished email once they go stale.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name="email-job-worker", daemon=True)
+            _worker.start()
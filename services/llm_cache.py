@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from services.data_manager import BASE_DIR
+
+
+# The cache lives next to the other data files but is never committed
+CACHE_PATH = BASE_DIR / "llm_cache.sqlite3"
+
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Sampling at temperature > 0 is meant to vary, so those calls skip the cache by default
+CACHE_NONZERO_TEMPERATURE = os.getenv("LLM_CACHE_NONZERO_TEMPERATURE", "0") == "1"
+
+
+def make_cache_key(model: str, temperature: float, rendered_prompt: str, json_mode: bool = False) -> str:
+    """
+    Builds a content-addressed key for one LLM call.
+
+    The rendered prompt already contains the instructions and the input text,
+    so identical (model, temperature, prompt, json_mode) calls map to the same key.
+    JSON mode is part of the key because it changes what the model may answer.
+    """
+    payload = json.dumps([model, float(temperature), rendered_prompt, bool(json_mode)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    On-disk LRU cache for LLM completions, backed by SQLite.
+
+    Entries expire after ttl_seconds, and once more than max_entries are stored the
+    least recently used ones are evicted. A single connection is shared behind a lock
+    so the cache can be used from the bulk processing worker threads.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: int = CACHE_TTL_SECONDS):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+            self._conn.commit()
+
+    def get(self, key: str):
+        """Returns the cached completion for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return value
+
+    def set(self, key: str, model: str, value: str) -> None:
+        """Stores a completion and evicts least recently used entries over the limit."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, model, value, now, now),
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,),
+                )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Drops every cached completion."""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache:
+    """Returns the process-wide cache instance, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def cache_allowed(temperature: float) -> bool:
+    """Decides whether a call at this temperature may be served from / stored in the cache."""
+    if not CACHE_ENABLED:
+        return False
+    return temperature == 0.0 or CACHE_NONZERO_TEMPERATURE
@@ -0,0 +1,98 @@
+import os
+import threading
+
+import httpx
+from langchain_groq import ChatGroq
+
+
+# Models used across the app. The 8b model handles high-volume, structured work
+# (categorization, extraction); the 70b model handles writing and reasoning.
+FAST_MODEL = "llama-3.1-8b-instant"
+SMART_MODEL = "llama-3.3-70b-versatile"
+
+# Size of the shared keep-alive pool. It should be at least as large as the
+# bulk processing concurrency so workers never wait on a free connection.
+HTTP_MAX_CONNECTIONS = int(os.getenv("GROQ_HTTP_MAX_CONNECTIONS", "32"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("GROQ_HTTP_TIMEOUT_SECONDS", "60"))
+
+_clients = {}
+_http_client = None
+_factory = None
+_lock = threading.Lock()
+
+
+def _get_http_client() -> httpx.Client:
+    """Returns the process-wide HTTP client (must be called with _lock held)."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+            timeout=HTTP_TIMEOUT_SECONDS,
+        )
+    return _http_client
+
+
+def get_llm(model: str, temperature: float, json_mode: bool = False) -> ChatGroq:
+    """
+    Returns a shared ChatGroq client for the given model and temperature.
+
+    With json_mode, the client asks Groq for JSON mode, which guarantees the answer
+    is a syntactically valid JSON object (the prompt must ask for JSON).
+
+    Clients are created once per (model, temperature, json_mode) and reused for the life of
+    the process, across threads and Streamlit sessions. They all sit on the same
+    keep-alive HTTP connection pool, so the TLS handshake and client construction
+    are paid once instead of on every request.
+    """
+    key = (model, float(temperature), bool(json_mode))
+    llm = _clients.get(key)
+    if llm is not None:
+        return llm
+
+    with _lock:
+        llm = _clients.get(key)
+        if llm is None:
+            if _factory is not None:
+                llm = _factory(model, temperature)
+            else:
+                api_key = os.getenv("GROQ_API_KEY")
+                if not api_key:
+                    raise RuntimeError("Groq API Key is absent")
+                llm = ChatGroq(
+                    model=model,
+                    groq_api_key=api_key,
+                    temperature=temperature,
+                    http_client=_get_http_client(),
+                    model_kwargs={"response_format": {"type": "json_object"}} if json_mode else {},
+                )
+            _clients[key] = llm
+    return llm
+
+
+def is_json_mode(llm) -> bool:
+    """True if the client was created with json_mode (see get_llm)."""
+    return bool((getattr(llm, "model_kwargs", None) or {}).get("response_format"))
+
+
+def reset_llm_clients() -> None:
+    """Drops all cached clients, e.g. after the API key has changed."""
+    global _http_client
+    with _lock:
+        _clients.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+
+def set_llm_factory(factory=None) -> None:
+    """
+    Makes get_llm build clients with factory(model, temperature) instead of ChatGroq.
+
+    The replacement must offer the parts of the ChatGroq interface we use
+    (model_name, temperature, invoke() and stream()). Used by the offline
+    benchmarks; pass None to go back to Groq. Existing clients are dropped.
+    """
+    global _factory
+    reset_llm_clients()
+    with _lock:
+        _factory = factory
@@ -1,254 +1,832 @@
-from langchain_groq import ChatGroq
+import json
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from langchain_core.prompts import PromptTemplate
-from services.utils import parse_json_output, parse_list_output
+from langchain_groq import ChatGroq
+from services.llm_client import get_llm, is_json_mode, FAST_MODEL, SMART_MODEL
+from services.llm_cache import get_cache, cache_allowed, make_cache_key
+from services.inbox_index import InboxIndex, get_inbox_index, infer_query_filters
+from services.retrieval import get_inbox_retriever
+from services.classifier import get_classifier_service, CLASSIFIER_ENABLED
+from services.telemetry import LLMCall, parse_succeeded, record_event
+from services.rate_limiter import get_rate_limiter, wait_before_retry, COMPLETION_TOKEN_RESERVE, BULK, INTERACTIVE
+from services.routing import route, check_format, check_prefix, record_escalation, STREAM_CHECK_CHARS
+from services.prompt_templates import (
+    EMAIL_QUERY_PROMPT, CATEGORIZATION_PROMPT, ACTION_EXTRACTION_PROMPT, FUSED_PROCESSING_PROMPT,
+    PACKED_PROCESSING_PROMPT, AUTO_REPLY_PROMPT, GLOBAL_QUERY_PROMPT, DRAFT_PROMPT, DIGEST_PROMPT,
+    DIGEST_REDUCE_PROMPT, CONVERSATION_SUMMARY_PROMPT, STRUCTURED_CATEGORIZATION_PROMPT, OUTPUT_REPAIR_PROMPT,
+)
+from services.schemas import (
+    allowed_tags, normalize_tags, tags_schema, fused_schema, ACTION_ITEM_SCHEMA,
+    validate_tags_output, validate_action_output, validate_fused_output, validate_packed_output,
+)
+from services.memory import ConversationMemory, MEMORY_SUMMARY_TOKENS
+from services.clustering import cluster_emails, CLUSTERING_ENABLED
+from services.prompt_registry import result_version
+from services.utils import pack_emails, format_email, estimate_tokens, content_hash
 
 # Load environment variables (API keys)
 load_dotenv()
 
-def process_email(email_body: str, instruction_text: str, temperature: float = 1.0):
+# Upper bound on simultaneous Groq requests during bulk processing.
+# Can be overridden per deployment without touching the code.
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("EMAIL_PROCESSING_CONCURRENCY", "8"))
+
+# Packed mode: how much email text (in estimated tokens) and how many emails
+# go into a single request. Keeping packs small also keeps the JSON answer short.
+PACKED_TOKEN_BUDGET = int(os.getenv("PACKED_TOKEN_BUDGET", "3000"))
+PACKED_MAX_EMAILS = int(os.getenv("PACKED_MAX_EMAILS", "10"))
+
+# Global Agent: how many emails (and estimated tokens of them) are sent per question
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "20"))
+GLOBAL_CONTEXT_TOKEN_BUDGET = int(os.getenv("GLOBAL_CONTEXT_TOKEN_BUDGET", "6000"))
+
+# Whole-inbox questions over a metadata-only inbox read bodies from disk this many emails at a time
+DIGEST_LOAD_BATCH_SIZE = 500
+
+# Request structured answers (tags, action items) in Groq's JSON mode, so they always arrive
+# as a JSON object. Off by default: it changes the categorization prompt and the output
+# format; answers are validated (and repaired) either way
+STRUCTURED_OUTPUT_ENABLED = os.getenv("STRUCTURED_OUTPUT_ENABLED", "0") == "1"
+
+# Answers that fail validation get one cheap repair request (the bad answer and the
+# schema, not the email) before falling back to reprocessing
+OUTPUT_REPAIR_ENABLED = os.getenv("OUTPUT_REPAIR_ENABLED", "1") == "1"
+
+# Calls made by background processing; they wait behind interactive calls (chat, replies, drafts)
+BULK_OPERATIONS = {"categorize_email", "extract_action_items", "categorize_and_extract", "categorize_and_extract_packed", "speculative_reply"}
+
+# Questions that need a view of the whole inbox rather than a few matching emails
+_WHOLE_INBOX_PATTERN = re.compile(r"\b(summar\w*|overview|recap|all|every\w*|unread|overall|whole|entire)\b", re.IGNORECASE)
+
+def _priority(operation: str) -> int:
+    """Bulk work yields to calls a user is waiting on when the rate limiter has a queue."""
+    return BULK if operation in BULK_OPERATIONS else INTERACTIVE
+
+def _invoke(prompt: PromptTemplate, llm: ChatGroq, inputs: dict, operation: str, parse=None):
+    """
+    Renders the prompt with the given inputs and returns the completion text.
+    
+    Calls that are allowed to be cached (temperature 0.0 by default) are looked up
+    in the on-disk LLM cache first, so repeating the exact same model + prompt
+    returns instantly instead of going back to the API.
+    
+    Requests go through the shared rate limiter (services/rate_limiter.py), which
+    holds them until the model's RPM/TPM quota allows them and retries rate limits
+    and transient errors with backoff.
+    
+    Every call is recorded in the telemetry (services/telemetry.py) under `operation`.
+    If `parse` is given, the parsed completion is returned instead and whether
+    parsing succeeded is recorded with the call.
+    """
+    rendered = prompt.format(**inputs)
+    call = LLMCall(operation, llm.model_name, rendered)
+    use_cache = cache_allowed(llm.temperature)
+    content = None
+    if use_cache:
+        key = make_cache_key(llm.model_name, llm.temperature, rendered, json_mode=is_json_mode(llm))
+        content = get_cache().get(key)
+    cached = content is not None
+
+    if not cached:
+        estimated = estimate_tokens(rendered) + COMPLETION_TOKEN_RESERVE
+        limiter = get_rate_limiter()
+        while True:
+            limiter.acquire(llm.model_name, estimated, _priority(operation))
+            try:
+                message = llm.invoke(rendered)
+                break
+            except Exception as e:
+                if not wait_before_retry(e, llm.model_name, call.retries):
+                    call.finish(error=e)
+                    raise
+                call.retries += 1
+        call.observe_message(message)
+        if call.usage is not None:
+            limiter.settle(llm.model_name, estimated, sum(call.usage))
+        content = message.content
+        if use_cache:
+            get_cache().set(key, llm.model_name, content)
+
+    if parse is None:
+        call.finish(content, cached=cached)
+        return content
+    result = parse(content)
+    call.finish(content, parse_ok=parse_succeeded(result), cached=cached)
+    return result
+
+def _structured_llm(temperature: float = 0.0) -> ChatGroq:
+    return get_llm(FAST_MODEL, temperature, json_mode=STRUCTURED_OUTPUT_ENABLED)
+
+def _invoke_validated(prompt: PromptTemplate, llm: ChatGroq, inputs: dict, operation: str, validate, schema: dict) -> tuple:
+    """
+    _invoke for structured answers. `validate(content)` returns (value, None) or
+    (None, problem); an invalid answer is sent to _repair_output once.
+    
+    Returns:
+        tuple: (validated value or None, the model's original answer).
+    """
+    answer = {}
+    
+    def parse(content):
+        value, answer["problem"] = validate(content)
+        answer["content"] = content
+        return value
+    
+    value = _invoke(prompt, llm, inputs, operation, parse=parse)
+    if value is None and OUTPUT_REPAIR_ENABLED:
+        value = _repair_output(operation, answer["content"], answer["problem"], validate, schema)
+    return value, answer["content"]
+
+def _repair_output(operation: str, content: str, problem: str, validate, schema: dict):
+    """
+    Asks the small model to fix an answer that failed validation. Only the answer
+    and the schema are sent, which is much cheaper than processing the email again.
+    The outcome is recorded as a 'repaired' or 'repair_failed' event of the original operation.
+    """
+    value = _invoke(OUTPUT_REPAIR_PROMPT, _structured_llm(), {
+        "problem": problem,
+        "schema": json.dumps(schema),
+        # A runaway answer is cut; what's left is enough to recover the fields
+        "output": (content or "")[:4000],
+    }, "repair_output", parse=lambda repaired: validate(repaired)[0])
+    record_event({"event": "repaired" if value is not None else "repair_failed", "operation": operation, "model": FAST_MODEL})
+    return value
+
+def _stream(prompt: PromptTemplate, llm: ChatGroq, inputs: dict, operation: str):
+    """
+    Streaming counterpart of _invoke: yields the completion in chunks as they arrive.
+    
+    A cache hit is yielded as a single chunk. Otherwise the full text is assembled
+    while streaming and written to the cache once the stream completes.
+    """
+    rendered = prompt.format(**inputs)
+    call = LLMCall(operation, llm.model_name, rendered, streamed=True)
+    use_cache = cache_allowed(llm.temperature)
+    if use_cache:
+        key = make_cache_key(llm.model_name, llm.temperature, rendered, json_mode=is_json_mode(llm))
+        cached = get_cache().get(key)
+        if cached is not None:
+            call.finish(cached, cached=True)
+            yield cached
+            return
+
+    estimated = estimate_tokens(rendered) + COMPLETION_TOKEN_RESERVE
+    limiter = get_rate_limiter()
+    parts = []
+    while True:
+        limiter.acquire(llm.model_name, estimated, _priority(operation))
+        try:
+            for chunk in llm.stream(rendered):
+                call.observe_message(chunk)
+                if chunk.content:
+                    call.first_token()
+                    parts.append(chunk.content)
+                    yield chunk.content
+            break
+        except Exception as e:
+            # Once text has been shown to the user, a retry would repeat it
+            if parts or not wait_before_retry(e, llm.model_name, call.retries):
+                call.finish("".join(parts), error=e)
+                raise
+            call.retries += 1
+    if call.usage is not None:
+        limiter.settle(llm.model_name, estimated, sum(call.usage))
+    content = "".join(parts)
+    call.finish(content)
+    if use_cache:
+        get_cache().set(key, llm.model_name, content)
+
+def _has_text(text: str) -> bool:
+    """Format check for Global Agent answers, which may legitimately be very short."""
+    return bool((text or "").strip())
+
+def _invoke_cascade(prompt: PromptTemplate, llm: ChatGroq, inputs: dict, operation: str, check=check_format) -> str:
+    """
+    _invoke for routed requests: if the small model's answer fails `check`,
+    the request is repeated on the large model.
+    """
+    content = _invoke(prompt, llm, inputs, operation)
+    if llm.model_name == FAST_MODEL and not check(content):
+        record_escalation(operation, "format_check")
+        content = _invoke(prompt, get_llm(SMART_MODEL, llm.temperature), inputs, operation)
+    return content
+
+def _stream_cascade(prompt: PromptTemplate, llm: ChatGroq, inputs: dict, operation: str, check=check_format):
+    """
+    _stream for routed requests. The first STREAM_CHECK_CHARS characters of a
+    small-model answer are held back and checked before anything is shown; if
+    they (or a complete answer shorter than that) fail, the large model answers instead.
+    """
+    if llm.model_name != FAST_MODEL:
+        yield from _stream(prompt, llm, inputs, operation)
+        return
+
+    stream = _stream(prompt, llm, inputs, operation)
+    head, finished = "", True
+    for chunk in stream:
+        head += chunk
+        if len(head) >= STREAM_CHECK_CHARS:
+            finished = False
+            break
+    if not (check(head) if finished else check_prefix(head)):
+        stream.close()
+        record_escalation(operation, "format_check")
+        yield from _stream(prompt, get_llm(SMART_MODEL, llm.temperature), inputs, operation)
+        return
+    yield head
+    yield from stream
+
+def summarize_conversation(summary: str, messages: list) -> str:
+    """Folds chat messages into a conversation's rolling summary (see services/memory.py)."""
+    llm = get_llm(FAST_MODEL, 0)
+    formatted = "\n".join(f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['message']}" for msg in messages)
+    return _invoke(CONVERSATION_SUMMARY_PROMPT, llm, {
+        "summary": summary or "(none yet)",
+        "messages": formatted,
+        "max_words": MEMORY_SUMMARY_TOKENS * 3 // 4,
+    }, "summarize_conversation")
+
+def _remember(memory: ConversationMemory, question: str, answer: str) -> None:
+    """Records a finished exchange and keeps the memory within its budget."""
+    memory.add("user", question)
+    memory.add("assistant", answer)
+    memory.compact(summarize_conversation)
+
+def _stream_and_remember(chunks, memory: ConversationMemory, question: str):
+    """Passes a stream through and records the exchange once the answer is complete."""
+    answer = []
+    for chunk in chunks:
+        answer.append(chunk)
+        yield chunk
+    if memory is not None:
+        _remember(memory, question, "".join(answer))
+
+def _email_chat_history(memory: ConversationMemory) -> str:
+    history = memory.render() if memory is not None else ""
+    if not history:
+        return ""
+    return f"=== CONVERSATION SO FAR ===\n{history}=== CURRENT QUESTION ===\n"
+
+def process_email(email_body: str, instruction_text: str, temperature: float = 1.0, memory: ConversationMemory = None):
     """
     Generic function to process an email with a given instruction.
     Useful for ad-hoc queries or tasks not covered by specific functions.
-    """
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        raise RuntimeError("Groq API Key is absent")
     
-    llm = ChatGroq(
-        model="llama-3.1-8b-instant",
-        groq_api_key=api_key,
-        temperature=temperature
-    )
+    With a memory (see services/memory.py), earlier questions about the email are
+    included and the new exchange is added to it; saving it is up to the caller.
+    """
+    llm = get_llm(FAST_MODEL, temperature)
     
-    # Simple prompt structure for generic tasks
-    chain_prompt = PromptTemplate.from_template(
-        """{instruction_text} \n\n === EMAIL CONTENT === \n {email_body} ===NOTE===\n Do not add any preamble or explanation. Just give the asked output"""
-    )
+    answer = _invoke(EMAIL_QUERY_PROMPT, llm, {"email_body": email_body, "instruction_text": instruction_text,
+                                               "chat_history": _email_chat_history(memory)}, "process_email")
+    if memory is not None:
+        _remember(memory, instruction_text, answer)
+    return answer
+
+def stream_email(email_body: str, instruction_text: str, temperature: float = 1.0, memory: ConversationMemory = None):
+    """Streaming variant of process_email: yields the answer as it is generated."""
+    llm = get_llm(FAST_MODEL, temperature)
     
-    email_model = chain_prompt | llm
-    response = email_model.invoke(input={"email_body": email_body, "instruction_text": instruction_text})
-    return response.content 
+    chunks = _stream(EMAIL_QUERY_PROMPT, llm, {"email_body": email_body, "instruction_text": instruction_text,
+                                               "chat_history": _email_chat_history(memory)}, "process_email")
+    yield from _stream_and_remember(chunks, memory, instruction_text)
 
 def categorize_email(email_body: str, user_instructions: str = "") -> list:
     """
     Categorizes an email based on its content and user-defined definitions.
     
-    We use a strict prompt here to ensure the LLM returns a clean, comma-separated list
-    of tags, which makes parsing much more reliable than free-form text.
+    In structured-output mode the answer is a JSON object ({"tags": [...]}); otherwise
+    we use a strict prompt for a clean, comma-separated list. Either way the tags are
+    normalized to the category names in the user's instructions (see services/schemas.py),
+    and an empty list is returned if no valid tag could be obtained.
     """
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        raise RuntimeError("Groq API Key is absent")
-    
+    allowed = allowed_tags(user_instructions)
+    prompt = STRUCTURED_CATEGORIZATION_PROMPT if STRUCTURED_OUTPUT_ENABLED else CATEGORIZATION_PROMPT
     # Using a lower temperature for more deterministic categorization
-    llm = ChatGroq(
-        model="llama-3.1-8b-instant",
-        groq_api_key=api_key,
-        temperature=0.0
-    )
-    
-    prompt = PromptTemplate.from_template(
-        """
-        ### INSTRUCTION:
-        Categorize the following email into one or more of the categories using the user instructions.
-        
-        ### USER INSTRUCTIONS:
-        {user_instructions}
-        
-        ### FORMAT (HIGHEST PRIORITY):
-        Return ONLY a comma-separated list of tags. Do not add any preamble or explanation.
-        Example: Important, To-Do
-        
-        ### EMAIL CONTENT:
-        {email_body}
-        
-        ### OUTPUT:
-        """
-    )
-    
-    chain = prompt | llm
-    response = chain.invoke(input={"email_body": email_body, "user_instructions": user_instructions})
-    
-    # Parse the output into a clean list of strings
-    return parse_list_output(response.content)
+    tags, _ = _invoke_validated(prompt, _structured_llm(), {"email_body": email_body, "user_instructions": user_instructions},
+                                "categorize_email", lambda content: validate_tags_output(content, allowed), tags_schema(allowed))
+    return tags or []
 
 def extract_action_items(email_body: str, user_instructions: str = "") -> dict:
     """
     Extracts actionable tasks and deadlines from an email.
     
-    Returns a dictionary with 'task' and 'deadline' keys. We force the LLM to output 
-    JSON to ensure we can programmatically use the results in the UI.
-    """
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        raise RuntimeError("Groq API Key is absent")
-    
-    llm = ChatGroq(
-        model="llama-3.1-8b-instant",
-        groq_api_key=api_key,
-        temperature=0.0
-    )
-    
-    prompt = PromptTemplate.from_template(
-        """
-        ### INSTRUCTION:
-        Extract actionable tasks and deadlines from the email using the user instructions.
-        
-        ### USER INSTRUCTIONS:
-        {user_instructions}
-        
-        ### FORMAT (HIGHEST PRIORITY):
-        Respond strictly in JSON format with the following structure:
-        {{
-          "task": "Description of the task",
-          "deadline": "Date/Time or 'None'"
-        }}
-        
-        If there are no clear tasks, return:
-        {{
-          "task": "None",
-          "deadline": "None"
-        }}
-        
-        ### EMAIL CONTENT:
-        {email_body}
-        
-        ### JSON OUTPUT:
-        """
-    )
-    
-    chain = prompt | llm
-    response = chain.invoke(input={"email_body": email_body, "user_instructions": user_instructions})
-    
-    # Robustly parse the JSON response, handling potential formatting issues
-    return parse_json_output(response.content)
-
-def generate_auto_reply(email_body: str, user_instructions: str = "") -> str:
+    Returns a dictionary with 'task' and 'deadline' keys, or {'error': ..., 'raw': ...}
+    if no valid answer could be obtained even after a repair request.
+    """
+    action_item, content = _invoke_validated(ACTION_EXTRACTION_PROMPT, _structured_llm(),
+                                             {"email_body": email_body, "user_instructions": user_instructions},
+                                             "extract_action_items", validate_action_output, ACTION_ITEM_SCHEMA)
+    if action_item is None:
+        return {"error": "Failed to parse JSON", "raw": content}
+    return action_item
+
+def categorize_and_extract(email_body: str, categorization_instructions: str = "", action_instructions: str = "") -> dict:
+    """
+    Categorizes an email and extracts its action item in a single request.
+    
+    Both tasks read the same email text, so asking for one JSON object with 'tags'
+    and 'action_item' halves the request count and input tokens compared to calling
+    categorize_email and extract_action_items separately. If the combined response
+    can't be validated even after a repair request, we fall back to the two dedicated
+    (and more reliable) calls.
+    """
+    allowed = allowed_tags(categorization_instructions)
+    result, _ = _invoke_validated(FUSED_PROCESSING_PROMPT, _structured_llm(), {
+        "email_body": email_body,
+        "categorization_instructions": categorization_instructions,
+        "action_instructions": action_instructions,
+    }, "categorize_and_extract", lambda content: validate_fused_output(content, allowed), fused_schema(allowed))
+    
+    if result is None:
+        # Fall back to the two-call path rather than storing a half-parsed result
+        result = {
+            "tags": categorize_email(email_body, categorization_instructions),
+            "action_item": extract_action_items(email_body, action_instructions),
+        }
+    return result
+
+def categorize_and_extract_packed(emails: list, categorization_instructions: str = "", action_instructions: str = "") -> dict:
+    """
+    Categorizes and extracts action items for several emails in one request.
+    
+    For short emails (alerts, newsletters) most of a request is prompt overhead,
+    so sending a pack of emails keyed by id cuts request count and RPM pressure.
+    
+    Returns:
+        dict: Maps email id to {'tags': [...], 'action_item': {...}}. Ids that the
+        model skipped or answered in the wrong shape are omitted; callers should
+        re-queue those emails individually.
+    """
+    llm = _structured_llm()
+    allowed = allowed_tags(categorization_instructions)
+    
+    emails_block = "\n\n".join(f"=== EMAIL ID: {email['id']} ===\n{format_email(email)}" for email in emails)
+    
+    expected_ids = [email["id"] for email in emails]
+    return _invoke(PACKED_PROCESSING_PROMPT, llm, {
+        "emails_block": emails_block,
+        "categorization_instructions": categorization_instructions,
+        "action_instructions": action_instructions,
+    }, "categorize_and_extract_packed", parse=lambda content: validate_packed_output(content, expected_ids, allowed))
+
+def generate_auto_reply(email_body: str, user_instructions: str = "", tags: list = None, speculative: bool = False) -> str:
     """
     Generates a professional, context-aware reply to an email.
     
     The output is a raw string ready to be pasted into a draft. We explicitly ask 
     the LLM to avoid JSON or quotes here so it feels like a natural email draft.
-    """
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        raise RuntimeError("Groq API Key is absent")
     
+    Short, routine emails are answered by the small model; long ones and emails
+    tagged Important/To-Do (see services/routing.py) go to the large model, as do
+    small-model replies that fail the format check.
+    
+    Speculative replies (drafted in the background before anyone asked) are logged
+    separately and yield to interactive calls in the rate limiter.
+    """
+    operation = "speculative_reply" if speculative else "generate_auto_reply"
     # Slightly higher temperature for more creative/natural writing
-    llm = ChatGroq(
-        model="llama-3.3-70b-versatile",
-        groq_api_key=api_key,
-        temperature=0.7
-    )
-    
-    prompt = PromptTemplate.from_template(
-        """
-        ### INSTRUCTION:
-        Draft a professional and context-aware reply to the following email.
-        
-        ### USER INSTRUCTIONS:
-        {user_instructions}
-        
-        ### FORMAT (HIGHEST PRIORITY):
-        Return ONLY the body of the reply as a raw string. 
-        Do NOT wrap it in JSON. 
-        Do NOT wrap it in quotes.
-        Do NOT add any preamble like "Here is the draft:".
-        Just start with the salutation (e.g., "Dear Name,").
-        
-        ### EMAIL CONTENT:
-        {email_body}
-        
-        ### DRAFT REPLY:
-        """
-    )
-    
-    chain = prompt | llm
-    response = chain.invoke(input={"email_body": email_body, "user_instructions": user_instructions})
-    return response.content 
-
-def process_global_query(emails: list, query: str, chat_history: list = [], temperature: float = 1.0) -> str:
+    llm = get_llm(route(operation, email_body, user_instructions, tags), 0.7)
+    
+    return _invoke_cascade(AUTO_REPLY_PROMPT, llm, {"email_body": email_body, "user_instructions": user_instructions}, operation)
+
+def stream_auto_reply(email_body: str, user_instructions: str = "", tags: list = None):
+    """Streaming variant of generate_auto_reply: yields the reply as it is generated."""
+    llm = get_llm(route("generate_auto_reply", email_body, user_instructions, tags), 0.7)
+    
+    yield from _stream_cascade(AUTO_REPLY_PROMPT, llm, {"email_body": email_body, "user_instructions": user_instructions}, "generate_auto_reply")
+
+def _with_stored_fields(emails: list, load_records=None) -> list:
     """
-    Answers questions about the entire inbox, taking into account recent chat history.
+    Fills in the body (and other heavy fields) of metadata-only emails from their stored records.
+
+    The filled-in emails are copies, so shared email dicts are left as they are;
+    emails that already have a body, or all of them without load_records, are returned as is.
+    """
+    missing = [email.get("id") for email in emails if "body" not in email]
+    if not missing or load_records is None:
+        return emails
+    stored = load_records(missing)
+    return [email if "body" in email else {**stored.get(str(email.get("id")), {}), **email} for email in emails]
+
+def _format_inbox_entry(email: dict) -> str:
+    """Formats one email the way the Global Agent sees it."""
+    return f"ID: {email.get('id')}\nFrom: {email.get('name')} <{email.get('sender')}>\nSubject: {email.get('subject')}\nBody: {email.get('body')}\nTags: {email.get('tags')}\nAction Item: {email.get('action_item')} \n is_read:{email.get('is_read')}\n\n\n"
+
+def prefilter_emails(emails: list, query: str, index: InboxIndex = None) -> list:
+    """
+    Narrows the inbox using filters recognized in the question.
+    
+    Mentions of "unread", time ranges ("today", "last 7 days"), existing tag names
+    and sender domains become secondary-index lookups, so later steps only look at
+    matching emails. If nothing is recognized, or the filters match nothing, the
+    full list is returned unchanged.
+    
+    Args:
+        index: An index the caller keeps up to date with `emails` (positions included),
+            such as the shared inbox store's. Without one, the process-wide index is
+            synced with `emails` first.
+    """
+    if index is None:
+        index = get_inbox_index()
+        index.sync(emails)
+    filters = infer_query_filters(query, index)
+    if not filters:
+        return emails
+    ids = index.query(**filters)
+    if not ids:
+        return emails
+    return [emails[position] for position in index.positions(ids)]
+
+def select_relevant_emails(emails: list, query: str, top_k: int = RETRIEVAL_TOP_K, token_budget: int = GLOBAL_CONTEXT_TOKEN_BUDGET,
+                           within: list = None, load_records=None) -> list:
+    """
+    Picks the emails most relevant to a query, within a token budget.
+    
+    Emails are ranked with the shared BM25 index (kept in sync incrementally), and
+    taken best-first until top_k emails or token_budget estimated tokens are used.
+    If nothing in the inbox matches the query terms (e.g. "what should I do today?"),
+    we fall back to the inbox order so the agent still has something to look at.
+    
+    Args:
+        emails: The whole inbox. The index is always synced with all of it, so a
+            filtered question doesn't evict the rest of the inbox from the index.
+        within: Optional subset of emails (see prefilter_emails) to pick from.
+        load_records: Optional callable (ids) -> {str(id): full record} for emails loaded
+            without their body. Bodies are then read only to index new emails and for
+            the emails that are picked.
+    """
+    retriever = get_inbox_retriever()
+    retriever.sync(emails, load_records)
+    candidates = emails if within is None else within
+    by_id = {email.get("id"): email for email in candidates}
+    # With a subset, rank everything that matches and keep the best hits inside it
+    hits = retriever.search(query, top_k if within is None else len(emails))
+    ranked = [by_id[email_id] for email_id in hits if email_id in by_id][:top_k]
+    if not ranked:
+        ranked = candidates[:top_k]
+    ranked = _with_stored_fields(ranked, load_records)
+
+    selected, used_tokens = [], 0
+    for email in ranked:
+        tokens = estimate_tokens(_format_inbox_entry(email))
+        if selected and used_tokens + tokens > token_budget:
+            break
+        selected.append(email)
+        used_tokens += tokens
+    return selected
+
+def needs_whole_inbox(query: str) -> bool:
+    """
+    Heuristic used by process_global_query in 'auto' mode.
+    Questions like "Summarize unread emails" need every email (via digests);
+    specific questions are better served by retrieval.
+    """
+    return bool(_WHOLE_INBOX_PATTERN.search(query))
+
+def summarize_email(email_body: str) -> str:
+    """
+    Writes a short digest (one or two sentences) of an email.
+    Uses the cheap model at temperature 0.0, so repeats are served from the cache.
+    """
+    llm = get_llm(FAST_MODEL, 0.0)
+    return _invoke(DIGEST_PROMPT, llm, {"email_body": email_body}, "summarize_email").strip()
+
+def refresh_digests(emails: list, max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> dict:
+    """
+    Generates the digests that are missing or out of date.
     
-    This function aggregates email content (currently all of it, but could be summarized)
-    and feeds it to the LLM along with the user's query and conversation context.
+    Digests are stored on the email record ('digest' plus 'digest_hash', a hash of
+    the body) and are only regenerated when the body changes, so after the first
+    run whole-inbox questions cost a fraction of the tokens. The emails themselves
+    are not modified (they may be shared); callers persist the returned fields,
+    e.g. with InboxStore.update_many.
+    
+    Returns:
+        dict: Maps the id of each email whose digest was (re)generated to its new
+        'digest' and 'digest_hash' fields.
+    """
+    stale = [email for email in emails if not email.get("digest") or email.get("digest_hash") != content_hash(email.get("body", ""))]
+    if not stale:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(stale)))) as executor:
+        digests = list(executor.map(lambda email: summarize_email(format_email(email)), stale))
+    return {
+        email.get("id"): {"digest": digest, "digest_hash": content_hash(email.get("body", ""))}
+        for email, digest in zip(stale, digests)
+    }
+
+def _format_digest_entry(email: dict) -> str:
+    """Formats one email's digest for the Global Agent."""
+    return f"ID: {email.get('id')} | From: {email.get('name')} <{email.get('sender')}> | Subject: {email.get('subject')} | Tags: {email.get('tags')} | is_read:{email.get('is_read')}\nDigest: {email.get('digest')}\n\n"
+
+def _reduce_digests(entries: list, query: str, token_budget: int, max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> str:
+    """
+    Merges digest entries chunk by chunk until they fit in token_budget.
+    
+    Each round packs the entries into budget-sized chunks and condenses every chunk
+    (in parallel) into query-focused notes, which become the next round's entries.
+    """
+    llm = get_llm(FAST_MODEL, 0.0)
+    context = "".join(entries)
+    while estimate_tokens(context) > token_budget and len(entries) > 1:
+        chunks, current, current_tokens = [], [], 0
+        for entry in entries:
+            tokens = estimate_tokens(entry)
+            if current and current_tokens + tokens > token_budget:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(entry)
+            current_tokens += tokens
+        chunks.append(current)
+        if len(chunks) == len(entries):
+            # Every entry is already over budget on its own; merging can't help
+            break
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks)))) as executor:
+            notes = list(executor.map(
+                lambda chunk: _invoke(DIGEST_REDUCE_PROMPT, llm, {"query": query, "digests": "".join(chunk)}, "reduce_digests"),
+                chunks,
+            ))
+        entries = [note.strip() + "\n\n" for note in notes]
+        context = "".join(entries)
+    return context
+
+def process_global_query(emails: list, query: str, chat_history: list = [], temperature: float = 1.0,
+                         top_k: int = RETRIEVAL_TOP_K, token_budget: int = GLOBAL_CONTEXT_TOKEN_BUDGET,
+                         mode: str = "auto", memory: ConversationMemory = None, index: InboxIndex = None,
+                         load_records=None, save_digests=None) -> str:
     """
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        raise RuntimeError("Groq API Key is absent")
+    Answers questions about the entire inbox, taking into account recent chat history.
     
-    llm = ChatGroq(
-        model="llama-3.3-70b-versatile",
-        groq_api_key=api_key,
-        temperature=temperature
-    )
+    Two ways of building the inbox context are supported:
+    - 'retrieval': only the top_k emails most relevant to the query (and the user's
+      previous question, for follow-ups) are included, capped at token_budget.
+    - 'digest': every candidate email (after prefilter_emails) is represented by its
+      cached digest (see refresh_digests); missing ones are generated for those emails
+      only. If even the digests exceed token_budget, they are merged in chunks first.
+    'auto' picks 'digest' for whole-inbox questions and 'retrieval' otherwise.
     
-    # Prepare the inbox context. In a production app, we might need to summarize 
-    # or retrieve only relevant emails to fit within the context window.
-    inbox_context = ""
-    for email in emails:
-        inbox_context += f"ID: {email.get('id')}\nFrom: {email.get('name')} <{email.get('sender')}>\nSubject: {email.get('subject')}\nBody: {email.get('body')}\nTags: {email.get('tags')}\nAction Item: {email.get('action_item')} \n is_read:{email.get('is_read')}\n\n\n"
+    The conversation so far comes from `memory` (bounded, see services/memory.py),
+    which is then updated with this exchange; `chat_history`, a plain list of
+    {'role', 'message'} dicts, is used when no memory is given.
+    
+    `index` is an InboxIndex kept up to date with `emails` (see prefilter_emails).
+    `load_records` reads stored records by id, for emails loaded without their body
+    (see select_relevant_emails); bodies are then read in batches or only for the
+    emails that are used. `save_digests` persists newly generated digests (it gets a
+    dict like refresh_digests returns), so later questions can reuse them.
+    """
+    answer = _invoke_cascade(*_global_query_request(emails, query, chat_history, temperature, top_k, token_budget, mode, memory,
+                                                    index, load_records, save_digests),
+                             "process_global_query", check=_has_text)
+    if memory is not None:
+        _remember(memory, query, answer)
+    return answer
+
+def stream_global_query(emails: list, query: str, chat_history: list = [], temperature: float = 1.0,
+                        top_k: int = RETRIEVAL_TOP_K, token_budget: int = GLOBAL_CONTEXT_TOKEN_BUDGET,
+                        mode: str = "auto", memory: ConversationMemory = None, index: InboxIndex = None,
+                        load_records=None, save_digests=None):
+    """Streaming variant of process_global_query: yields the answer as it is generated."""
+    chunks = _stream_cascade(*_global_query_request(emails, query, chat_history, temperature, top_k, token_budget, mode, memory,
+                                                    index, load_records, save_digests),
+                             "process_global_query", check=_has_text)
+    yield from _stream_and_remember(chunks, memory, query)
+
+def _global_query_request(emails: list, query: str, chat_history: list, temperature: float,
+                          top_k: int, token_budget: int, mode: str, memory: ConversationMemory = None,
+                          index: InboxIndex = None, load_records=None, save_digests=None) -> tuple:
+    """Builds the (prompt, llm, inputs) triple for a Global Agent question."""
+    # Cheap index lookups first ("unread", "last 7 days", "from hdfcbank", tag names)
+    candidates = prefilter_emails(emails, query, index)
+    
+    whole_inbox = mode == "digest" or (mode == "auto" and needs_whole_inbox(query))
+    if whole_inbox:
+        # Only one batch of bodies is loaded at a time; the digests are all that is kept
+        entries = []
+        for start in range(0, len(candidates), DIGEST_LOAD_BATCH_SIZE):
+            batch = _with_stored_fields(candidates[start:start + DIGEST_LOAD_BATCH_SIZE], load_records)
+            digests = refresh_digests(batch)
+            if digests and save_digests is not None:
+                save_digests(digests)
+            entries.extend(_format_digest_entry({**email, **digests.get(email.get("id"), {})}) for email in batch)
+        inbox_context = _reduce_digests(entries, query, token_budget)
+    else:
+        # Follow-up questions ("and the second one?") rarely repeat the keywords,
+        # so the previous user message is included in the retrieval query.
+        if memory is not None:
+            previous_questions = [memory.last_user_message()]
+        else:
+            previous_questions = [msg["message"] for msg in chat_history if msg["role"] == "user"][-1:]
+        retrieval_query = " ".join(previous_questions + [query]).strip()
+        relevant_emails = select_relevant_emails(emails, retrieval_query, top_k, token_budget,
+                                                 within=None if candidates is emails else candidates, load_records=load_records)
+        inbox_context = "".join(_format_inbox_entry(email) for email in relevant_emails)
 
     # Format chat history for the prompt
-    formatted_history = ""
-    for msg in chat_history:
-        role = "User" if msg["role"] == "user" else "Assistant"
-        formatted_history += f"{role}: {msg['message']}\n"
-
-    prompt_template = PromptTemplate.from_template(
-        """You are an intelligent email assistant. You have access to the user's inbox.
-        
-        === INBOX CONTENT ===
-        {inbox_context}
-        
-        === CHAT HISTORY ===
-        {chat_history}
-        
-        === USER QUERY ===
-        {query}
-        
-        Answer the user's query based on the inbox content and chat history (ignore history if irrelevant). Be concise and helpful.
-        """
-    )
-    
-    chain = prompt_template | llm
-    response = chain.invoke(input={"inbox_context": inbox_context, "chat_history": formatted_history, "query": query})
-    return response.content
+    if memory is not None:
+        formatted_history = memory.render()
+    else:
+        formatted_history = ""
+        for msg in chat_history:
+            role = "User" if msg["role"] == "user" else "Assistant"
+            formatted_history += f"{role}: {msg['message']}\n"
+
+    # Small questions over a few retrieved emails don't need the large model
+    model = route("process_global_query", inbox_context + formatted_history, query, whole_inbox=whole_inbox)
+    return GLOBAL_QUERY_PROMPT, get_llm(model, temperature), {"inbox_context": inbox_context, "chat_history": formatted_history, "query": query}
 
 def generate_draft(prompt: str, recipient: str, recipient_email: str, subject: str, temperature: float = 1.0) -> str:
     """
     Generates a fresh email draft from scratch based on a user prompt.
+    Short prompts are drafted by the small model, escalating as in generate_auto_reply.
+    """
+    llm = get_llm(route("generate_draft", instructions=prompt), temperature)
+    
+    return _invoke_cascade(DRAFT_PROMPT, llm, {"recipient": recipient, "recipient_email": recipient_email, "subject": subject, "prompt": prompt}, "generate_draft")
+
+def stream_draft(prompt: str, recipient: str, recipient_email: str, subject: str, temperature: float = 1.0):
+    """Streaming variant of generate_draft: yields the draft as it is generated."""
+    llm = get_llm(route("generate_draft", instructions=prompt), temperature)
+    
+    yield from _stream_cascade(DRAFT_PROMPT, llm, {"recipient": recipient, "recipient_email": recipient_email, "subject": subject, "prompt": prompt}, "generate_draft")
+
+def _process_single_email(email: dict, categorization_instructions: str, action_instructions: str, fused: bool = False) -> dict:
+    """Runs categorization and action extraction for one email."""
+    email_text = format_email(email)
+    if fused:
+        return categorize_and_extract(email_text, categorization_instructions, action_instructions)
+    return {
+        "tags": categorize_email(email_text, categorization_instructions),
+        "action_item": extract_action_items(email_text, action_instructions),
+    }
+
+def _extract_with_local_tags(email: dict, tags: list, action_instructions: str, tags_version: str = None) -> dict:
+    """
+    Runs only action extraction, for an email the local classifier already tagged.
+    'tags_version' is the categorization prompt version the classifier learned from.
+    """
+    return {
+        "tags": tags,
+        "action_item": extract_action_items(format_email(email), action_instructions),
+        "tag_source": "local",
+        "tags_version": tags_version,
+    }
+
+def _extract_for_cluster_member(email: dict, tags: list, action_instructions: str, representative_id) -> dict:
+    """
+    Runs only action extraction, for an email that takes its tags from its cluster's
+    representative (action items name each email's own task and deadline).
+    """
+    return {
+        "tags": list(tags),
+        "action_item": extract_action_items(format_email(email), action_instructions),
+        "tag_source": "cluster",
+        "cluster_of": representative_id,
+    }
+
+def _process_email_pack(emails: list, indices: list, categorization_instructions: str, action_instructions: str) -> dict:
+    """Runs one packed request and maps the parsed results back to input positions."""
+    by_id = categorize_and_extract_packed([emails[ind] for ind in indices], categorization_instructions, action_instructions)
+    return {ind: by_id[emails[ind]["id"]] for ind in indices if emails[ind]["id"] in by_id}
+
+def process_emails_batch(emails: list, categorization_instructions: str = "", action_instructions: str = "",
+                         max_concurrency: int = DEFAULT_MAX_CONCURRENCY, progress_callback=None,
+                         fused: bool = False, packed: bool = False, local_classifier: bool = CLASSIFIER_ENABLED,
+                         cluster: bool = CLUSTERING_ENABLED, cluster_tags: dict = None) -> list:
     """
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        raise RuntimeError("Groq API Key is absent")
-    
-    llm = ChatGroq(
-        model="llama-3.3-70b-versatile",
-        groq_api_key=api_key,
-        temperature=temperature
-    )
-    
-    prompt_template = PromptTemplate.from_template(
-        """You are an intelligent email assistant. Draft a professional email based on the following details:
-        Recipient Name (Optional): {recipient}
-        Recipient Email: {recipient_email}
-        Subject: {subject}
-        
-        ### Instructions/Context:
-        {prompt}
-        
-        ### Format (Highest Priority):
-        Return ONLY the body of the email in the raw string format. Do not include the subject line or any preamble.
-        
-        ### Output:
-        """
-    )
-    
-    chain = prompt_template | llm
-    response = chain.invoke(input={"recipient": recipient, "recipient_email": recipient_email, "subject": subject, "prompt": prompt})
-    return response.content
+    Categorizes and extracts action items for many emails concurrently.
+    
+    Work is handed to a bounded thread pool, so wall-clock time scales with
+    len(emails) / max_concurrency instead of len(emails). Results are returned in
+    the same order as the input emails, as dicts with 'tags' and 'action_item' keys.
+    
+    Args:
+        emails: Email records (dicts) to process.
+        categorization_instructions: User-defined categorization prompt.
+        action_instructions: User-defined action extraction prompt.
+        max_concurrency: Maximum number of requests in flight at the same time.
+        progress_callback: Optional callable(completed, total). It is invoked from the
+            calling thread as emails finish, so it is safe to update Streamlit widgets in it.
+        fused: If True, use a single combined request per email (see categorize_and_extract).
+        packed: If True, send several emails per request (see categorize_and_extract_packed).
+            Emails missing from a pack's response are re-queued on their own.
+        local_classifier: If True, emails the local classifier tags confidently skip the
+            categorization request and only get action extraction (see services/classifier.py).
+            Results then carry 'tag_source': 'local' instead of 'llm'.
+        cluster: If True, emails of the same thread or with near-identical bodies are
+            categorized once (see services/clustering.py); the other members take the
+            representative's tags, with 'tag_source': 'cluster' and 'cluster_of': its id,
+            and only get action extraction.
+        cluster_tags: Tags already known from a cluster representative processed earlier,
+            mapping input positions to (tags, representative id); those emails also only
+            get action extraction.
+    """
+    results = [None] * len(emails)
+    if not emails:
+        return results
+
+    # Packing keys results by id, so duplicate or missing ids can't be packed safely
+    ids = [email.get("id") for email in emails]
+    packed = packed and None not in ids and len(set(ids)) == len(ids)
+
+    # Only one email per thread / near-duplicate group is sent; the rest follow its result
+    cluster_tags = cluster_tags or {}
+    member_of = {ind: rep for ind, rep in cluster_emails(emails).items() if ind not in cluster_tags} if cluster else {}
+    members = {}
+    for ind, representative in member_of.items():
+        members.setdefault(representative, []).append(ind)
+
+    # Easy emails are tagged locally; a small sample of them still goes to the LLM for auditing.
+    # The model is only used if it learned from tags made with these instructions.
+    local_tags, audited = {}, {}
+    classifier = get_classifier_service() if local_classifier else None
+    tags_version = result_version("tags", {"categorization": categorization_instructions})
+    model = classifier.get_model(tags_version=tags_version) if classifier else None
+    if model is not None:
+        allowed = allowed_tags(categorization_instructions)
+        for ind, predicted in model.predict_confident(emails).items():
+            if ind in member_of or ind in cluster_tags:
+                continue
+            # A predicted category the instructions don't define: let the LLM decide
+            tags = normalize_tags(predicted, allowed)
+            if not tags or len(tags) != len(predicted):
+                continue
+            if classifier.should_audit():
+                audited[ind] = tags
+            else:
+                local_tags[ind] = tags
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+    # Maps each future to (is_pack, input positions it covers)
+    pending = {}
+
+    def submit_single(ind):
+        future = executor.submit(_process_single_email, emails[ind], categorization_instructions, action_instructions, fused)
+        pending[future] = (False, [ind])
+
+    def submit_member(ind, tags, representative_id):
+        future = executor.submit(_extract_for_cluster_member, emails[ind], tags, action_instructions, representative_id)
+        pending[future] = (False, [ind])
+
+    try:
+        for ind, tags in local_tags.items():
+            future = executor.submit(_extract_with_local_tags, emails[ind], tags, action_instructions, model.tags_version)
+            pending[future] = (False, [ind])
+        for ind, (tags, representative_id) in cluster_tags.items():
+            submit_member(ind, tags, representative_id)
+
+        remaining = [ind for ind in range(len(emails)) if ind not in local_tags and ind not in member_of and ind not in cluster_tags]
+        if packed:
+            position = {email_id: ind for ind, email_id in enumerate(ids)}
+            for pack in pack_emails([emails[ind] for ind in remaining], PACKED_TOKEN_BUDGET, PACKED_MAX_EMAILS):
+                indices = [position[email["id"]] for email in pack]
+                if len(indices) == 1:
+                    submit_single(indices[0])
+                    continue
+                future = executor.submit(_process_email_pack, emails, indices, categorization_instructions, action_instructions)
+                pending[future] = (True, indices)
+        else:
+            for ind in remaining:
+                submit_single(ind)
+
+        completed = 0
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                is_pack, indices = pending.pop(future)
+                finished = future.result() if is_pack else {indices[0]: future.result()}
+                for ind, result in list(finished.items()):
+                    result.setdefault("tag_source", "llm")
+                    results[ind] = result
+                    # Members follow once their representative is tagged
+                    for member in members.get(ind, ()):
+                        if result.get("tags"):
+                            submit_member(member, result["tags"], emails[ind].get("id"))
+                        else:
+                            submit_single(member)
+                # Whatever the pack didn't answer gets a dedicated request
+                for ind in indices:
+                    if ind not in finished:
+                        submit_single(ind)
+                completed += len(finished)
+                if progress_callback and finished:
+                    progress_callback(completed, len(emails))
+    except BaseException:
+        # Don't keep hammering the API once one request has failed
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
 
+    if classifier is not None:
+        classifier.record_batch(
+            local=len(local_tags),
+            llm=len(emails) - len(local_tags) - len(member_of) - len(cluster_tags),
+            audits=[(tags, results[ind]["tags"]) for ind, tags in audited.items()],
+        )
+    return results
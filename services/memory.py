@@ -0,0 +1,144 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from services.data_manager import DB_PATH
+from services.utils import estimate_tokens
+
+
+# Most recent messages kept word for word; older ones are folded into the summary
+MEMORY_RECENT_MESSAGES = int(os.getenv("MEMORY_RECENT_MESSAGES", "6"))
+
+# Upper bound (estimated tokens) for everything a conversation adds to a prompt:
+# summary plus verbatim messages. A single message may use at most half of it.
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+
+# Target size of the rolling summary
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+
+# Conversation id of the Global Agent chat (email chats use the email id)
+GLOBAL_CONVERSATION = "global"
+
+_local = threading.local()
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    """Cuts text to roughly max_tokens (see estimate_tokens), marking the cut."""
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + " [...]"
+
+
+class ConversationMemory:
+    """
+    Bounded chat memory: the last few messages verbatim plus a rolling summary of
+    everything before them.
+
+    add() only appends; compact() moves the oldest messages into the summary
+    (through a summarize callable, normally llm_services.summarize_conversation)
+    until the conversation fits MEMORY_RECENT_MESSAGES and MEMORY_TOKEN_BUDGET.
+    Messages are kept in full (they are what the chat shows); only their prompt
+    form is clipped, so the size of the prompt stays constant however long the
+    conversation runs.
+    """
+
+    def __init__(self, conversation_id: str, summary: str = "", messages: list = None, folded: int = 0):
+        self.conversation_id = str(conversation_id)
+        self.summary = summary
+        self.messages = list(messages or [])
+        # Number of messages that have been folded into the summary so far
+        self.folded = folded
+
+    def add(self, role: str, message: str) -> None:
+        """Appends a message ('user' or 'assistant')."""
+        self.messages.append({"role": role, "message": message or ""})
+
+    @staticmethod
+    def _prompt_text(msg: dict) -> str:
+        """A message as it goes into prompts: clipped to half the token budget."""
+        return _clip(msg["message"], MEMORY_TOKEN_BUDGET // 2)
+
+    def _tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(self._prompt_text(msg)) for msg in self.messages)
+
+    def needs_compaction(self) -> bool:
+        return len(self.messages) > MEMORY_RECENT_MESSAGES or self._tokens() > MEMORY_TOKEN_BUDGET
+
+    def compact(self, summarize) -> None:
+        """
+        Folds the oldest messages into the summary until the memory is within bounds.
+
+        Args:
+            summarize: Callable (summary, messages) -> updated summary.
+        """
+        if not self.needs_compaction():
+            return
+        # Fold down to half the window, so the summary is updated every few turns rather
+        # than on every one; the latest exchange always stays verbatim
+        keep = min(len(self.messages), max(2, MEMORY_RECENT_MESSAGES // 2))
+        while keep > 2 and estimate_tokens(self.summary) + MEMORY_SUMMARY_TOKENS + sum(
+                estimate_tokens(self._prompt_text(msg)) for msg in self.messages[-keep:]) > MEMORY_TOKEN_BUDGET:
+            keep -= 1
+        older, self.messages = self.messages[:-keep], self.messages[-keep:]
+        if older:
+            older = [{**msg, "message": self._prompt_text(msg)} for msg in older]
+            self.summary = _clip(summarize(self.summary, older).strip(), MEMORY_SUMMARY_TOKENS)
+            self.folded += len(older)
+
+    def last_user_message(self) -> str:
+        for msg in reversed(self.messages):
+            if msg["role"] == "user":
+                return msg["message"]
+        return ""
+
+    def render(self) -> str:
+        """Formats the summary and recent messages for a prompt ('' for a new conversation)."""
+        lines = []
+        if self.summary:
+            lines.append(f"Summary of the earlier conversation: {self.summary}")
+        for msg in self.messages:
+            role = "User" if msg["role"] == "user" else "Assistant"
+            lines.append(f"{role}: {self._prompt_text(msg)}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def to_dict(self) -> dict:
+        return {"summary": self.summary, "messages": self.messages, "folded": self.folded}
+
+
+def _get_connection() -> sqlite3.Connection:
+    """Returns this thread's connection to the conversations table (stored alongside the inbox)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def load_memory(conversation_id: str) -> ConversationMemory:
+    """Loads a stored conversation, or starts an empty one."""
+    row = _get_connection().execute("SELECT data FROM conversations WHERE id = ?", (str(conversation_id),)).fetchone()
+    if row is None:
+        return ConversationMemory(conversation_id)
+    return ConversationMemory(conversation_id, **json.loads(row[0]))
+
+
+def save_memory(memory: ConversationMemory) -> None:
+    """Stores a conversation, replacing its previous state."""
+    conn = _get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO conversations (id, data, updated_at) VALUES (?, ?, ?)",
+            (memory.conversation_id, json.dumps(memory.to_dict(), ensure_ascii=False), time.time()),
+        )
+
@@ -0,0 +1,144 @@
+import os
+import threading
+
+from services.data_manager import BASE_DIR, load_payload, save_data
+from services.prompt_templates import (
+    CATEGORIZATION_PROMPT, STRUCTURED_CATEGORIZATION_PROMPT, ACTION_EXTRACTION_PROMPT,
+    FUSED_PROCESSING_PROMPT, PACKED_PROCESSING_PROMPT, AUTO_REPLY_PROMPT,
+)
+from services.utils import content_hash
+
+
+PROMPTS_FILE = "prompts.json"
+
+# For each stored result: the prompts.json entries and the compiled templates that shape it.
+# A result's prompt version changes when any of them changes, whatever mode produced it.
+RESULT_PROMPTS = {
+    "tags": (("categorization",), (CATEGORIZATION_PROMPT, STRUCTURED_CATEGORIZATION_PROMPT,
+                                   FUSED_PROCESSING_PROMPT, PACKED_PROCESSING_PROMPT)),
+    "action_item": (("action_extraction",), (ACTION_EXTRACTION_PROMPT, FUSED_PROCESSING_PROMPT, PACKED_PROCESSING_PROMPT)),
+    "reply": (("auto_reply",), (AUTO_REPLY_PROMPT,)),
+}
+
+# Results written by "Process Emails"
+PROCESSING_RESULTS = ("tags", "action_item")
+
+# The templates only change with the code, so their part of each fingerprint is computed once
+_TEMPLATE_HASHES = {
+    result: content_hash("\0".join(template.template for template in templates))
+    for result, (_, templates) in RESULT_PROMPTS.items()
+}
+
+
+def result_version(result: str, prompts: dict) -> str:
+    """
+    Fingerprint of everything that shapes one kind of result ('tags', 'action_item'
+    or 'reply'): the user's instructions it uses plus the system templates.
+
+    Args:
+        prompts: The user's prompts (as in prompts.json); only the relevant entries are read.
+    """
+    names, _ = RESULT_PROMPTS[result]
+    return content_hash("\0".join([_TEMPLATE_HASHES[result], *(prompts.get(name) or "" for name in names)]))
+
+
+def result_versions(prompts: dict, results: tuple = PROCESSING_RESULTS) -> dict:
+    """The versions to stamp on an email's 'prompt_versions' when it is processed with these prompts."""
+    return {result: result_version(result, prompts) for result in results}
+
+
+def is_stale(email: dict, versions: dict) -> bool:
+    """True if any of the email's results was produced with other prompts (or was never stamped)."""
+    stamped = email.get("prompt_versions") or {}
+    return any(stamped.get(result) != version for result, version in versions.items())
+
+
+class PromptRegistry:
+    """
+    The current user prompts, shared by the whole process.
+
+    prompts.json is re-read when its modification time changes, so edits made on
+    disk (or by another server process) take effect without a restart; saves from
+    the Prompt Configuration page go through save(). Every change bumps `version`,
+    which the UI uses to detect concurrent edits, and changes the result versions
+    (see result_version) stamped on the emails processed afterwards.
+    """
+
+    def __init__(self, relfile: str = PROMPTS_FILE):
+        self.relfile = relfile
+        self.path = BASE_DIR / relfile
+        self._lock = threading.Lock()
+        self._prompts = {}
+        self._mtime = None
+        self.version = 0
+        self._versions = {}
+        self._reload_if_changed()
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _set(self, prompts: dict) -> None:
+        """Installs new prompts (lock must be held)."""
+        self._prompts = dict(prompts)
+        self._versions = result_versions(self._prompts, tuple(RESULT_PROMPTS))
+        self.version += 1
+
+    def _reload_if_changed(self) -> None:
+        mtime = self._stat()
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime != self._mtime:
+                self._mtime = mtime
+                prompts = load_payload(self.relfile)
+                if prompts != self._prompts:
+                    self._set(prompts)
+
+    def prompts(self) -> dict:
+        """Returns the current prompts (do not modify the dict; use save())."""
+        self._reload_if_changed()
+        return self._prompts
+
+    def current_version(self) -> int:
+        self._reload_if_changed()
+        return self.version
+
+    def result_version(self, result: str) -> str:
+        """The version of the current prompts for one kind of result (see result_version)."""
+        self._reload_if_changed()
+        return self._versions[result]
+
+    def save(self, prompts: dict) -> int:
+        """
+        Writes new prompts to prompts.json and makes them current.
+
+        Returns:
+            int: The new registry version.
+        """
+        with self._lock:
+            save_data(self.relfile, prompts)
+            self._mtime = self._stat()
+            self._set(prompts)
+            return self.version
+
+    def stale_ids(self, emails: list, results: tuple = PROCESSING_RESULTS) -> list:
+        """Ids of the emails whose stored results don't match the current prompts."""
+        self._reload_if_changed()
+        versions = {result: self._versions[result] for result in results}
+        return [email["id"] for email in emails if is_stale(email, versions)]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """Returns the process-wide prompt registry, loading prompts.json on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry()
+        return _registry
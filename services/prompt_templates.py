@@ -0,0 +1,282 @@
+from langchain_core.prompts import PromptTemplate
+
+# Prompt templates used by services/llm_services.py.
+# They are compiled once at import time instead of on every call; the user's
+# own instructions from prompts.json are passed in as template variables.
+
+# Used by process_email. chat_history is either empty or a rendered conversation
+# ending in a newline, so first questions send exactly the same prompt as before.
+EMAIL_QUERY_PROMPT = PromptTemplate.from_template(
+    """{chat_history}{instruction_text} \n\n === EMAIL CONTENT === \n {email_body} ===NOTE===\n Do not add any preamble or explanation. Just give the asked output"""
+)
+
+# Used by categorize_email
+CATEGORIZATION_PROMPT = PromptTemplate.from_template(
+    """
+    ### INSTRUCTION:
+    Categorize the following email into one or more of the categories using the user instructions.
+    
+    ### USER INSTRUCTIONS:
+    {user_instructions}
+    
+    ### FORMAT (HIGHEST PRIORITY):
+    Return ONLY a comma-separated list of tags. Do not add any preamble or explanation.
+    Example: Important, To-Do
+    
+    ### EMAIL CONTENT:
+    {email_body}
+    
+    ### OUTPUT:
+    """
+)
+
+# Used by categorize_email in structured-output mode (JSON mode needs a JSON answer)
+STRUCTURED_CATEGORIZATION_PROMPT = PromptTemplate.from_template(
+    """
+    ### INSTRUCTION:
+    Categorize the following email into one or more of the categories using the user instructions.
+    
+    ### USER INSTRUCTIONS:
+    {user_instructions}
+    
+    ### FORMAT (HIGHEST PRIORITY):
+    Respond strictly in JSON format with the following structure, using only category names from the user instructions:
+    {{
+      "tags": ["Important", "To-Do"]
+    }}
+    
+    ### EMAIL CONTENT:
+    {email_body}
+    
+    ### JSON OUTPUT:
+    """
+)
+
+# Used by extract_action_items
+ACTION_EXTRACTION_PROMPT = PromptTemplate.from_template(
+    """
+    ### INSTRUCTION:
+    Extract actionable tasks and deadlines from the email using the user instructions.
+    
+    ### USER INSTRUCTIONS:
+    {user_instructions}
+    
+    ### FORMAT (HIGHEST PRIORITY):
+    Respond strictly in JSON format with the following structure:
+    {{
+      "task": "Description of the task",
+      "deadline": "Date/Time or 'None'"
+    }}
+    
+    If there are no clear tasks, return:
+    {{
+      "task": "None",
+      "deadline": "None"
+    }}
+    
+    ### EMAIL CONTENT:
+    {email_body}
+    
+    ### JSON OUTPUT:
+    """
+)
+
+# Used by categorize_and_extract
+FUSED_PROCESSING_PROMPT = PromptTemplate.from_template(
+    """
+    ### INSTRUCTION:
+    Categorize the following email into one or more of the categories and extract actionable tasks and deadlines from it, using the user instructions.
+    
+    ### CATEGORIZATION INSTRUCTIONS:
+    {categorization_instructions}
+    
+    ### ACTION EXTRACTION INSTRUCTIONS:
+    {action_instructions}
+    
+    ### FORMAT (HIGHEST PRIORITY):
+    Respond strictly in JSON format with the following structure:
+    {{
+      "tags": ["Important", "To-Do"],
+      "action_item": {{
+        "task": "Description of the task",
+        "deadline": "Date/Time or 'None'"
+      }}
+    }}
+    
+    If there are no clear tasks, use "None" for both "task" and "deadline".
+    
+    ### EMAIL CONTENT:
+    {email_body}
+    
+    ### JSON OUTPUT:
+    """
+)
+
+# Used by categorize_and_extract_packed
+PACKED_PROCESSING_PROMPT = PromptTemplate.from_template(
+    """
+    ### INSTRUCTION:
+    For EACH email below, categorize it into one or more of the categories and extract actionable tasks and deadlines from it, using the user instructions.
+    
+    ### CATEGORIZATION INSTRUCTIONS:
+    {categorization_instructions}
+    
+    ### ACTION EXTRACTION INSTRUCTIONS:
+    {action_instructions}
+    
+    ### FORMAT (HIGHEST PRIORITY):
+    Respond strictly with a single JSON object keyed by the email ID, with exactly one entry per email:
+    {{
+      "<EMAIL ID>": {{
+        "tags": ["Important", "To-Do"],
+        "action_item": {{
+          "task": "Description of the task",
+          "deadline": "Date/Time or 'None'"
+        }}
+      }}
+    }}
+    
+    If an email has no clear tasks, use "None" for both "task" and "deadline".
+    
+    ### EMAILS:
+    {emails_block}
+    
+    ### JSON OUTPUT:
+    """
+)
+
+# Used by generate_auto_reply
+AUTO_REPLY_PROMPT = PromptTemplate.from_template(
+    """
+    ### INSTRUCTION:
+    Draft a professional and context-aware reply to the following email.
+    
+    ### USER INSTRUCTIONS:
+    {user_instructions}
+    
+    ### FORMAT (HIGHEST PRIORITY):
+    Return ONLY the body of the reply as a raw string. 
+    Do NOT wrap it in JSON. 
+    Do NOT wrap it in quotes.
+    Do NOT add any preamble like "Here is the draft:".
+    Just start with the salutation (e.g., "Dear Name,").
+    
+    ### EMAIL CONTENT:
+    {email_body}
+    
+    ### DRAFT REPLY:
+    """
+)
+
+# Used by process_global_query
+GLOBAL_QUERY_PROMPT = PromptTemplate.from_template(
+    """You are an intelligent email assistant. You have access to the user's inbox.
+    
+    === INBOX CONTENT ===
+    {inbox_context}
+    
+    === CHAT HISTORY ===
+    {chat_history}
+    
+    === USER QUERY ===
+    {query}
+    
+    Answer the user's query based on the inbox content and chat history (ignore history if irrelevant). Be concise and helpful.
+    """
+)
+
+# Used by generate_draft
+DRAFT_PROMPT = PromptTemplate.from_template(
+    """You are an intelligent email assistant. Draft a professional email based on the following details:
+    Recipient Name (Optional): {recipient}
+    Recipient Email: {recipient_email}
+    Subject: {subject}
+    
+    ### Instructions/Context:
+    {prompt}
+    
+    ### Format (Highest Priority):
+    Return ONLY the body of the email in the raw string format. Do not include the subject line or any preamble.
+    
+    ### Output:
+    """
+)
+
+# Used by summarize_email (per-email digests for whole-inbox questions)
+DIGEST_PROMPT = PromptTemplate.from_template(
+    """
+    ### INSTRUCTION:
+    Summarize the following email in at most two short sentences.
+    Mention who it is from, what it is about, and any request or deadline.
+    
+    ### FORMAT (HIGHEST PRIORITY):
+    Return ONLY the summary as plain text. Do not add any preamble or explanation.
+    
+    ### EMAIL CONTENT:
+    {email_body}
+    
+    ### SUMMARY:
+    """
+)
+
+# Used by process_global_query to condense chunks of digests that don't fit the context budget
+DIGEST_REDUCE_PROMPT = PromptTemplate.from_template(
+    """
+    ### INSTRUCTION:
+    Below are short digests of several emails from the user's inbox.
+    Condense them into compact notes that keep everything relevant to the user's query:
+    email IDs, senders, requests, deadlines and read/unread status.
+    
+    ### USER QUERY:
+    {query}
+    
+    ### EMAIL DIGESTS:
+    {digests}
+    
+    ### FORMAT (HIGHEST PRIORITY):
+    Return ONLY the notes as a plain-text bullet list. Do not add any preamble or explanation.
+    
+    ### NOTES:
+    """
+)
+
+# Used by summarize_conversation to fold old chat messages into a rolling summary
+CONVERSATION_SUMMARY_PROMPT = PromptTemplate.from_template(
+    """
+    ### INSTRUCTION:
+    Update the running summary of a conversation between a user and their email assistant
+    with the new messages below. Keep names, dates, decisions, answers given and open
+    questions; drop greetings and repetition.
+    
+    ### FORMAT (HIGHEST PRIORITY):
+    Return ONLY the updated summary as plain text, at most {max_words} words. Do not add any preamble.
+    
+    ### CURRENT SUMMARY:
+    {summary}
+    
+    ### NEW MESSAGES:
+    {messages}
+    
+    ### UPDATED SUMMARY:
+    """
+)
+
+# Used to fix a structured answer that failed validation, without resending the email
+OUTPUT_REPAIR_PROMPT = PromptTemplate.from_template(
+    """
+    ### INSTRUCTION:
+    The text below was supposed to be a JSON object matching the schema, but it is invalid: {problem}
+    Rewrite it as a JSON object that matches the schema, keeping its information.
+    
+    ### FORMAT (HIGHEST PRIORITY):
+    Return ONLY the JSON object. Do not add any preamble or explanation.
+    
+    ### SCHEMA:
+    {schema}
+    
+    ### TEXT:
+    {output}
+    
+    ### JSON OUTPUT:
+    """
+)
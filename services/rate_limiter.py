@@ -0,0 +1,256 @@
+import heapq
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from services.llm_client import FAST_MODEL, SMART_MODEL
+
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+
+# Requests and tokens per minute for each model. The defaults are Groq's free-tier
+# quotas; set GROQ_RATE_LIMITS to your account's limits, e.g.
+# {"llama-3.1-8b-instant": {"rpm": 14400, "tpm": 250000}}. "*" applies to other models.
+DEFAULT_LIMITS = {
+    FAST_MODEL: {"rpm": 30, "tpm": 6000},
+    SMART_MODEL: {"rpm": 30, "tpm": 12000},
+    "*": {"rpm": 30, "tpm": 6000},
+}
+LIMITS = {**DEFAULT_LIMITS, **json.loads(os.getenv("GROQ_RATE_LIMITS", "{}"))}
+
+# Tokens reserved for the completion when a request is admitted; corrected from
+# the reported usage once the response is back
+COMPLETION_TOKEN_RESERVE = int(os.getenv("RATE_LIMIT_COMPLETION_TOKENS", "300"))
+
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1"))
+BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60"))
+
+# Lower values are served first when several calls are waiting for capacity
+INTERACTIVE = 0
+BULK = 1
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+_DURATION_PART = re.compile(r"([\d.]+)(ms|s|m|h)")
+
+
+class _Bucket:
+    """A token bucket refilling continuously at capacity per minute."""
+
+    def __init__(self, capacity: float):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, scale: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity * scale / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, scale: float) -> float:
+        """Seconds until `amount` is available (amounts above capacity only need a full bucket)."""
+        missing = min(amount, self.capacity) - self.level
+        return 0.0 if missing <= 0 else missing * 60.0 / (self.capacity * scale)
+
+
+class _ModelLimits:
+    """Request and token buckets for one model, plus its adaptive rate scale and pause."""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        # Fraction of the configured rate currently used; lowered on 429s, recovers on success
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self.waiting = []
+
+    def wait_time(self, tokens: float, now: float) -> float:
+        self.requests.refill(now, self.scale)
+        self.tokens.refill(now, self.scale)
+        return max(self.paused_until - now, self.requests.wait_time(1, self.scale), self.tokens.wait_time(tokens, self.scale))
+
+    def take(self, tokens: float) -> None:
+        self.requests.level -= 1
+        self.tokens.level -= min(tokens, self.tokens.capacity)
+
+
+class RateLimiter:
+    """
+    Shared scheduler that admits LLM requests at each model's RPM/TPM quota.
+
+    Callers block in acquire() until their model has capacity. Waiting calls
+    are served in priority order (INTERACTIVE before BULK, then first come),
+    so a chat reply isn't stuck behind a queue of bulk categorizations.
+    """
+
+    def __init__(self, limits: dict = None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.limits = limits or LIMITS
+        self.enabled = enabled
+        self._models = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+
+    def _model(self, model: str) -> _ModelLimits:
+        limits = self._models.get(model)
+        if limits is None:
+            config = self.limits.get(model) or self.limits["*"]
+            limits = self._models[model] = _ModelLimits(config["rpm"], config["tpm"])
+        return limits
+
+    def acquire(self, model: str, tokens: int, priority: int = BULK) -> float:
+        """
+        Blocks until a request of about `tokens` tokens may be sent to `model`.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        if not self.enabled:
+            return 0.0
+        started = time.monotonic()
+        with self._cond:
+            limits = self._model(model)
+            ticket = (priority, next(self._seq))
+            heapq.heappush(limits.waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if limits.waiting[0] == ticket:
+                        wait = limits.wait_time(tokens, now)
+                        if wait <= 0:
+                            limits.take(tokens)
+                            return now - started
+                    else:
+                        # Not our turn; woken up when the head of the queue changes
+                        wait = 1.0
+                    self._cond.wait(timeout=wait)
+            finally:
+                limits.waiting.remove(ticket)
+                heapq.heapify(limits.waiting)
+                self._cond.notify_all()
+
+    def settle(self, model: str, estimated: int, actual: int) -> None:
+        """Corrects the token bucket once a response reports its real usage."""
+        if not self.enabled:
+            return
+        with self._cond:
+            limits = self._model(model)
+            limits.tokens.level = min(limits.tokens.capacity, limits.tokens.level + estimated - actual)
+            # Additive recovery after a 429 slowed us down
+            limits.scale = min(1.0, limits.scale + 0.02)
+
+    def throttle(self, model: str, pause_seconds: float) -> None:
+        """
+        Reacts to a rate-limit response: pauses the model for everyone and lowers
+        its admitted rate, so the next requests land under the real quota.
+        """
+        with self._cond:
+            limits = self._model(model)
+            limits.paused_until = max(limits.paused_until, time.monotonic() + pause_seconds)
+            limits.scale = max(0.3, limits.scale * 0.8)
+            self._cond.notify_all()
+
+    def status(self) -> dict:
+        """Current bucket levels per model, for monitoring."""
+        with self._cond:
+            now = time.monotonic()
+            return {
+                model: {
+                    "requests_available": round(limits.requests.level, 2),
+                    "tokens_available": round(limits.tokens.level),
+                    "rate_scale": round(limits.scale, 3),
+                    "paused_for": round(max(0.0, limits.paused_until - now), 2),
+                    "waiting": len(limits.waiting),
+                }
+                for model, limits in self._models.items()
+            }
+
+
+def _status_code(error: BaseException):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _parse_duration(value: str):
+    """Parses '2', '1.5', '850ms', '7.66s' or '2m59.56s' into seconds (None if unparseable)."""
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    factors = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * factors[unit] for number, unit in parts)
+
+
+def retry_after_seconds(error: BaseException):
+    """
+    Reads how long the provider asked us to wait, from Retry-After or Groq's token reset header.
+
+    x-ratelimit-reset-requests is not used: on Groq it is the requests-per-day window,
+    which can be hours away and says nothing about when a minute limit clears.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name in ("retry-after", "x-ratelimit-reset-tokens"):
+        if headers.get(name):
+            seconds = _parse_duration(headers[name])
+            if seconds is not None:
+                return seconds
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, server errors and connection problems are retried; bad requests are not."""
+    status = _status_code(error)
+    if status is not None:
+        return status in _RETRYABLE_STATUS
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def backoff_delay(attempt: int, retry_after: float = None) -> float:
+    """
+    Exponential backoff with full jitter, never shorter than the provider's Retry-After
+    and never longer than BACKOFF_MAX_SECONDS, so one 429 can't stall interactive calls.
+    """
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    return min(max(delay, retry_after or 0.0), BACKOFF_MAX_SECONDS)
+
+
+def wait_before_retry(error: BaseException, model: str, attempt: int) -> bool:
+    """
+    Decides whether a failed request should be retried and, if so, waits.
+
+    On a 429 the whole model is paused through the shared limiter, so concurrent
+    callers back off together instead of each hitting the limit again.
+
+    Returns:
+        bool: True if the caller should retry.
+    """
+    if attempt >= MAX_RETRIES or not is_retryable(error):
+        return False
+    delay = backoff_delay(attempt, retry_after_seconds(error))
+    if _status_code(error) == 429:
+        get_rate_limiter().throttle(model, delay)
+    else:
+        time.sleep(delay)
+    return True
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Returns the process-wide limiter shared by all sessions and workers."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
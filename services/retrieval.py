@@ -0,0 +1,185 @@
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict
+
+
+# Very common words carry no signal for ranking and only bloat the postings
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "for", "from", "has", "have", "i",
+    "in", "is", "it", "me", "my", "of", "on", "or", "so", "that", "the", "this", "to", "was",
+    "we", "what", "which", "with", "you", "your", "any", "all", "about", "there",
+}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Metadata-only emails are indexed from records read this many at a time
+_LOAD_BATCH_SIZE = 500
+
+
+def tokenize(text: str) -> list:
+    """Lowercases text and splits it into searchable terms."""
+    return [tok for tok in _TOKEN_PATTERN.findall(text.lower()) if tok not in STOPWORDS and len(tok) > 1]
+
+
+def email_search_text(email: dict) -> str:
+    """Collects the fields we search over into one string."""
+    action_item = email.get("action_item")
+    task = action_item.get("task", "") if isinstance(action_item, dict) else ""
+    return " ".join([
+        str(email.get("subject", "")),
+        str(email.get("body", "")),
+        str(email.get("sender", "")),
+        str(email.get("name", "")),
+        " ".join(email.get("tags") or []),
+        str(task),
+    ])
+
+
+def _email_fingerprint(email: dict) -> int:
+    """
+    Cheap change detector for an email's searchable fields.
+    Python caches string hashes, so re-checking an unchanged inbox is fast.
+    """
+    return hash((
+        email.get("subject"), email.get("body"), email.get("sender"), email.get("name"),
+        tuple(email.get("tags") or ()), str(email.get("action_item")),
+    ))
+
+
+class BM25Index:
+    """
+    In-memory BM25 index over documents keyed by id.
+
+    Documents can be added, replaced and removed one at a time, so the index is
+    built once and then kept up to date incrementally as emails change.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)   # term -> {doc_id: term frequency}
+        self._doc_terms = {}                 # doc_id -> {term: term frequency}
+        self._doc_len = {}
+        self._total_len = 0
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_len
+
+    def upsert(self, doc_id, text: str) -> None:
+        """Adds a document, replacing any previous version with the same id."""
+        self.remove(doc_id)
+        counts = defaultdict(int)
+        for term in tokenize(text):
+            counts[term] += 1
+        for term, tf in counts.items():
+            self._postings[term][doc_id] = tf
+        self._doc_terms[doc_id] = dict(counts)
+        length = sum(counts.values())
+        self._doc_len[doc_id] = length
+        self._total_len += length
+
+    def remove(self, doc_id) -> None:
+        """Removes a document from the index (no-op if it isn't indexed)."""
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id)
+
+    def search(self, query: str, k: int = 10) -> list:
+        """
+        Returns up to k (doc_id, score) pairs, best match first.
+        Only documents sharing at least one term with the query are scored.
+        """
+        n_docs = len(self._doc_len)
+        if not n_docs:
+            return []
+        avg_len = self._total_len / n_docs or 1.0
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class InboxRetriever:
+    """
+    Keeps a BM25 index in sync with an inbox and ranks emails for a query.
+
+    sync() only re-indexes emails whose searchable fields changed since the last
+    call, so the index is built once and then maintained incrementally.
+    """
+
+    def __init__(self):
+        self.index = BM25Index()
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def sync(self, emails: list, load_records=None) -> None:
+        """
+        Brings the index up to date with the given list of emails.
+
+        Args:
+            load_records: Optional callable (ids) -> {str(id): full record}. Emails loaded
+                without their body (see data_manager.load_metadata) are then indexed from
+                their stored records, read a batch at a time, so the bodies are never all
+                in memory at once.
+        """
+        with self._lock:
+            seen = set()
+            pending = []
+            for email in emails:
+                email_id = email.get("id")
+                if email_id is None:
+                    continue
+                seen.add(email_id)
+                fingerprint = _email_fingerprint(email)
+                if self._fingerprints.get(email_id) != fingerprint:
+                    if load_records is not None and "body" not in email:
+                        pending.append((email, fingerprint))
+                        continue
+                    self.index.upsert(email_id, email_search_text(email))
+                    self._fingerprints[email_id] = fingerprint
+            for start in range(0, len(pending), _LOAD_BATCH_SIZE):
+                batch = pending[start:start + _LOAD_BATCH_SIZE]
+                stored = load_records([email["id"] for email, _ in batch])
+                for email, fingerprint in batch:
+                    self.index.upsert(email["id"], email_search_text({**stored.get(str(email["id"]), {}), **email}))
+                    self._fingerprints[email["id"]] = fingerprint
+            if len(seen) != len(self._fingerprints):
+                for email_id in set(self._fingerprints) - seen:
+                    self.index.remove(email_id)
+                    del self._fingerprints[email_id]
+
+    def search(self, query: str, k: int = 10) -> list:
+        """Returns the ids of the k most relevant emails, best first."""
+        with self._lock:
+            return [doc_id for doc_id, _ in self.index.search(query, k)]
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def get_inbox_retriever() -> InboxRetriever:
+    """Returns the process-wide retriever, creating it on first use."""
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            _retriever = InboxRetriever()
+        return _retriever
@@ -0,0 +1,83 @@
+import os
+import re
+
+from services.llm_client import FAST_MODEL, SMART_MODEL
+from services.telemetry import record_event
+from services.utils import estimate_tokens
+
+
+# Set to 0 to always use the large model for replies, drafts and Global Agent answers
+ROUTING_ENABLED = os.getenv("ROUTING_ENABLED", "1") == "1"
+
+# Anything above these sizes (estimated tokens) goes straight to the large model
+FAST_MAX_EMAIL_TOKENS = int(os.getenv("ROUTING_FAST_MAX_EMAIL_TOKENS", "500"))
+FAST_MAX_INSTRUCTION_TOKENS = int(os.getenv("ROUTING_FAST_MAX_INSTRUCTION_TOKENS", "200"))
+FAST_MAX_CONTEXT_TOKENS = int(os.getenv("ROUTING_FAST_MAX_CONTEXT_TOKENS", "3000"))
+
+# Emails carrying any of these tags always get the large model's reply
+ESCALATE_TAGS = {tag.strip().lower() for tag in os.getenv("ROUTING_ESCALATE_TAGS", "Important,To-Do").split(",") if tag.strip()}
+
+# Characters of a small-model stream held back to check its opening before showing it
+STREAM_CHECK_CHARS = 60
+
+_PREAMBLE = re.compile(r"^\s*(here('s| is| are)|sure\b|certainly\b|of course\b|below is|as an ai)", re.IGNORECASE)
+
+
+def route(operation: str, text: str = "", instructions: str = "", tags=None, whole_inbox: bool = False) -> str:
+    """
+    Picks the model for a writing request and logs the decision.
+
+    The small model handles short, routine requests; the large one is used when
+    the input is long, the email is tagged as important (see ROUTING_ESCALATE_TAGS),
+    the instructions are long, or the question spans the whole inbox.
+
+    Args:
+        operation: Name of the calling function, for the log.
+        text: The material the model works from (email, or Global Agent context).
+        instructions: The user's instructions or question.
+        tags: Tags of the email being answered, if any.
+        whole_inbox: True for Global Agent questions answered from every email.
+    """
+    if not ROUTING_ENABLED:
+        return SMART_MODEL
+
+    reasons = []
+    text_limit = FAST_MAX_CONTEXT_TOKENS if operation == "process_global_query" else FAST_MAX_EMAIL_TOKENS
+    if estimate_tokens(text) > text_limit:
+        reasons.append("long_input")
+    if estimate_tokens(instructions) > FAST_MAX_INSTRUCTION_TOKENS:
+        reasons.append("long_instructions")
+    if any(str(tag).strip().lower() in ESCALATE_TAGS for tag in tags or ()):
+        reasons.append("important_tag")
+    if whole_inbox:
+        reasons.append("whole_inbox")
+
+    model = SMART_MODEL if reasons else FAST_MODEL
+    record_event({"event": "route", "operation": operation, "model": model, "reasons": reasons})
+    return model
+
+
+def check_format(text: str) -> bool:
+    """
+    Cheap quality gate for small-model writing: the answer must be non-trivial plain
+    text, not an empty string, a preamble ("Here is the draft:"), JSON or a quoted block.
+    """
+    stripped = (text or "").strip()
+    if len(stripped) < 20:
+        return False
+    if stripped[0] in "{[\"'`":
+        return False
+    return not _PREAMBLE.match(stripped)
+
+
+def check_prefix(prefix: str) -> bool:
+    """check_format for the opening of a stream, before the rest has arrived."""
+    stripped = prefix.strip()
+    if not stripped:
+        return False
+    return stripped[0] not in "{[\"'`" and not _PREAMBLE.match(stripped)
+
+
+def record_escalation(operation: str, reason: str) -> None:
+    """Logs that a small-model answer was discarded and the request re-run on the large model."""
+    record_event({"event": "escalate", "operation": operation, "model": SMART_MODEL, "reasons": [reason]})
@@ -0,0 +1,165 @@
+import re
+from functools import lru_cache
+
+from services.utils import parse_json_output, parse_list_output
+
+
+# JSON schemas of the structured answers. They are shown to the model when an answer
+# has to be repaired, and the validate_* functions below enforce the same shapes.
+ACTION_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "task": {"type": "string", "description": "The task, or 'None'"},
+        "deadline": {"type": "string", "description": "Date/time, or 'None'"},
+    },
+    "required": ["task", "deadline"],
+}
+
+_DEFINED_CATEGORY = re.compile(r"^\s*[-*]\s*\*\*([^*]+?)\*\*\s*:", re.MULTILINE)
+_LISTED_CATEGORIES = re.compile(r"categor(?:y|ies)\s*:\s*([^\n.]+)", re.IGNORECASE)
+_NOT_ALNUM = re.compile(r"[^a-z0-9]")
+
+
+def tags_schema(allowed: tuple = ()) -> dict:
+    tag = {"type": "string", "enum": list(allowed)} if allowed else {"type": "string"}
+    return {"type": "object", "properties": {"tags": {"type": "array", "items": tag, "minItems": 1}}, "required": ["tags"]}
+
+
+def fused_schema(allowed: tuple = ()) -> dict:
+    return {
+        "type": "object",
+        "properties": {"tags": tags_schema(allowed)["properties"]["tags"], "action_item": ACTION_ITEM_SCHEMA},
+        "required": ["tags", "action_item"],
+    }
+
+
+@lru_cache(maxsize=32)
+def allowed_tags(categorization_instructions: str) -> tuple:
+    """
+    Reads the category names out of the user's categorization instructions (prompts.json).
+
+    Definitions written as '- **Name**: ...' take precedence; otherwise a list
+    following 'categories:' is used. Returns () if no categories can be found, in
+    which case tags are only cleaned up, not restricted.
+    """
+    text = categorization_instructions or ""
+    names = _DEFINED_CATEGORY.findall(text)
+    if not names:
+        match = _LISTED_CATEGORIES.search(text)
+        if match:
+            names = re.split(r",|\bor\b|\band\b", match.group(1))
+    seen, allowed = set(), []
+    for name in (name.strip() for name in names):
+        if name and _tag_key(name) not in seen:
+            seen.add(_tag_key(name))
+            allowed.append(name)
+    return tuple(allowed)
+
+
+def _tag_key(tag: str) -> str:
+    return _NOT_ALNUM.sub("", str(tag).lower())
+
+
+def normalize_tags(tags: list, allowed: tuple = ()) -> list:
+    """
+    Maps tags onto the allowed category names ('todo', 'TO-DO' and 'To Do' become
+    'To-Do', 'Newsletters' becomes 'Newsletter'), dropping unknown ones and duplicates.
+    """
+    keys = {_tag_key(name): name for name in allowed}
+    normalized = []
+    for tag in tags:
+        tag = str(tag).strip().strip("'\"")
+        if not tag:
+            continue
+        if keys:
+            key = _tag_key(tag)
+            tag = keys.get(key) or (keys.get(key[:-1]) if key.endswith("s") else None)
+            if tag is None:
+                continue
+        if tag not in normalized:
+            normalized.append(tag)
+    return normalized
+
+
+def check_tags(value, allowed: tuple = ()) -> tuple:
+    """
+    Validates a tag list (a CSV string is accepted too).
+
+    Returns:
+        tuple: (normalized tags, None) or (None, description of the problem).
+    """
+    if isinstance(value, str):
+        value = parse_list_output(value)
+    if not isinstance(value, list):
+        return None, "'tags' must be a list of strings"
+    tags = normalize_tags(value, allowed)
+    if not tags:
+        known = f" from: {', '.join(allowed)}" if allowed else ""
+        return None, f"'tags' must contain at least one category{known}"
+    return tags, None
+
+
+def check_action_item(value) -> tuple:
+    """
+    Validates a {'task', 'deadline'} object; missing or empty values become 'None'.
+
+    Returns:
+        tuple: (action item, None) or (None, description of the problem).
+    """
+    if not isinstance(value, dict) or "error" in value:
+        return None, "expected a JSON object with 'task' and 'deadline'"
+    if "task" not in value:
+        return None, "missing 'task'"
+    return {
+        "task": str(value.get("task") or "None").strip() or "None",
+        "deadline": str(value.get("deadline") or "None").strip() or "None",
+    }, None
+
+
+def validate_tags_output(content: str, allowed: tuple = ()) -> tuple:
+    """Validates a categorization answer: {"tags": [...]} in JSON mode, a CSV list otherwise."""
+    data = parse_json_output(content) if "{" in (content or "") else None
+    if isinstance(data, dict) and "tags" in data:
+        return check_tags(data["tags"], allowed)
+    return check_tags(content or "", allowed)
+
+
+def validate_action_output(content: str) -> tuple:
+    """Validates an action extraction answer."""
+    return check_action_item(parse_json_output(content))
+
+
+def validate_fused_result(data, allowed: tuple = ()) -> tuple:
+    """Validates one {'tags': [...], 'action_item': {...}} object."""
+    if not isinstance(data, dict) or "error" in data:
+        return None, "expected a JSON object with 'tags' and 'action_item'"
+    tags, problem = check_tags(data.get("tags"), allowed)
+    if problem:
+        return None, problem
+    action_item, problem = check_action_item(data.get("action_item"))
+    if problem:
+        return None, f"'action_item': {problem}"
+    return {"tags": tags, "action_item": action_item}, None
+
+
+def validate_fused_output(content: str, allowed: tuple = ()) -> tuple:
+    """Validates a combined categorization + action extraction answer."""
+    return validate_fused_result(parse_json_output(content), allowed)
+
+
+def validate_packed_output(content: str, expected_ids: list, allowed: tuple = ()) -> dict:
+    """
+    Validates a multi-email answer keyed by email id.
+
+    Only requested ids whose entry passes validate_fused_result are returned;
+    anything missing or malformed is left out so the caller can re-queue it.
+    """
+    data = parse_json_output(content)
+    if not isinstance(data, dict) or "error" in data:
+        return {}
+    results = {}
+    for email_id in expected_ids:
+        result, _ = validate_fused_result(data.get(str(email_id)), allowed)
+        if result is not None:
+            results[email_id] = result
+    return results
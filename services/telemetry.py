@@ -0,0 +1,374 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from services.data_manager import BASE_DIR
+from services.utils import estimate_tokens
+
+
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "1") == "1"
+
+# One JSON line per LLM call; rotated to <name>.1 once it grows past TELEMETRY_LOG_MAX_BYTES
+LOG_PATH = BASE_DIR / os.getenv("TELEMETRY_LOG_FILE", "llm_calls.jsonl")
+LOG_MAX_BYTES = int(os.getenv("TELEMETRY_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+# The log file is kept open and flushed at most every TELEMETRY_LOG_FLUSH_SECONDS (and at exit)
+LOG_FLUSH_SECONDS = float(os.getenv("TELEMETRY_LOG_FLUSH_SECONDS", "1"))
+
+# Prometheus text exposition, rewritten at most every TELEMETRY_PROM_INTERVAL seconds
+# (point node_exporter's textfile collector at it), and optionally served over HTTP
+PROM_PATH = BASE_DIR / os.getenv("TELEMETRY_PROM_FILE", "metrics.prom")
+PROM_INTERVAL_SECONDS = float(os.getenv("TELEMETRY_PROM_INTERVAL", "5"))
+PROM_PORT = int(os.getenv("TELEMETRY_PROMETHEUS_PORT", "0"))
+# Interface the /metrics server listens on; local only unless changed
+PROM_HOST = os.getenv("TELEMETRY_PROMETHEUS_HOST", "127.0.0.1")
+
+# Number of recent calls kept per (operation, model) for the rolling percentiles
+WINDOW_SIZE = int(os.getenv("TELEMETRY_WINDOW", "1000"))
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def usage_from_message(message) -> tuple:
+    """
+    Reads (prompt_tokens, completion_tokens) from a LangChain message or chunk,
+    or returns None if it carries no usage data.
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage")
+    if token_usage:
+        return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+    return None
+
+
+def parse_succeeded(value) -> bool:
+    """
+    Tells whether a parser produced a usable result: parse_json_output's
+    {"error": ...} fallback, None and empty results count as failures.
+    """
+    if value is None:
+        return False
+    if isinstance(value, dict):
+        return bool(value) and "error" not in value
+    if isinstance(value, (list, str)):
+        return bool(value)
+    return True
+
+
+class _Histogram:
+    """Cumulative Prometheus-style histogram plus a window of recent observations."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=WINDOW_SIZE)
+
+    def observe(self, value: float) -> None:
+        for ind, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[ind] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, q: float):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class Telemetry:
+    """
+    Aggregates LLM call records per (operation, model).
+
+    Keeps call/error/cache counters, token totals, parse outcomes and latency and
+    time-to-first-token histograms. Every record is also appended to a JSONL log,
+    and the aggregates are exported in the Prometheus text format.
+    """
+
+    def __init__(self, log_path=LOG_PATH, prom_path=PROM_PATH):
+        self.log_path = log_path
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        self._calls = defaultdict(lambda: {"ok": 0, "error": 0, "cached": 0})
+        self._tokens = defaultdict(lambda: {"prompt": 0, "completion": 0})
+        self._parse = defaultdict(lambda: {"ok": 0, "failed": 0})
+        self._retries = defaultdict(int)
+        self._latency = defaultdict(_Histogram)
+        self._ttft = defaultdict(_Histogram)
+        self._recent = deque(maxlen=200)
+        self._events = defaultdict(int)
+        self._prom_written_at = 0.0
+        # The log has its own lock, so file I/O doesn't hold up the aggregates
+        self._log_lock = threading.Lock()
+        self._log_file = None
+        self._log_size = 0
+        self._log_flushed_at = 0.0
+
+    def record(self, call: dict) -> None:
+        """Adds one finished call (see LLMCall.finish) to the aggregates and the log."""
+        key = (call["operation"], call["model"])
+        with self._lock:
+            outcome = "error" if call.get("error") else "cached" if call.get("cached") else "ok"
+            self._calls[key][outcome] += 1
+            self._retries[key] += call.get("retries", 0)
+            if call.get("parse") is not None:
+                self._parse[key][call["parse"]] += 1
+            if outcome == "ok":
+                self._tokens[key]["prompt"] += call["prompt_tokens"]
+                self._tokens[key]["completion"] += call["completion_tokens"]
+                self._latency[key].observe(call["seconds"])
+                if call.get("ttft") is not None:
+                    self._ttft[key].observe(call["ttft"])
+            self._recent.append(call)
+            write_prom = time.monotonic() - self._prom_written_at >= PROM_INTERVAL_SECONDS
+            if write_prom:
+                self._prom_written_at = time.monotonic()
+        self._append_log(call)
+        if write_prom:
+            self.write_prometheus()
+
+    def record_event(self, event: dict) -> None:
+        """
+        Logs a non-call event, such as a routing decision: {"event": ..., "operation": ..., "model": ...}.
+        Events are counted per (event, operation, model) and appended to the JSONL log.
+        """
+        event = {"ts": round(time.time(), 3), **event}
+        with self._lock:
+            self._events[(event["event"], event.get("operation", ""), event.get("model", ""))] += 1
+        self._append_log(event)
+
+    def events(self) -> list:
+        """Returns event counts as rows of (event, operation, model, count)."""
+        with self._lock:
+            return [
+                {"event": event, "operation": operation, "model": model, "count": count}
+                for (event, operation, model), count in sorted(self._events.items())
+            ]
+
+    def _append_log(self, call: dict) -> None:
+        line = json.dumps(call, ensure_ascii=False) + "\n"
+        with self._log_lock:
+            try:
+                if self._log_file is not None and self._log_size > LOG_MAX_BYTES:
+                    self._log_file.close()
+                    self._log_file = None
+                    os.replace(self.log_path, self.log_path.with_name(self.log_path.name + ".1"))
+                if self._log_file is None:
+                    self.log_path.parent.mkdir(parents=True, exist_ok=True)
+                    self._log_file = open(self.log_path, "a", encoding="utf-8")
+                    self._log_size = self._log_file.tell()
+                self._log_file.write(line)
+                self._log_size += len(line)
+                if time.monotonic() - self._log_flushed_at >= LOG_FLUSH_SECONDS:
+                    self._log_file.flush()
+                    self._log_flushed_at = time.monotonic()
+            except OSError:
+                # Telemetry must never break an LLM call
+                pass
+
+    def flush_log(self) -> None:
+        """Writes out buffered log lines (also done at exit)."""
+        with self._log_lock:
+            if self._log_file is not None:
+                try:
+                    self._log_file.flush()
+                except OSError:
+                    pass
+
+    def summary(self) -> list:
+        """
+        Returns one row per (operation, model): call counts, cache hits, errors,
+        parse failure rate, token totals and rolling p50/p95/p99 latency and TTFT.
+        """
+        with self._lock:
+            rows = []
+            for key in sorted(self._calls):
+                calls, tokens, parse = self._calls[key], self._tokens[key], self._parse[key]
+                latency, ttft = self._latency.get(key), self._ttft.get(key)
+                parsed = parse["ok"] + parse["failed"]
+                rows.append({
+                    "operation": key[0],
+                    "model": key[1],
+                    "calls": calls["ok"],
+                    "cached": calls["cached"],
+                    "errors": calls["error"],
+                    "retries": self._retries[key],
+                    "parse_failure_rate": round(parse["failed"] / parsed, 4) if parsed else None,
+                    "prompt_tokens": tokens["prompt"],
+                    "completion_tokens": tokens["completion"],
+                    "p50_s": latency.percentile(50) if latency else None,
+                    "p95_s": latency.percentile(95) if latency else None,
+                    "p99_s": latency.percentile(99) if latency else None,
+                    "ttft_p50_s": ttft.percentile(50) if ttft else None,
+                })
+            return rows
+
+    def recent(self, limit: int = 50) -> list:
+        """Returns the most recent call records, newest first."""
+        with self._lock:
+            return list(self._recent)[-limit:][::-1]
+
+    def prometheus_text(self) -> str:
+        """Renders the aggregates in the Prometheus text exposition format."""
+        def labels(key, **extra):
+            pairs = {"operation": key[0], "model": key[1], **extra}
+            return "{" + ",".join(f'{name}="{value}"' for name, value in pairs.items()) + "}"
+
+        lines = []
+        with self._lock:
+            lines += ["# HELP email_assistant_llm_calls_total LLM calls by outcome (ok, error, cached).",
+                      "# TYPE email_assistant_llm_calls_total counter"]
+            for key, calls in sorted(self._calls.items()):
+                for outcome, count in calls.items():
+                    lines.append(f"email_assistant_llm_calls_total{labels(key, outcome=outcome)} {count}")
+            lines += ["# HELP email_assistant_llm_retries_total Retried LLM requests.",
+                      "# TYPE email_assistant_llm_retries_total counter"]
+            for key, count in sorted(self._retries.items()):
+                lines.append(f"email_assistant_llm_retries_total{labels(key)} {count}")
+            lines += ["# HELP email_assistant_llm_tokens_total Tokens sent and received.",
+                      "# TYPE email_assistant_llm_tokens_total counter"]
+            for key, tokens in sorted(self._tokens.items()):
+                for kind, count in tokens.items():
+                    lines.append(f"email_assistant_llm_tokens_total{labels(key, kind=kind)} {count}")
+            lines += ["# HELP email_assistant_llm_parse_total Parse outcomes of structured LLM answers.",
+                      "# TYPE email_assistant_llm_parse_total counter"]
+            for key, parse in sorted(self._parse.items()):
+                for result, count in parse.items():
+                    lines.append(f"email_assistant_llm_parse_total{labels(key, result=result)} {count}")
+            lines += ["# HELP email_assistant_events_total Routing decisions, output repairs and other logged events.",
+                      "# TYPE email_assistant_events_total counter"]
+            for (event, operation, model), count in sorted(self._events.items()):
+                lines.append(f'email_assistant_events_total{{event="{event}",operation="{operation}",model="{model}"}} {count}')
+            for name, histograms, help_text in (
+                ("email_assistant_llm_latency_seconds", self._latency, "Wall time of uncached LLM calls."),
+                ("email_assistant_llm_ttft_seconds", self._ttft, "Time to first token of uncached LLM calls."),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for key, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{labels(key, le=bound)} {cumulative}")
+                    lines.append(f"{name}_sum{labels(key)} {histogram.total}")
+                    lines.append(f"{name}_count{labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self) -> None:
+        """Atomically rewrites the Prometheus text file."""
+        try:
+            self.prom_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.prom_path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp, self.prom_path)
+        except OSError:
+            pass
+
+
+class LLMCall:
+    """
+    Measures one LLM request: created just before it is sent, told when the
+    first token arrives (streaming) and which message carried the usage, then
+    finished with the text and the parse outcome.
+    """
+
+    def __init__(self, operation: str, model: str, prompt: str, streamed: bool = False):
+        self.operation = operation
+        self.model = model
+        self.prompt = prompt
+        self.streamed = streamed
+        self.retries = 0
+        self.usage = None
+        self.ttft = None
+        self._started = time.perf_counter()
+
+    def first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self._started
+
+    def observe_message(self, message) -> None:
+        """Picks up token usage from a response message or stream chunk, if it has any."""
+        usage = usage_from_message(message)
+        if usage is not None:
+            self.usage = usage
+
+    def finish(self, content: str = "", parse_ok: bool = None, error: BaseException = None, cached: bool = False) -> None:
+        seconds = time.perf_counter() - self._started
+        if self.usage is not None:
+            prompt_tokens, completion_tokens = self.usage
+        else:
+            prompt_tokens, completion_tokens = estimate_tokens(self.prompt), estimate_tokens(content or "")
+        record = {
+            "ts": round(time.time(), 3),
+            "operation": self.operation,
+            "model": self.model,
+            "streamed": self.streamed,
+            "cached": cached,
+            "seconds": round(seconds, 4),
+            # A non-streamed call delivers everything at once
+            "ttft": round(self.ttft if self.ttft is not None else seconds, 4),
+            "prompt_tokens": 0 if cached else prompt_tokens,
+            "completion_tokens": 0 if cached else completion_tokens,
+            "tokens_estimated": self.usage is None,
+            "retries": self.retries,
+            "parse": None if parse_ok is None else "ok" if parse_ok else "failed",
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+        }
+        if TELEMETRY_ENABLED:
+            get_telemetry().record(record)
+
+
+def record_event(event: dict) -> None:
+    """Logs an event through the process-wide telemetry (see Telemetry.record_event)."""
+    if TELEMETRY_ENABLED:
+        get_telemetry().record_event(event)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = get_telemetry().prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry() -> Telemetry:
+    """
+    Returns the process-wide telemetry aggregator, creating it on first use.
+    If TELEMETRY_PROMETHEUS_PORT is set, /metrics is also served on that port
+    (on TELEMETRY_PROMETHEUS_HOST, localhost by default).
+    """
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry()
+            atexit.register(_telemetry.flush_log)
+            if PROM_PORT:
+                try:
+                    server = ThreadingHTTPServer((PROM_HOST, PROM_PORT), _MetricsHandler)
+                    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+                except OSError:
+                    # Port taken, e.g. by another Streamlit process; the text file still works
+                    pass
+        return _telemetry
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import re
 from datetime import datetime
@@ -13,6 +14,14 @@ def parse_json_output(llm_response: str):
     if not llm_response:
         return {"error": "Empty response"}
 
+    # 0. Fast path: answers in JSON mode are a bare object, no cleanup needed
+    stripped = llm_response.strip()
+    if stripped.startswith("{") and stripped.endswith("}"):
+        try:
+            return json.loads(stripped)
+        except json.JSONDecodeError:
+            pass
+
     # 1. Try to find a code block first, as it's the most reliable indicator
     if "```json" in llm_response:
         pattern = r"```json(.*?)```"
@@ -69,6 +78,43 @@ def parse_list_output(llm_response: str) -> list:
     # 3. Split by comma and strip whitespace
     return [tag.strip() for tag in clean_text.split(",") if tag.strip()]
 
+def content_hash(text: str) -> str:
+    """
+    Returns a short, stable fingerprint of a piece of text.
+    Used to detect when derived data (like an email digest) has gone stale.
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token for English text).
+    Good enough for budgeting prompts without loading a tokenizer.
+    """
+    return len(text) // 4 + 1
+
+def pack_emails(emails: list, token_budget: int, max_per_pack: int) -> list:
+    """
+    Greedily groups emails into packs whose formatted text fits in token_budget.
+    
+    Emails keep their original order. An email that is larger than the budget on
+    its own still gets a pack of its own, so nothing is ever dropped.
+    
+    Returns:
+        list: A list of packs, each a list of email dicts.
+    """
+    packs = []
+    current, current_tokens = [], 0
+    for email in emails:
+        tokens = estimate_tokens(format_email(email))
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_per_pack):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(email)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
 def convert_to_relative_format(date_string, reference_date=None):
     """
     Converts a datetime string to a user-friendly relative format.
@@ -117,4 +163,11 @@ def validate_email(email: str) -> bool:
     Returns True if valid, False otherwise.
     """
     pattern = r"^[A-Za-z0-9\.\_]+[@][A-Za-z0-9\-]+[\.][A-Za-z]{2,}$"
-    return True if re.search(pattern, email) else False   
\ No newline at end of file
+    return True if re.search(pattern, email) else False
+
+def format_email(email: dict) -> str:
+    """
+    Formats email details into a readable string for the LLM.
+    Includes metadata like sender, timestamp, and the full body.
+    """
+    return f"Sender's_name : {email['name']}\nSender's email : {email['sender']}\nRecieved at : {email['timestamp']}\nSubject : {email['subject']}\nBody : {email['body']}"
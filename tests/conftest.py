@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The services read their settings at import time, so the data directory must point at a
+# scratch one before any test imports them; the real inbox is never touched
+os.environ["EMAIL_ASSISTANT_DATA_DIR"] = tempfile.mkdtemp(prefix="email-assistant-tests-")
+os.environ["LLM_CACHE_ENABLED"] = "0"
+os.environ["LOCAL_CLASSIFIER_ENABLED"] = "0"
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
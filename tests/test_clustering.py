@@ -0,0 +1,31 @@
+from services.clustering import cluster_emails, normalize_subject, simhash
+
+BODY = " ".join(f"word{ind}" for ind in range(40))
+
+
+def email(ind: int, subject: str, sender: str, body: str = BODY, timestamp: str = "2024-01-01 10:00:00", **fields):
+    return dict(id=str(ind), subject=subject, sender=sender, body=body, timestamp=timestamp, **fields)
+
+
+def test_normalize_subject():
+    assert normalize_subject("RE: Fwd: Q3  Plan") == "q3 plan"
+    assert normalize_subject("AW[2]: re: Budget") == "budget"
+
+
+def test_simhash_ignores_numbers_and_quotes_but_needs_enough_words():
+    assert simhash(BODY) == simhash(BODY + "\n> quoted reply text")
+    assert simhash("Invoice 1042 due 2024-03-01 " + BODY) == simhash("Invoice 7 due 2025-12-31 " + BODY)
+    assert simhash("too short") is None
+
+
+def test_threads_and_near_duplicates_cluster_to_the_newest_email():
+    emails = [
+        email(0, "Q3 plan", "ann@corp.com", body="first", timestamp="2024-01-01 09:00:00"),
+        email(1, "RE: Q3 plan", "ann@corp.com", body="second", timestamp="2024-01-02 09:00:00"),
+        email(2, "Alert", "noreply@bank.com"),
+        email(3, "Alert", "alerts@bank.com", timestamp="2024-01-03 09:00:00"),
+        email(4, "Alert", "alerts@bank.co"),
+        email(5, "Alert", "alerts@bank.com", cluster_exempt=True),
+    ]
+    # Different sender domains and exempt emails stay on their own
+    assert cluster_emails(emails) == {0: 1, 2: 3}
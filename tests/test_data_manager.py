@@ -0,0 +1,62 @@
+import io
+import json
+
+import pytest
+
+from services.data_manager import BASE_DIR, _iter_json_array, import_json, load_ids, save_data
+
+
+def parse(text: str, chunk_size: int = 1 << 16) -> list:
+    return list(_iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1 << 16])
+def test_parses_values_split_across_chunks(chunk_size):
+    text = '[1, 23, 456, 1.5e3, -0.25, "a,b]", {"k": [1, 2]}, true, null]'
+    assert parse(text, chunk_size) == json.loads(text)
+
+
+def test_empty_array_and_empty_file():
+    assert parse("  [ ]  ") == []
+    assert parse("") == []
+
+
+@pytest.mark.parametrize("text", ['{"id": 1}', "1", '"[1]"'])
+def test_rejects_non_array(text):
+    with pytest.raises(ValueError):
+        parse(text)
+
+
+@pytest.mark.parametrize("text", ["[", '[{"id": 1},', '[{"id": 1}', '[{"id": 1', "[1, 2"])
+def test_rejects_truncated_array(text):
+    with pytest.raises(ValueError):
+        parse(text, chunk_size=2)
+
+
+@pytest.mark.parametrize("text", ["[1 2]", "[1,, 2]", "[1, ]"])
+def test_rejects_malformed_array(text):
+    with pytest.raises(ValueError):
+        parse(text)
+
+
+def test_import_json_replaces_collection(tmp_path):
+    source = tmp_path / "inbox.json"
+    source.write_text(json.dumps([{"id": "a"}, "not a record", {"id": "b"}]), encoding="utf-8")
+    assert import_json("mock_inbox.json", source) == 2
+    assert load_ids("mock_inbox.json") == ["a", "b"]
+
+
+def test_import_json_rolls_back_invalid_file(tmp_path):
+    save_data("mock_inbox.json", [{"id": "kept"}])
+    source = tmp_path / "truncated.json"
+    source.write_text('[{"id": "a"}, {"id": "b"}', encoding="utf-8")
+    with pytest.raises(ValueError):
+        import_json("mock_inbox.json", source)
+    assert load_ids("mock_inbox.json") == ["kept"]
+
+
+def test_import_json_missing_path_raises():
+    save_data("mock_inbox.json", [{"id": "kept"}])
+    with pytest.raises(FileNotFoundError):
+        import_json("mock_inbox.json", BASE_DIR / "does_not_exist.json")
+    assert load_ids("mock_inbox.json") == ["kept"]
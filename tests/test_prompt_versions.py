@@ -0,0 +1,54 @@
+from services.jobs import _stamp
+from services.prompt_registry import PromptRegistry, is_stale, result_version, result_versions
+
+PROMPTS = {"categorization": "Tag it", "action_extraction": "List tasks", "auto_reply": "Be brief"}
+
+
+def test_result_version_only_depends_on_its_own_prompt():
+    edited = dict(PROMPTS, auto_reply="Be formal")
+    assert result_versions(edited) == result_versions(PROMPTS)
+    assert result_version("reply", edited) != result_version("reply", PROMPTS)
+
+
+def test_is_stale():
+    versions = result_versions(PROMPTS)
+    assert is_stale({"id": "a"}, versions)
+    assert not is_stale({"id": "a", "prompt_versions": dict(versions)}, versions)
+    assert is_stale({"id": "a", "prompt_versions": {"tags": versions["tags"]}}, versions)
+    edited = result_versions(dict(PROMPTS, categorization="Tag it differently"))
+    assert is_stale({"id": "a", "prompt_versions": dict(versions)}, edited)
+
+
+def test_registry_stale_ids_follow_saved_prompts():
+    registry = PromptRegistry("test_prompts.json")
+    registry.save(PROMPTS)
+    current = {"id": "current", "prompt_versions": result_versions(PROMPTS)}
+    emails = [current, {"id": "never"}]
+    assert registry.stale_ids(emails) == ["never"]
+
+    version = registry.current_version()
+    assert registry.save(dict(PROMPTS, action_extraction="List deadlines")) == version + 1
+    assert registry.stale_ids(emails) == ["current", "never"]
+    # Only the results that use the edited prompt are considered
+    assert registry.stale_ids(emails, ("tags",)) == ["never"]
+
+
+def test_stamp_records_successful_results():
+    versions = result_versions(PROMPTS)
+    result = {"tags": ["Work"], "action_item": '{"tasks": []}'}
+    assert _stamp(result, versions) == versions
+
+
+def test_stamp_leaves_failed_parts_stale():
+    versions = result_versions(PROMPTS)
+    assert _stamp({"tags": [], "action_item": '{"tasks": []}'}, versions) == {"action_item": versions["action_item"]}
+    assert _stamp({"tags": ["Work"], "action_item": '{"error": "timeout"}'}, versions) == {"tags": versions["tags"]}
+    # Cluster members get their own action extraction; without one they must be picked up again
+    assert _stamp({"tags": ["Work"], "tag_source": "cluster"}, versions) == {"tags": versions["tags"]}
+
+
+def test_stamp_local_tags_use_the_classifier_version():
+    versions = result_versions(PROMPTS)
+    result = {"tags": ["Work"], "action_item": '{"tasks": []}', "tag_source": "local"}
+    assert _stamp(dict(result, tags_version=versions["tags"]), versions) == versions
+    assert "tags" not in _stamp(dict(result, tags_version="outdated"), versions)
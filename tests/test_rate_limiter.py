@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import rate_limiter
+from services.rate_limiter import RateLimiter, _Bucket, _ModelLimits, backoff_delay, retry_after_seconds
+
+
+def http_error(status: int, headers: dict):
+    return SimpleNamespace(status_code=status, response=SimpleNamespace(status_code=status, headers=headers))
+
+
+def test_bucket_refills_at_capacity_per_minute():
+    bucket = _Bucket(60)
+    bucket.level, bucket.updated = 0.0, 100.0
+    bucket.refill(110.0, 1.0)
+    assert bucket.level == pytest.approx(10)
+    bucket.refill(1000.0, 1.0)
+    assert bucket.level == 60
+
+
+def test_bucket_wait_time():
+    bucket = _Bucket(60)
+    bucket.level = 0.0
+    assert bucket.wait_time(30, 1.0) == pytest.approx(30)
+    # A lowered rate scale stretches the wait
+    assert bucket.wait_time(30, 0.5) == pytest.approx(60)
+    # Requests larger than the bucket only wait for a full bucket
+    assert bucket.wait_time(600, 1.0) == pytest.approx(60)
+
+
+def test_model_waits_for_the_tighter_quota():
+    limits = _ModelLimits(rpm=2, tpm=1000)
+    now = limits.requests.updated
+    for _ in range(2):
+        assert limits.wait_time(100, now) == 0
+        limits.take(100)
+    assert limits.wait_time(100, now) == pytest.approx(30)
+    limits.tokens.level = 0.0
+    assert limits.wait_time(500, now) == pytest.approx(30)
+    assert limits.wait_time(1000, now) == pytest.approx(60)
+
+
+def test_limiter_admits_within_quota_and_throttles():
+    limiter = RateLimiter({"*": {"rpm": 2, "tpm": 1000}}, enabled=True)
+    assert limiter.acquire("model", 100) < 0.5
+    assert limiter.acquire("model", 100) < 0.5
+    limiter.settle("model", estimated=100, actual=40)
+    status = limiter.status()["model"]
+    assert status["requests_available"] < 0.1
+    assert status["tokens_available"] == 860
+
+    limiter.throttle("model", 5)
+    status = limiter.status()["model"]
+    assert 4 < status["paused_for"] <= 5
+    assert status["rate_scale"] == 0.8
+
+
+def test_disabled_limiter_never_waits():
+    limiter = RateLimiter({"*": {"rpm": 1, "tpm": 1}}, enabled=False)
+    assert [limiter.acquire("model", 1000) for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(http_error(429, {"retry-after": "2"})) == 2
+    assert retry_after_seconds(http_error(429, {"x-ratelimit-reset-tokens": "7.66s"})) == pytest.approx(7.66)
+    assert retry_after_seconds(http_error(429, {"x-ratelimit-reset-tokens": "850ms"})) == pytest.approx(0.85)
+    assert retry_after_seconds(http_error(500, {})) is None
+
+
+def test_retry_after_ignores_the_daily_request_reset():
+    assert retry_after_seconds(http_error(429, {"x-ratelimit-reset-requests": "2h59m56s"})) is None
+
+
+def test_backoff_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "BACKOFF_MAX_SECONDS", 60.0)
+    assert all(0 <= backoff_delay(attempt) <= 60 for attempt in range(12))
+    assert backoff_delay(0, retry_after=3) >= 3
+    assert backoff_delay(0, retry_after=3 * 3600) == 60